@@ -4,67 +4,61 @@ TrustChekr Detection Engine - Batch Accuracy Test
 Runs downloaded datasets against all regex rules and reports accuracy metrics.
 """
 
-import json, re, os, glob, sys, time
+import sys, time, argparse, itertools
 from pathlib import Path
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 
 import pandas as pd
 import numpy as np
 
+from prefilter import RulePrefilter
+from rule_index import load_rule_index, compiled_patterns, failed_rules
+from result_cache import HitCache, block_key
+from rule_profile import profile_rules, performance_section
+from dataset_cache import open_dataset, table_frame, available as arrow_available
+from url_hosts import HostIndex, normalize_host
+from brand_index import BrandComparison, VARIANTS as BRAND_VARIANTS
+from scoring import (trust_scores, score_histogram, threshold_counts, tier_counts, tier_threshold, curves,
+                     write_curves, TIERS, DEFAULT_TIER, SWEEP)
+from hit_export import csr_block, HitMatrixWriter, export_sizes
+from rule_overlap import intersections, analyze as analyze_overlap, overlap_section, time_rules, TIMING_ROWS
+from near_dup import deduplicate, weighted_counts, dedup_section, JACCARD as DEDUP_JACCARD
+from sampling import stratified_sample, stratum_counts, sampling_section, SEED as SAMPLE_SEED, SMOKE_ROWS
+from rule_routing import RegionRouter, route_counts, routing_section, time_routing, dataset_channel
+from script_match import (ScriptMatcher, load_scripts, script_counts, script_section, time_scripts, threads_of,
+                          evaluate_conversations, conversation_files, load_conversations)
+from text_normalize import (normalize_texts, empty_stats as empty_normalize_stats, check as check_normalization,
+                            normalization_section, CHECK_ROWS as NORMALIZE_CHECK_ROWS,
+                            VERSION as NORMALIZE_VERSION, MAX_CHARS as NORMALIZE_MAX_CHARS)
+
 ROOT = Path(__file__).resolve().parents[2]  # trustchekr-app/
 RULES_DIR = ROOT / "src" / "lib" / "ai-detection" / "rules"
 DOWNLOADS = ROOT / "test-data" / "downloads"
 OUTPUT = ROOT / "test-data" / "BATCH-TEST-RESULTS.md"
 MAX_ROWS = 50000
+SHARD_ROWS = 5000
+PROFILE_ROWS = 5000
 
 # ─── Load Rules ──────────────────────────────────────────────────────────────
 
-def load_text_patterns():
-    """Load all text-matching patterns from rule JSON files."""
-    patterns = []
-    for jf in glob.glob(str(RULES_DIR / "**" / "*.json"), recursive=True):
-        with open(jf) as f:
-            data = json.load(f)
-        if "patterns" in data:
-            for p in data["patterns"]:
-                try:
-                    compiled = re.compile(p["pattern"], re.IGNORECASE)
-                    patterns.append({
-                        "regex": compiled,
-                        "category": p.get("category", "UNKNOWN"),
-                        "weight": p.get("weight", 1),
-                        "id": p.get("id", ""),
-                        "source": os.path.relpath(jf, ROOT),
-                    })
-                except re.error:
-                    pass
-    return patterns
-
-def load_domain_patterns():
-    """Load domain patterns from domains.json files."""
-    patterns = []
-    for jf in glob.glob(str(RULES_DIR / "**" / "domains.json"), recursive=True):
-        with open(jf) as f:
-            data = json.load(f)
-        for d in data.get("domains", []):
-            try:
-                compiled = re.compile(d["pattern"], re.IGNORECASE)
-                patterns.append({
-                    "regex": compiled,
-                    "category": d.get("category", "UNKNOWN"),
-                    "id": d.get("id", ""),
-                    "source": os.path.relpath(jf, ROOT),
-                })
-            except re.error:
-                pass
-    return patterns
+def load_text_patterns(index=None):
+    """Load all text-matching patterns from rule JSON files (via the cached rule index, or the one given)."""
+    return compiled_patterns(index or load_rule_index(RULES_DIR), "text")
+
+def load_domain_patterns(index=None):
+    """Load domain patterns from domains.json files (via the cached rule index, or the one given)."""
+    return compiled_patterns(index or load_rule_index(RULES_DIR), "domain")
 
 # ─── Detection ───────────────────────────────────────────────────────────────
 
-def detect_text(text, patterns):
-    """Returns list of matched pattern categories, or empty if no match."""
+def detect_text(text, patterns, prefilter=None):
+    """Returns list of matched pattern categories, or empty if no match.
+    With a RulePrefilter, only rules whose literal anchors occur in text are run."""
     if not isinstance(text, str) or not text.strip():
         return []
+    if prefilter is not None:
+        return prefilter.match(text)[0]
     matches = []
     for p in patterns:
         if p["regex"].search(text):
@@ -94,196 +88,977 @@ def compute_metrics(tp, fp, fn, tn):
 
 # ─── Dataset Loaders ─────────────────────────────────────────────────────────
 
-def sample_df(df):
-    if len(df) > MAX_ROWS:
-        df = df.sample(n=MAX_ROWS, random_state=42)
+def sample_df(df, max_rows=MAX_ROWS):
+    if max_rows and len(df) > max_rows:
+        df = df.sample(n=max_rows, random_state=42)
     return df.reset_index(drop=True)
 
-def load_smishing():
+def smishing_labels(df):
+    # label=1 if either spam or smishing
+    return ((df["spam label"] == 1) | (df["smishing label"] == 1)).astype(int)
+
+def kaggle_email_columns(columns):
+    """Determine text and label columns of a Kaggle email CSV."""
+    text_col = label_col = None
+    for c in columns:
+        cl = c.lower()
+        if cl in ("body", "text_combined", "email text", "text", "content", "message"):
+            text_col = c
+        if cl in ("label", "email type", "class"):
+            label_col = c
+    return text_col, label_col
+
+def kaggle_email_labels(labels):
+    """Normalize label to 1=scam, 0=legit"""
+    if labels.dtype == object:
+        return labels.str.lower().map(lambda x: 1 if x in ("spam", "phishing", "1", "scam") else 0)
+    return (labels >= 1).astype(int)
+
+def zenodo_text_col(columns):
+    if "label" not in columns:
+        return None
+    for c in ("body", "text_combined"):
+        if c in columns:
+            return c
+    return None
+
+def canonical_frame(texts, labels, path, name):
+    """
+    A text dataset reduced to the columns every loader shares (and the Arrow
+    cache stores): text (str or None), is_scam (0/1), source and dataset.
+    """
+    texts = texts.where(texts.map(lambda t: isinstance(t, str)), None)
+    return pd.DataFrame({"text": texts.to_numpy(dtype=object), "is_scam": np.asarray(labels, dtype=np.int8),
+                         "source": str(Path(path).relative_to(DOWNLOADS)), "dataset": name})
+
+def read_canonical(path, name, text_col, labels_fn, chunk_rows=None, **read_kwargs):
+    """
+    A dataset CSV as a canonical frame, or with chunk_rows, a generator of
+    canonical frames of at most chunk_rows rows each (bounded memory).
+    """
+    def frame(df):
+        return canonical_frame(df[text_col], labels_fn(df), path, name)
+    if chunk_rows is None:
+        return frame(pd.read_csv(path, **read_kwargs))
+    return (frame(c.reset_index(drop=True)) for c in pd.read_csv(path, chunksize=chunk_rows, **read_kwargs))
+
+# what a missing, truncated or malformed CSV raises (EmptyDataError is a ValueError)
+READ_ERRORS = (OSError, UnicodeDecodeError, pd.errors.ParserError, ValueError)
+
+class UnreadableSource(Exception):
+    """A dataset's CSV could not be read; load_sources skips it with a warning."""
+
+def guarded_read(read):
+    """
+    A source's read() whose READ_ERRORS, and only those, are raised as
+    UnreadableSource, including the ones a chunk generator raises while it
+    is consumed. Errors of the stages consuming the frames pass through.
+    """
+    def chunks(frames):
+        try:
+            yield from frames
+        except READ_ERRORS as e:
+            raise UnreadableSource(e) from e
+
+    def wrapped(chunk_rows=None):
+        try:
+            frames = read(chunk_rows)
+        except READ_ERRORS as e:
+            raise UnreadableSource(e) from e
+        return frames if chunk_rows is None else chunks(frames)
+    return wrapped
+
+def sample_positions(n, max_rows=MAX_ROWS):
+    """Row positions sample_df keeps from an n-row frame, or None for all of them."""
+    if max_rows and n > max_rows:
+        return pd.RangeIndex(n).to_series().sample(n=max_rows, random_state=42).to_numpy()
+    return None
+
+def smishing_sources():
     """Smishing Dataset: message, spam label, smishing label"""
     p = DOWNLOADS / "Smishing_Dataset" / "Combined-Labeled-Dataset.csv"
-    df = pd.read_csv(p)
-    df = sample_df(df)
-    # label=1 if either spam or smishing
-    df["is_scam"] = ((df["spam label"] == 1) | (df["smishing label"] == 1)).astype(int)
-    return [{"name": "Smishing_Dataset", "df": df, "text_col": "message", "label_col": "is_scam"}]
 
-def load_kaggle_email():
+    def read(chunk_rows=None):
+        return read_canonical(p, "Smishing_Dataset", "message", smishing_labels, chunk_rows)
+    return [("Smishing_Dataset", p, read)]
+
+def kaggle_email_sources():
     """Kaggle phishing email datasets - multiple CSVs with body+label or text_combined+label."""
+    sources = []
+    for csv in sorted((DOWNLOADS / "kaggle_phishing_email").glob("*.csv")):
+        try:
+            text_col, label_col = kaggle_email_columns(csv_header(csv, on_bad_lines='skip'))
+        except READ_ERRORS as e:
+            print(f"  ⚠️ kaggle_email/{csv.name}: skipped, header unreadable ({e})")
+            continue
+        if text_col and label_col:
+            name = f"kaggle_email/{csv.name}"
+
+            def read(chunk_rows=None, csv=csv, text_col=text_col, label_col=label_col, name=name):
+                return read_canonical(csv, name, text_col, lambda df: kaggle_email_labels(df[label_col]), chunk_rows,
+                                      on_bad_lines='skip')
+            sources.append((name, csv, read))
+    return sources
+
+def zenodo_sources():
+    """Zenodo phishing datasets - subject,body,label format."""
+    sources = []
+    for csv in sorted((DOWNLOADS / "zenodo_phishing").glob("*.csv")):
+        try:
+            text_col = zenodo_text_col(csv_header(csv, on_bad_lines='skip'))
+        except READ_ERRORS as e:
+            print(f"  ⚠️ zenodo/{csv.name}: skipped, header unreadable ({e})")
+            continue
+        if text_col:
+            name = f"zenodo/{csv.name}"
+
+            def read(chunk_rows=None, csv=csv, text_col=text_col, name=name):
+                return read_canonical(csv, name, text_col, lambda df: (df["label"] >= 1).astype(int), chunk_rows,
+                                      on_bad_lines='skip')
+            sources.append((name, csv, read))
+    return sources
+
+def text_sources():
+    """
+    (name, path, read) for every text dataset; read() parses its CSV into a
+    canonical frame, read(chunk_rows) into a generator of them.
+    """
+    return smishing_sources() + kaggle_email_sources() + zenodo_sources()
+
+def load_sources(sources, max_rows=MAX_ROWS, arrow=False, dedup=None, stratified=None):
+    """
+    Dataset dicts for text sources, sampled to max_rows. With arrow, frames come
+    from the memory-mapped dataset cache and only the sampled rows of the text
+    and label columns are materialized. With a dedup threshold, near-duplicate
+    clusters are formed first (see near_dup.py) and representatives are sampled.
+    With a stratified seed, rows are drawn by stratified reservoir sampling
+    (see sampling.py) in one chunked pass instead of sample_df. A dataset
+    whose CSV cannot be read is skipped with a warning; errors of the cache,
+    dedup and sampling stages are raised.
+    """
+    results = []
+    for name, path, read in sources:
+        stats = sampling = None
+        read = guarded_read(read)
+        try:
+            if dedup is not None or stratified is not None:
+                if arrow:
+                    table = open_dataset(path, name, read)
+                    frames = (table_frame(table.slice(i, CHUNK_ROWS)) for i in range(0, table.num_rows, CHUNK_ROWS))
+                else:
+                    frames = read(CHUNK_ROWS)
+                if dedup is not None:
+                    df, stats = deduplicate(frames, "text", "is_scam", dedup)
+                    frames = [df]
+                if stratified is not None:
+                    df, sampling = stratified_sample(frames, "text", "is_scam", max_rows, stratified)
+                else:
+                    df = sample_df(df, max_rows)
+            elif arrow:
+                table = open_dataset(path, name, read)
+                df = table_frame(table, rows=sample_positions(table.num_rows, max_rows)).reset_index(drop=True)
+            else:
+                df = sample_df(read(), max_rows)
+        except UnreadableSource as e:
+            print(f"  ⚠️ {name}: skipped, could not be read ({e})")
+            continue
+        results.append({"name": name, "path": path, "df": df, "text_col": "text", "label_col": "is_scam",
+                        "dedup": stats, "sampling": sampling})
+    return results
+
+def load_smishing(max_rows=MAX_ROWS, arrow=False, dedup=None, stratified=None):
+    return load_sources(smishing_sources(), max_rows, arrow, dedup, stratified)
+
+def load_kaggle_email(max_rows=MAX_ROWS, arrow=False, dedup=None, stratified=None):
+    return load_sources(kaggle_email_sources(), max_rows, arrow, dedup, stratified)
+
+def load_zenodo(max_rows=MAX_ROWS, arrow=False, dedup=None, stratified=None):
+    return load_sources(zenodo_sources(), max_rows, arrow, dedup, stratified)
+
+def load_url_dataset(max_rows=MAX_ROWS):
+    """Kaggle phishing URL dataset: URL, Domain, label"""
+    p = DOWNLOADS / "kaggle_phishing_url" / "phishing_simple (1).csv"
+    if not p.exists():
+        return []
+    df = pd.read_csv(p)
+    df = sample_df(df, max_rows)
+    return [{"name": "kaggle_phishing_url", "path": p, "df": df, "url_col": "URL", "domain_col": "Domain",
+             "label_col": "label", "label_map": {"phishing": 1, "benign": 0}}]
+
+# ─── Streaming Loaders ───────────────────────────────────────────────────────
+# Same datasets as above, but each dataset carries a "chunks" generator instead
+# of a "df": only usecols are parsed and at most chunk_rows rows are held at
+# once. max_rows (None = everything) keeps the first rows rather than sampling.
+
+CHUNK_ROWS = 20000
+
+def iter_csv_chunks(path, usecols, label_fn=None, chunk_rows=CHUNK_ROWS, max_rows=None, **read_kwargs):
+    """Yield DataFrame chunks, with an is_scam column added by label_fn if given."""
+    seen = 0
+    for chunk in pd.read_csv(path, usecols=usecols, chunksize=chunk_rows, **read_kwargs):
+        if max_rows:
+            if seen >= max_rows:
+                break
+            chunk = chunk.iloc[:max_rows - seen]
+        seen += len(chunk)
+        chunk = chunk.reset_index(drop=True)
+        if label_fn is not None:
+            chunk["is_scam"] = label_fn(chunk)
+        yield chunk
+
+def csv_header(path, **read_kwargs):
+    return list(pd.read_csv(path, nrows=0, **read_kwargs).columns)
+
+def stream_smishing(chunk_rows=CHUNK_ROWS, max_rows=None):
+    p = DOWNLOADS / "Smishing_Dataset" / "Combined-Labeled-Dataset.csv"
+    chunks = iter_csv_chunks(p, ["message", "spam label", "smishing label"], smishing_labels,
+                             chunk_rows, max_rows)
+    return [{"name": "Smishing_Dataset", "path": p, "chunks": chunks, "text_col": "message", "label_col": "is_scam"}]
+
+def stream_kaggle_email(chunk_rows=CHUNK_ROWS, max_rows=None):
     results = []
     folder = DOWNLOADS / "kaggle_phishing_email"
     for csv in sorted(folder.glob("*.csv")):
         try:
-            df = pd.read_csv(csv, on_bad_lines='skip')
+            text_col, label_col = kaggle_email_columns(csv_header(csv))
         except Exception:
             continue
-        df = sample_df(df)
-        # Determine text and label columns
-        cols = [c.lower() for c in df.columns]
-        text_col = label_col = None
-        for c in df.columns:
-            cl = c.lower()
-            if cl in ("body", "text_combined", "email text", "text", "content", "message"):
-                text_col = c
-            if cl in ("label", "email type", "class"):
-                label_col = c
         if text_col and label_col:
-            # Normalize label to 1=scam, 0=legit
-            labels = df[label_col]
-            if labels.dtype == object:
-                df["is_scam"] = labels.str.lower().map(lambda x: 1 if x in ("spam", "phishing", "1", "scam") else 0)
-            else:
-                df["is_scam"] = (labels >= 1).astype(int)
-            results.append({"name": f"kaggle_email/{csv.name}", "df": df, "text_col": text_col, "label_col": "is_scam"})
+            chunks = iter_csv_chunks(csv, [text_col, label_col], lambda c, lc=label_col: kaggle_email_labels(c[lc]),
+                                     chunk_rows, max_rows, on_bad_lines='skip')
+            results.append({"name": f"kaggle_email/{csv.name}", "path": csv, "chunks": chunks, "text_col": text_col, "label_col": "is_scam"})
     return results
 
-def load_zenodo():
-    """Zenodo phishing datasets - subject,body,label format."""
+def stream_zenodo(chunk_rows=CHUNK_ROWS, max_rows=None):
     results = []
     folder = DOWNLOADS / "zenodo_phishing"
     for csv in sorted(folder.glob("*.csv")):
         try:
-            df = pd.read_csv(csv, on_bad_lines='skip')
+            text_col = zenodo_text_col(csv_header(csv))
         except Exception:
             continue
-        df = sample_df(df)
-        if "body" in df.columns and "label" in df.columns:
-            df["is_scam"] = (df["label"] >= 1).astype(int)
-            results.append({"name": f"zenodo/{csv.name}", "df": df, "text_col": "body", "label_col": "is_scam"})
-        elif "text_combined" in df.columns and "label" in df.columns:
-            df["is_scam"] = (df["label"] >= 1).astype(int)
-            results.append({"name": f"zenodo/{csv.name}", "df": df, "text_col": "text_combined", "label_col": "is_scam"})
+        if text_col:
+            chunks = iter_csv_chunks(csv, [text_col, "label"], lambda c: (c["label"] >= 1).astype(int),
+                                     chunk_rows, max_rows, on_bad_lines='skip')
+            results.append({"name": f"zenodo/{csv.name}", "path": csv, "chunks": chunks, "text_col": text_col, "label_col": "is_scam"})
     return results
 
-def load_url_dataset():
-    """Kaggle phishing URL dataset: URL, Domain, label"""
+def stream_url_dataset(chunk_rows=CHUNK_ROWS, max_rows=None):
     p = DOWNLOADS / "kaggle_phishing_url" / "phishing_simple (1).csv"
     if not p.exists():
         return []
-    df = pd.read_csv(p)
-    df = sample_df(df)
-    return [{"name": "kaggle_phishing_url", "df": df, "url_col": "URL", "domain_col": "Domain",
+    chunks = iter_csv_chunks(p, ["URL", "Domain", "label"], None, chunk_rows, max_rows)
+    return [{"name": "kaggle_phishing_url", "path": p, "chunks": chunks, "url_col": "URL", "domain_col": "Domain",
              "label_col": "label", "label_map": {"phishing": 1, "benign": 0}}]
 
+def dedup_stream(ds, threshold, chunk_rows=CHUNK_ROWS):
+    """A streamed text dataset reduced to its near-duplicate cluster representatives (read once, here)."""
+    reps, stats = deduplicate(ds["chunks"], ds["text_col"], ds["label_col"], threshold)
+    chunks = (reps.iloc[i:i + chunk_rows].reset_index(drop=True) for i in range(0, len(reps), chunk_rows))
+    return dict(ds, chunks=chunks, dedup=stats)
+
+def sample_stream(ds, max_rows, seed, chunk_rows=CHUNK_ROWS):
+    """A streamed text dataset reduced to a stratified reservoir sample of max_rows rows (read once, here)."""
+    sample, info = stratified_sample(ds["chunks"], ds["text_col"], ds["label_col"], max_rows, seed)
+    chunks = (sample.iloc[i:i + chunk_rows].reset_index(drop=True) for i in range(0, len(sample), chunk_rows))
+    return dict(ds, chunks=chunks, sampling=info)
+
+def route_dataset(ds, router):
+    """A text dataset whose rows carry their rule partition route code (see rule_routing.py)."""
+    channel = dataset_channel(ds["name"])
+
+    def tag(df):
+        return df.assign(route=router.route_codes(df[ds["text_col"]].tolist(), channel))
+    if "chunks" in ds:
+        return dict(ds, chunks=(tag(c) for c in ds["chunks"]))
+    return dict(ds, df=tag(ds["df"]))
+
+def normalize_dataset(ds, check_patterns=None, prefilter=None):
+    """
+    A text dataset whose messages are normalized once before matching (see
+    text_normalize.py); stats fill in as the rows are read. With
+    check_patterns, the first CHECK_ROWS rows are first scanned raw and
+    normalized for the recall check.
+    """
+    stats = empty_normalize_stats()
+    check = None
+    if check_patterns is not None:
+        sample = peek_rows(ds, NORMALIZE_CHECK_ROWS)
+        check = check_normalization(sample[ds["text_col"]].tolist(), sample[ds["label_col"]].to_numpy(),
+                                    check_patterns, prefilter)
+
+    def norm(df):
+        return df.assign(**{ds["text_col"]: normalize_texts(df[ds["text_col"]].tolist(), stats)})
+    if "chunks" in ds:
+        return dict(ds, chunks=(norm(c) for c in ds["chunks"]), normalize=stats, normalize_check=check)
+    return dict(ds, df=norm(ds["df"]), normalize=stats, normalize_check=check)
+
+def script_dataset(ds, matcher):
+    """A text dataset whose rows carry the bitmask of scam scripts each message matches alone (see script_match.py)."""
+    def tag(df):
+        return df.assign(script=matcher.codes(df[ds["text_col"]].tolist()))
+    if "chunks" in ds:
+        return dict(ds, chunks=(tag(c) for c in ds["chunks"]))
+    return dict(ds, df=tag(ds["df"]))
+
+ROW_META = ("dup_legit", "dup_scam", "stratum", "route", "script")
+
+def row_meta(df):
+    """Per-row columns the dedup, sampling, routing and script stages add (cluster member counts, stratum, route, script), or None."""
+    cols = [c for c in ROW_META if c in df.columns]
+    return df[cols].reset_index(drop=True) if cols else None
+
+# ─── Hit Matrix ──────────────────────────────────────────────────────────────
+
+def text_hit_matrix(texts, patterns, prefilter=None):
+    """
+    Boolean matrix of shape rows × rules: hits[i, j] is True when patterns[j]
+    matches texts[i]. Returns (hits, regexes skipped by the prefilter).
+    """
+    texts = pd.Series(texts).reset_index(drop=True)
+    hits = np.zeros((len(texts), len(patterns)), dtype=bool)
+    valid = texts.map(lambda t: isinstance(t, str) and bool(t.strip())).to_numpy(dtype=bool)
+    skipped = int((~valid).sum()) * len(patterns)
+    if prefilter is not None:
+        for i in np.flatnonzero(valid):
+            idx = prefilter.candidates(texts.iat[i])
+            skipped += len(patterns) - len(idx)
+            for j in idx:
+                if patterns[j]["regex"].search(texts.iat[i]):
+                    hits[i, j] = True
+    else:
+        column = texts[valid].tolist()
+        for j, p in enumerate(patterns):
+            search = p["regex"].search
+            hits[valid, j] = np.fromiter((search(t) is not None for t in column), dtype=bool, count=len(column))
+    return hits, skipped
+
+def url_hit_matrix(urls, domain_patterns):
+    """Boolean matrix of shape rows × domain rules for a column of URL strings."""
+    urls = list(urls)
+    hits = np.zeros((len(urls), len(domain_patterns)), dtype=bool)
+    for j, p in enumerate(domain_patterns):
+        search = p["regex"].search
+        hits[:, j] = np.fromiter((isinstance(u, str) and search(u) is not None for u in urls),
+                                 dtype=bool, count=len(urls))
+    return hits
+
+def confusion_counts(detected, labels):
+    """TP/FP/FN/TN from a detected mask and a label mask."""
+    return (int((detected & labels).sum()), int((detected & ~labels).sum()),
+            int((~detected & labels).sum()), int((~detected & ~labels).sum()))
+
+def category_hit_counts(hits, labels, categories):
+    """
+    Per-category TP/FP message counts from a hit matrix. A message counts once
+    per category however many of its rules fired. Categories appear in the
+    order they first fire, like the row-by-row loop this replaces.
+    """
+    categories = np.asarray(categories, dtype=object)
+    first = {}
+    for cat in dict.fromkeys(categories):
+        cat_any = hits[:, categories == cat].any(axis=1)
+        if cat_any.any():
+            first[cat] = (int(np.argmax(cat_any)), cat_any)
+    category_hits = {}
+    for cat, (_, cat_any) in sorted(first.items(), key=lambda kv: kv[1][0]):
+        category_hits[cat] = {"tp": int((cat_any & labels).sum()), "fp": int((cat_any & ~labels).sum())}
+    return category_hits
+
 # ─── Run Tests ───────────────────────────────────────────────────────────────
 
-def test_text_dataset(ds, patterns):
-    """Test a text dataset against patterns. Returns metrics dict."""
-    df = ds["df"]
-    text_col = ds["text_col"]
-    label_col = ds["label_col"]
-    
-    tp = fp = fn = tn = 0
-    category_hits = defaultdict(lambda: {"tp": 0, "fp": 0})
-    
-    for _, row in df.iterrows():
-        text = row[text_col]
-        is_scam = int(row[label_col])
-        matches = detect_text(text, patterns)
-        detected = len(matches) > 0
-        
-        if is_scam and detected:
-            tp += 1
-        elif is_scam and not detected:
-            fn += 1
-        elif not is_scam and detected:
-            fp += 1
-        else:
-            tn += 1
-        
-        for cat in set(matches):
-            if is_scam:
-                category_hits[cat]["tp"] += 1
-            else:
-                category_hits[cat]["fp"] += 1
-    
-    metrics = compute_metrics(tp, fp, fn, tn)
-    metrics["category_hits"] = dict(category_hits)
+def counts_from_hits(hits, labels, patterns, skipped=0, texts=None, meta=None, extras=()):
+    """
+    Confusion counts, category_hits and skipped regexes for one block of rows,
+    plus the optional analyses named in extras: "scores" for the scoring.ts
+    trust score histogram (see scoring.py) and "overlap" for the rule pair
+    intersection counts (see rule_overlap.py). With the block's texts, also
+    its sparse hits for --export-hits (see hit_export.py). With row_meta(),
+    raw and cluster-weighted counts (see near_dup.py), detections per
+    sampling stratum (see sampling.py), routed counts (see rule_routing.py)
+    and scam script matches (see script_match.py).
+    """
+    labels = np.asarray(labels, dtype=bool)
+    detected = hits.any(axis=1)
+    tp, fp, fn, tn = confusion_counts(detected, labels)
+    return {"tp": tp, "fp": fp, "fn": fn, "tn": tn,
+            "category_hits": category_hit_counts(hits, labels, [p["category"] for p in patterns]),
+            "regexes_skipped": skipped,
+            **({"score_hist": score_histogram(trust_scores(hits, patterns), labels)} if "scores" in extras else {}),
+            **({"overlap": intersections(hits)} if "overlap" in extras else {}),
+            **({"csr": [csr_block(hits, labels, texts)]} if texts is not None else {}),
+            **meta_counts(hits, labels, meta, patterns)}
+
+def meta_counts(hits, labels, meta, patterns):
+    if meta is None:
+        return {}
+    counts = {}
+    detected = hits.any(axis=1)
+    if "dup_scam" in meta:
+        counts.update(weighted_counts(detected, meta[["dup_legit", "dup_scam"]].to_numpy()))
+    if "stratum" in meta:
+        counts["strata"] = stratum_counts(detected, meta["stratum"].to_numpy())
+    if "route" in meta:
+        counts.update(route_counts(hits, labels, meta["route"].to_numpy(), patterns))
+    if "script" in meta:
+        counts.update(script_counts(detected, labels, meta["script"].to_numpy()))
+    return counts
+
+def score_text_shard(texts, labels, patterns, prefilter=None, keep_hits=False, meta=None, extras=()):
+    hits, skipped = text_hit_matrix(texts, patterns, prefilter)
+    return counts_from_hits(hits, labels, patterns, skipped, list(texts) if keep_hits else None, meta, extras)
+
+def hit_columns(texts, patterns, idx, prefilter=None, pool=None, shard_rows=SHARD_ROWS):
+    """Hit matrix for patterns[idx] only, computed in the pool when one is given."""
+    if pool is None:
+        sub = [patterns[j] for j in idx]
+        return text_hit_matrix(texts, sub, RulePrefilter(sub) if prefilter is not None else None)
+    texts = list(texts)
+    futures = [pool.submit(_hit_columns_in_worker, texts[i:i + shard_rows], idx)
+               for i in range(0, len(texts), shard_rows)]
+    results = [f.result() for f in futures]
+    if not results:
+        return np.zeros((0, len(idx)), dtype=bool), 0
+    return np.vstack([r[0] for r in results]), sum(r[1] for r in results)
+
+def score_text_cached(texts, labels, patterns, cache, prefilter=None, pool=None, shard_rows=SHARD_ROWS,
+                      keep_hits=False, meta=None, extras=()):
+    """
+    score_text_shard backed by a HitCache: only rules without a cached bitmap
+    for this block are run, and their bitmaps are saved for the next run.
+    regexes_skipped counts what the prefilter avoided among the rules run;
+    cached rules are reported as rules_cached of rules_total.
+    """
+    texts = pd.Series(texts).reset_index(drop=True)
+    hits, missing = cache.lookup(patterns, len(texts))
+    skipped = 0
+    if missing:
+        columns, skipped = hit_columns(texts, patterns, missing, prefilter, pool, shard_rows)
+        hits[:, missing] = columns
+        cache.store(patterns, missing, columns)
+    counts = counts_from_hits(hits, labels, patterns, skipped, texts.tolist() if keep_hits else None, meta, extras)
+    counts["rules_cached"] = len(patterns) - len(missing)
+    counts["rules_total"] = len(patterns)
+    return counts
+
+def hit_cache_for(ds, *parts):
+    """HitCache for a block of rows of a dataset; parts say how the rows were selected."""
+    return HitCache(block_key(ds["path"], ds["name"], ds["text_col"], *parts))
+
+def empty_counts():
+    return {"tp": 0, "fp": 0, "fn": 0, "tn": 0, "category_hits": {}, "regexes_skipped": 0}
+
+def fold_counts(total, shard):
+    """Add one shard's counts into a running total, keeping category first-hit order (and sparse hit row order)."""
+    for k, v in shard.items():
+        if k == "csr":
+            total.setdefault("csr", []).extend(v)
+        elif k != "category_hits":
+            total[k] = total.get(k, 0) + v
+    for cat, h in shard["category_hits"].items():
+        hits = total["category_hits"].setdefault(cat, {"tp": 0, "fp": 0})
+        hits["tp"] += h["tp"]
+        hits["fp"] += h["fp"]
+    return total
+
+def merge_counts(shards):
+    """Sum shard counts in order."""
+    merged = empty_counts()
+    for s in shards:
+        fold_counts(merged, s)
+    return merged
+
+def metrics_from_counts(counts):
+    metrics = compute_metrics(counts["tp"], counts["fp"], counts["fn"], counts["tn"])
+    for k, v in counts.items():
+        if k not in ("tp", "fp", "fn", "tn"):
+            metrics[k] = v
     return metrics
 
-def test_url_dataset(ds, domain_patterns):
-    """Test URL dataset against domain patterns."""
+def test_text_dataset(ds, patterns, prefilter=None, cache=None, pool=None, shard_rows=SHARD_ROWS, keep_hits=False,
+                      extras=()):
+    """Test a text dataset against patterns. Returns metrics dict (with "csr" blocks if keep_hits, see counts_from_hits for extras)."""
     df = ds["df"]
+    labels = df[ds["label_col"]].astype(int).to_numpy() != 0
+    meta = row_meta(df)
+    if cache is not None:
+        return metrics_from_counts(score_text_cached(df[ds["text_col"]], labels, patterns, cache,
+                                                     prefilter, pool, shard_rows, keep_hits, meta, extras))
+    return metrics_from_counts(score_text_shard(df[ds["text_col"]], labels, patterns, prefilter, keep_hits, meta,
+                                                extras))
+
+def url_labels(df, ds):
     label_map = ds.get("label_map", {})
-    
-    tp = fp = fn = tn = 0
-    
-    for _, row in df.iterrows():
-        url = str(row.get(ds["url_col"], "")) + " " + str(row.get(ds["domain_col"], ""))
-        label_raw = row[ds["label_col"]]
-        is_phish = label_map.get(label_raw, 0) if isinstance(label_raw, str) else int(label_raw)
-        
-        matches = detect_url(url, domain_patterns)
-        detected = len(matches) > 0
-        
-        if is_phish and detected:
-            tp += 1
-        elif is_phish and not detected:
-            fn += 1
-        elif not is_phish and detected:
-            fp += 1
+    return df[ds["label_col"]].map(
+        lambda raw: label_map.get(raw, 0) if isinstance(raw, str) else int(raw)).to_numpy() != 0
+
+def url_counts(df, ds, domain_patterns):
+    """TP/FP/FN/TN of the domain patterns over one frame of a URL dataset."""
+    def column(name):
+        return df[name].astype(str) if name in df.columns else pd.Series("", index=df.index)
+
+    urls = column(ds["url_col"]) + " " + column(ds["domain_col"])
+    hits = url_hit_matrix(urls, domain_patterns)
+    return confusion_counts(hits.any(axis=1), url_labels(df, ds))
+
+def url_host_counts(df, ds, host_index, domains, brands=None, brand_counts=None):
+    """
+    TP/FP/FN/TN over one frame with each row scored by its host (from the URL
+    column, else the domain column), as urlMatcher.ts does. Folds each row's
+    label and verdict into domains: registrable domain -> [any scam, any flagged].
+    With a BrandComparison, also folds each brand variant's counts into brand_counts.
+    """
+    def column(name):
+        return df[name] if name in df.columns else pd.Series(None, index=df.index, dtype=object)
+
+    hosts = [normalize_host(u) or normalize_host(d) for u, d in zip(column(ds["url_col"]), column(ds["domain_col"]))]
+    labels = url_labels(df, ds)
+    detected = host_index.evaluate(hosts).any(axis=1)
+    if brands is not None:
+        for variant, flagged in brands.verdicts(hosts, detected).items():
+            brand_counts[variant] = [a + b for a, b in zip(brand_counts.get(variant, (0, 0, 0, 0)),
+                                                          confusion_counts(flagged, labels))]
+    per_host = pd.DataFrame({"host": hosts, "scam": labels, "flagged": detected}).dropna(subset=["host"])
+    for h, scam, flagged in per_host.groupby("host", sort=False).any().itertuples():
+        agg = domains.setdefault(host_index.domain_of(h), [False, False])
+        agg[0] |= bool(scam)
+        agg[1] |= bool(flagged)
+    return confusion_counts(detected, labels)
+
+def domain_metrics(domains):
+    """Metrics with one sample per registrable domain (scam if any of its URLs is)."""
+    agg = np.array(list(domains.values()), dtype=bool).reshape(-1, 2)
+    return compute_metrics(*confusion_counts(agg[:, 1], agg[:, 0]))
+
+def test_url_dataset(ds, domain_patterns, host_index=None, brands=None):
+    """
+    Test URL dataset against domain patterns (per host, plus per-domain
+    metrics, with a host_index; plus brand look-alike metrics, with brands).
+    """
+    if host_index is None:
+        return compute_metrics(*url_counts(ds["df"], ds, domain_patterns))
+    domains, brand_counts = {}, {}
+    before = host_index.unique_hosts
+    metrics = compute_metrics(*url_host_counts(ds["df"], ds, host_index, domains, brands, brand_counts))
+    metrics["domain"] = domain_metrics(domains)
+    metrics["new_hosts"] = host_index.unique_hosts - before
+    if brands is not None:
+        metrics["brand"] = {v: compute_metrics(*c) for v, c in brand_counts.items()}
+    return metrics
+
+# ─── Parallel Execution ──────────────────────────────────────────────────────
+
+_worker = {}
+
+def _init_worker(use_prefilter, rules_version=None):
+    """Compile the rules once per worker process (from the cached index of rules_version, when given)."""
+    _worker["patterns"] = load_text_patterns(load_rule_index(RULES_DIR, digest=rules_version))
+    _worker["prefilter"] = RulePrefilter(_worker["patterns"]) if use_prefilter else None
+
+def _score_shard_in_worker(texts, labels, keep_hits=False, meta=None, extras=()):
+    return score_text_shard(texts, labels, _worker["patterns"], _worker["prefilter"], keep_hits, meta, extras)
+
+def _hit_columns_in_worker(texts, idx):
+    patterns = _worker["patterns"]
+    sub = [patterns[j] for j in idx]
+    prefilter = None
+    if _worker["prefilter"] is not None:
+        key = tuple(idx)
+        if _worker.get("sub_key") != key:
+            _worker["sub_key"], _worker["sub_prefilter"] = key, RulePrefilter(sub)
+        prefilter = _worker["sub_prefilter"]
+    return text_hit_matrix(texts, sub, prefilter)
+
+def make_pool(workers, use_prefilter, rules_version=None):
+    return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(use_prefilter, rules_version))
+
+def submit_text_dataset(pool, ds, shard_rows=SHARD_ROWS, keep_hits=False, extras=()):
+    """Split a dataset into row shards and queue them on the pool. Returns the futures."""
+    df = ds["df"]
+    texts = df[ds["text_col"]].tolist()
+    labels = df[ds["label_col"]].astype(int).to_numpy() != 0
+    meta = row_meta(df)
+    return [pool.submit(_score_shard_in_worker, texts[i:i + shard_rows], labels[i:i + shard_rows], keep_hits,
+                        meta.iloc[i:i + shard_rows] if meta is not None else None, extras)
+            for i in range(0, len(texts), shard_rows)]
+
+def collect_text_dataset(futures):
+    """Merge a dataset's shard results into the metrics dict test_text_dataset returns."""
+    return metrics_from_counts(merge_counts(f.result() for f in futures))
+
+# ─── Streaming Execution ─────────────────────────────────────────────────────
+
+def test_text_stream(ds, patterns, prefilter=None, pool=None, shard_rows=SHARD_ROWS, max_in_flight=8,
+                     cache_parts=None, hit_sink=None, extras=()):
+    """
+    Score a streamed dataset chunk by chunk, folding counts into running totals.
+    With a pool, at most max_in_flight shards are queued so memory stays bounded.
+    With cache_parts, each chunk is scored through its own HitCache.
+    With hit_sink, each shard's sparse hits are passed to it in row order.
+    Returns the test_text_dataset metrics dict plus rows and scam_count.
+    """
+    total = empty_counts()
+    rows = scam_count = 0
+    in_flight = []
+    keep_hits = hit_sink is not None
+
+    def fold(shard):
+        if keep_hits:
+            hit_sink(shard.pop("csr"))
+        fold_counts(total, shard)
+
+    for k, chunk in enumerate(ds["chunks"]):
+        rows += len(chunk)
+        scam_count += int(chunk[ds["label_col"]].sum())
+        labels = chunk[ds["label_col"]].astype(int).to_numpy() != 0
+        meta = row_meta(chunk)
+        if cache_parts is not None:
+            cache = hit_cache_for(ds, *cache_parts, k)
+            fold(score_text_cached(chunk[ds["text_col"]], labels, patterns, cache, prefilter, pool, shard_rows,
+                                   keep_hits, meta, extras))
+            continue
+        if pool is None:
+            fold(score_text_shard(chunk[ds["text_col"]], labels, patterns, prefilter, keep_hits, meta, extras))
+            continue
+        in_flight.extend(submit_text_dataset(pool, dict(ds, df=chunk), shard_rows, keep_hits, extras))
+        while len(in_flight) > max_in_flight:
+            fold(in_flight.pop(0).result())
+    for f in in_flight:
+        fold(f.result())
+    metrics = metrics_from_counts(total)
+    metrics["rows"] = rows
+    metrics["scam_count"] = scam_count
+    return metrics
+
+def test_url_stream(ds, domain_patterns, host_index=None, brands=None):
+    """Streaming counterpart of test_url_dataset; also returns rows."""
+    tp = fp = fn = tn = rows = 0
+    domains, brand_counts = {}, {}
+    before = host_index.unique_hosts if host_index is not None else 0
+    for chunk in ds["chunks"]:
+        rows += len(chunk)
+        if host_index is None:
+            c = url_counts(chunk, ds, domain_patterns)
         else:
-            tn += 1
-    
-    return compute_metrics(tp, fp, fn, tn)
+            c = url_host_counts(chunk, ds, host_index, domains, brands, brand_counts)
+        tp, fp, fn, tn = tp + c[0], fp + c[1], fn + c[2], tn + c[3]
+    metrics = compute_metrics(tp, fp, fn, tn)
+    metrics["rows"] = rows
+    if host_index is not None:
+        metrics["domain"] = domain_metrics(domains)
+        metrics["new_hosts"] = host_index.unique_hosts - before
+    if brands is not None:
+        metrics["brand"] = {v: compute_metrics(*c) for v, c in brand_counts.items()}
+    return metrics
+
+# ─── Rule Profiling ──────────────────────────────────────────────────────────
+
+def peek_rows(ds, n):
+    """The first n rows of a text dataset; a streamed dataset's first chunk is peeked, not consumed."""
+    if "chunks" not in ds:
+        return ds["df"].head(n)
+    first = next(ds["chunks"], None)
+    if first is None:
+        return pd.DataFrame(columns=[ds["text_col"], ds["label_col"]])
+    ds["chunks"] = itertools.chain([first], ds["chunks"])
+    return first.head(n)
+
+def profile_corpus(text_datasets, max_rows=PROFILE_ROWS):
+    """Up to max_rows messages spread over the datasets (streamed ones are peeked, not consumed)."""
+    per_ds = max(1, max_rows // max(1, len(text_datasets)))
+    texts = []
+    for ds in text_datasets:
+        texts.extend(peek_rows(ds, per_ds)[ds["text_col"]].tolist())
+    return texts
 
 # ─── Main ────────────────────────────────────────────────────────────────────
 
 def main():
+    parser = argparse.ArgumentParser(description="Run downloaded datasets against the detection rules.")
+    parser.add_argument("--no-prefilter", action="store_true",
+                        help="run every regex on every message instead of prefiltering on literal anchors")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="score text datasets in N worker processes (default: 1, in-process)")
+    parser.add_argument("--shard-rows", type=int, default=SHARD_ROWS,
+                        help=f"rows per shard sent to a worker (default: {SHARD_ROWS})")
+    parser.add_argument("--stream", action="store_true",
+                        help="read CSVs in chunks and fold counts as they go instead of loading whole files")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS,
+                        help=f"rows per CSV chunk with --stream (default: {CHUNK_ROWS})")
+    parser.add_argument("--max-rows", type=int, default=None,
+                        help=f"cap rows per dataset, 0 for no cap (default: {MAX_ROWS} sampled, "
+                             "or no cap with --stream, where the first rows are kept)")
+    parser.add_argument("--cache", action="store_true",
+                        help="reuse per-rule hit bitmaps from earlier runs; only new or changed rules are rescanned")
+    parser.add_argument("--arrow", action="store_true",
+                        help="read text datasets from the memory-mapped Arrow cache, normalizing each CSV once "
+                             "(needs pyarrow; ignored with --stream)")
+    parser.add_argument("--url-hosts", action="store_true",
+                        help="score each distinct URL host once, on the hostname only as urlMatcher.ts does, "
+                             "and add per-domain metrics")
+    parser.add_argument("--brands", action="store_true",
+                        help="also score hosts with the brand look-alike index and the urlMatcher.ts brand check "
+                             "(implies --url-hosts; adds a Brand Impersonation section)")
+    parser.add_argument("--weighted", action="store_true",
+                        help="add a Weighted Scoring section: messages scored with scoring.ts penalties and risk tiers")
+    parser.add_argument("--thresholds", default=None,
+                        help="trust score thresholds to sweep (flag scores below each; implies --weighted, "
+                             f"default: {','.join(map(str, SWEEP))})")
+    parser.add_argument("--curves", default=None, metavar="CSV",
+                        help="write ROC/PR curve points per dataset (and overall) to this CSV (implies --weighted)")
+    parser.add_argument("--export-hits", default=None, metavar="DIR",
+                        help="write the sparse rows × rules hit matrix with row metadata to DIR (see hit_export.py)")
+    parser.add_argument("--dedup", action="store_true",
+                        help="cluster near-duplicate messages before sampling and score one representative per "
+                             "cluster (adds raw and cluster-weighted metrics; see near_dup.py)")
+    parser.add_argument("--dedup-threshold", type=float, default=DEDUP_JACCARD,
+                        help=f"estimated Jaccard similarity to join a cluster with --dedup (default: {DEDUP_JACCARD})")
+    parser.add_argument("--stratified", action="store_true",
+                        help="sample max_rows per dataset by seeded stratified reservoir sampling instead of sample_df "
+                             "(adds a Sampling Error section with confidence intervals; see sampling.py)")
+    parser.add_argument("--smoke", action="store_true",
+                        help=f"quick run: --stratified with {SMOKE_ROWS} rows per dataset unless --max-rows is given")
+    parser.add_argument("--seed", type=int, default=SAMPLE_SEED, help="seed of --stratified sampling")
+    parser.add_argument("--overlap", action="store_true",
+                        help="add a Rule Overlap section: similar, subsumed and never-firing rules and the "
+                             "throughput gained by removing them")
+    parser.add_argument("--route", action="store_true",
+                        help="route each message to the rule partitions of its region cues and channel and add a "
+                             "Rule Routing section: regex work saved, per-partition throughput and the recall it "
+                             "costs (every rule is still scored; see rule_routing.py)")
+    parser.add_argument("--normalize", action="store_true",
+                        help="normalize messages once before matching (strip HTML and encoded blobs, fold look-alike "
+                             "letters, collapse whitespace, cap the window) and add a Text Normalization section "
+                             "checking recall against the raw text (see text_normalize.py)")
+    parser.add_argument("--scripts", action="store_true",
+                        help="also match the multi-step scam scripts of rules/*/scripts.json on every message and, "
+                             "incrementally, on the conversation dataset, and add a Script Matching section with "
+                             "their accuracy and throughput next to the text rules (see script_match.py)")
+    parser.add_argument("--profile-rules", action="store_true",
+                        help="time every rule per message and flag super-linear rules (adds a Rule Performance section)")
+    parser.add_argument("--profile-rows", type=int, default=PROFILE_ROWS,
+                        help=f"messages to time each rule on with --profile-rules (default: {PROFILE_ROWS})")
+    args = parser.parse_args()
+    if args.thresholds is not None or args.curves:
+        args.weighted = True  # trust scores are only computed when the section needs them
+    thresholds = [int(t) for t in args.thresholds.split(",") if t.strip()] if args.thresholds else list(SWEEP)
+    dedup = args.dedup_threshold if args.dedup else None
+    if args.smoke:
+        args.stratified = True
+        if args.max_rows is None:
+            args.max_rows = SMOKE_ROWS
+    max_rows = args.max_rows if args.max_rows is not None else (None if args.stream else MAX_ROWS)
+    stratified = args.seed if args.stratified else None
+    if args.arrow and not arrow_available():
+        print("⚠️ pyarrow is not installed; reading the CSVs instead of the Arrow cache")
+        args.arrow = False
+
     print("Loading rules...")
-    text_patterns = load_text_patterns()
-    domain_patterns = load_domain_patterns()
+    rules_index = load_rule_index(RULES_DIR)  # hashed once; workers reuse its digest
+    text_patterns = load_text_patterns(rules_index)
+    domain_patterns = load_domain_patterns(rules_index)
+    rules_version = rules_index["hash"]
     print(f"  {len(text_patterns)} text patterns, {len(domain_patterns)} domain patterns")
+    failed = failed_rules(rules_index)
+    for r in failed:
+        print(f"  ⚠️ {r['id']} ({r['source']}) failed to compile: {r['error']}")
+    prefilter = None
+    if not args.no_prefilter:
+        prefilter = RulePrefilter(text_patterns)
+        print(f"  prefilter: {len(prefilter.anchors)} anchors, {len(prefilter.always)} rules always verified")
     
     # Collect all datasets
     print("\nLoading datasets...")
     text_datasets = []
-    text_datasets.extend(load_smishing())
-    text_datasets.extend(load_kaggle_email())
-    text_datasets.extend(load_zenodo())
-    url_datasets = load_url_dataset()
+    if args.stream:
+        # Stratified samples are drawn from whole streams; max_rows is the sample size, not a cut
+        head_rows = None if stratified is not None else max_rows
+        text_datasets.extend(stream_smishing(args.chunk_rows, head_rows))
+        text_datasets.extend(stream_kaggle_email(args.chunk_rows, head_rows))
+        text_datasets.extend(stream_zenodo(args.chunk_rows, head_rows))
+        url_datasets = stream_url_dataset(args.chunk_rows, max_rows)
+        if dedup is not None:
+            text_datasets = [dedup_stream(ds, dedup, args.chunk_rows) for ds in text_datasets]
+        if stratified is not None:
+            text_datasets = [sample_stream(ds, max_rows, stratified, args.chunk_rows) for ds in text_datasets]
+    else:
+        text_datasets.extend(load_smishing(max_rows, args.arrow, dedup, stratified))
+        text_datasets.extend(load_kaggle_email(max_rows, args.arrow, dedup, stratified))
+        text_datasets.extend(load_zenodo(max_rows, args.arrow, dedup, stratified))
+        url_datasets = load_url_dataset(max_rows)
     
     print(f"  {len(text_datasets)} text datasets, {len(url_datasets)} URL datasets")
+    for ds in text_datasets:
+        if ds.get("dedup"):
+            s = ds["dedup"]
+            print(f"  {ds['name']}: {s['rows']:,} messages → {s['clusters']:,} near-duplicate clusters "
+                  f"({s['exact']:,} exact, {s['near']:,} near duplicates) in {s['seconds']:.1f}s")
+    for ds in text_datasets:
+        if ds.get("sampling"):
+            s = ds["sampling"]
+            print(f"  {ds['name']}: {int(s['sample'].sum()):,} of {int(s['population'].sum()):,} rows sampled "
+                  f"from {int((s['population'] > 0).sum())} strata")
+    if args.normalize:
+        print(f"\nChecking normalization on up to {NORMALIZE_CHECK_ROWS:,} raw rows per dataset...")
+        text_datasets = [normalize_dataset(ds, text_patterns, prefilter) for ds in text_datasets]
+    router = None
+    if args.route:
+        router = RegionRouter.from_table(text_patterns)
+        text_datasets = [route_dataset(ds, router) for ds in text_datasets]
+    matcher = None
+    if args.scripts:
+        matcher = ScriptMatcher(load_scripts(RULES_DIR))
+        print(f"  {len(matcher.scripts)} scam scripts, {len(matcher.keywords)} step keywords")
+        text_datasets = [script_dataset(ds, matcher) for ds in text_datasets]
+    cache_parts = (("dedup", dedup) if dedup is not None else ()) + \
+                  (("stratified", stratified) if stratified is not None else ()) + \
+                  (("normalize", NORMALIZE_VERSION, NORMALIZE_MAX_CHARS) if args.normalize else ())
+    
+    profile = None
+    if args.profile_rules:
+        texts = profile_corpus(text_datasets, args.profile_rows)
+        print(f"\nProfiling {len(text_patterns)} rules on {len(texts)} messages + synthetic long inputs...")
+        t0 = time.time()
+        profile = profile_rules(texts, text_patterns)
+        slow = [r["id"] for r in profile if r["flagged"]]
+        print(f"  {time.time() - t0:.1f}s — {len(slow)} super-linear rule(s){': ' + ', '.join(slow) if slow else ''}")
+    rule_ms = timing_texts = None
+    if args.overlap:
+        timing_texts = profile_corpus(text_datasets, TIMING_ROWS)
+        print(f"\nTiming {len(text_patterns)} rules on {len(timing_texts)} messages for the overlap estimate...")
+        rule_ms = time_rules(timing_texts, text_patterns)
+    routing_timing = None
+    if router is not None:
+        timing_texts = timing_texts if timing_texts is not None else profile_corpus(text_datasets, TIMING_ROWS)
+        print(f"\nTiming routed and full scans on {len(timing_texts)} messages...")
+        routing_timing = time_routing(timing_texts, text_patterns, router, prefilter)
+    script_timing = conversations = None
+    if matcher is not None:
+        timing_texts = timing_texts if timing_texts is not None else profile_corpus(text_datasets, TIMING_ROWS)
+        print(f"\nTiming scripts on {len(timing_texts)} messages and replaying conversations...")
+        script_timing = time_scripts(timing_texts, text_patterns, matcher, prefilter, threads_of(timing_texts))
+        conversations = {str(path.relative_to(ROOT)): evaluate_conversations(load_conversations(path), matcher,
+                                                                             text_patterns, prefilter)
+                         for path in conversation_files()}
+    
+    # With workers, queue every dataset's shards up front so datasets overlap
+    # (streamed datasets are queued a window at a time as they are read)
+    hit_writer = HitMatrixWriter(args.export_hits, text_patterns, rules_version) if args.export_hits else None
+    keep_hits = hit_writer is not None
+    extras = (("scores",) if args.weighted else ()) + (("overlap",) if args.overlap else ())
+    pool = pending = None
+    if args.workers > 1:
+        print(f"  scoring in {args.workers} worker processes, {args.shard_rows} rows per shard")
+        pool = make_pool(args.workers, prefilter is not None, rules_version)
+        if not args.stream and not args.cache:
+            pending = [submit_text_dataset(pool, ds, args.shard_rows, keep_hits, extras) for ds in text_datasets]
     
     # Run text tests
     all_results = []
     global_tp = global_fp = global_fn = global_tn = 0
+    global_skipped = 0
     all_category_hits = defaultdict(lambda: {"tp": 0, "fp": 0})
     
-    for ds in text_datasets:
-        name = ds["name"]
-        n = len(ds["df"])
-        scam_count = ds["df"][ds["label_col"]].sum()
-        print(f"\n  Testing {name} ({n} rows, {scam_count} scam)...", end=" ", flush=True)
-        t0 = time.time()
-        metrics = test_text_dataset(ds, text_patterns)
-        elapsed = time.time() - t0
-        print(f"{elapsed:.1f}s — P={metrics['precision']:.3f} R={metrics['recall']:.3f} F1={metrics['f1']:.3f}")
+    try:
+        for k, ds in enumerate(text_datasets):
+            name = ds["name"]
+            if hit_writer is not None:
+                hit_writer.start_dataset(name)
+            if args.stream:
+                print(f"\n  Testing {name} (streaming)...", end=" ", flush=True)
+                t0 = time.time()
+                metrics = test_text_stream(ds, text_patterns, prefilter, pool, args.shard_rows, 2 * args.workers,
+                                           ("stream", max_rows, args.chunk_rows, *cache_parts) if args.cache else None,
+                                           hit_writer.append if hit_writer is not None else None, extras)
+                n, scam_count = metrics["rows"], metrics["scam_count"]
+                print(f"{n} rows, {scam_count} scam,", end=" ")
+            else:
+                n = len(ds["df"])
+                scam_count = ds["df"][ds["label_col"]].sum()
+                print(f"\n  Testing {name} ({n} rows, {scam_count} scam)...", end=" ", flush=True)
+                t0 = time.time()
+                if args.cache:
+                    metrics = test_text_dataset(ds, text_patterns, prefilter, hit_cache_for(ds, "sample", max_rows, *cache_parts),
+                                                pool, args.shard_rows, keep_hits, extras)
+                elif pool is not None:
+                    metrics = collect_text_dataset(pending[k])
+                else:
+                    metrics = test_text_dataset(ds, text_patterns, prefilter, keep_hits=keep_hits, extras=extras)
+                if hit_writer is not None:
+                    hit_writer.append(metrics.pop("csr", []))
+            elapsed = time.time() - t0
+            print(f"{elapsed:.1f}s — P={metrics['precision']:.3f} R={metrics['recall']:.3f} F1={metrics['f1']:.3f}", end="")
+            if prefilter is not None and n and metrics.get("rules_cached", 0) < metrics.get("rules_total", 1):
+                print(f" — skipped {metrics['regexes_skipped'] / n:.1f}/{len(text_patterns)} regexes per message", end="")
+            if "rules_cached" in metrics:
+                print(f" — {metrics['rules_cached']}/{metrics['rules_total']} rule bitmaps from cache", end="")
+            print()
         
-        metrics["name"] = name
-        metrics["rows"] = n
-        metrics["scam_count"] = int(scam_count)
-        all_results.append(metrics)
+            metrics["name"] = name
+            metrics["rows"] = n
+            metrics["scam_count"] = int(scam_count)
+            metrics["dedup"] = ds.get("dedup")
+            metrics["sampling"] = ds.get("sampling")
+            metrics["normalize"] = ds.get("normalize")
+            metrics["normalize_check"] = ds.get("normalize_check")
+            all_results.append(metrics)
         
-        global_tp += metrics["tp"]
-        global_fp += metrics["fp"]
-        global_fn += metrics["fn"]
-        global_tn += metrics["tn"]
+            global_tp += metrics["tp"]
+            global_fp += metrics["fp"]
+            global_fn += metrics["fn"]
+            global_tn += metrics["tn"]
+            global_skipped += metrics["regexes_skipped"]
         
-        for cat, hits in metrics["category_hits"].items():
-            all_category_hits[cat]["tp"] += hits["tp"]
-            all_category_hits[cat]["fp"] += hits["fp"]
+            for cat, hits in metrics["category_hits"].items():
+                all_category_hits[cat]["tp"] += hits["tp"]
+                all_category_hits[cat]["fp"] += hits["fp"]
+    
+        if pool is not None:
+            pool.shutdown()
+        if hit_writer is not None:
+            hit_writer.close()
+    except BaseException:
+        if hit_writer is not None:
+            hit_writer.discard()  # drop the spools; a previous export in the directory stays intact
+        raise
+    if hit_writer is not None:
+        on_disk, dense = export_sizes(args.export_hits)
+        print(f"\n  Hit matrix: {hit_writer.rows:,} rows, {hit_writer.nnz:,} hits → {args.export_hits} "
+              f"({on_disk / 1e6:.2f} MB, dense bool {dense / 1e6:.2f} MB)")
+    
+    overlap = None
+    if args.overlap:
+        inter = np.zeros((len(text_patterns), len(text_patterns)), dtype=np.int64)
+        for r in all_results:
+            inter += r["overlap"]
+        overlap = analyze_overlap(inter, text_patterns, rule_ms)
+        print(f"\n  Rule overlap: {len(overlap['never'])} never fired, {len(overlap['subsumed'])} subsumed, "
+              f"est. +{overlap['gain'] * 100:.1f}% scan throughput without them")
     
     # Run URL tests
     url_results = []
+    host_index = HostIndex(domain_patterns) if args.url_hosts or args.brands else None
+    brands = BrandComparison() if args.brands else None
     for ds in url_datasets:
         name = ds["name"]
-        n = len(ds["df"])
-        print(f"\n  Testing {name} ({n} rows)...", end=" ", flush=True)
-        t0 = time.time()
-        metrics = test_url_dataset(ds, domain_patterns)
+        if args.stream:
+            print(f"\n  Testing {name} (streaming)...", end=" ", flush=True)
+            t0 = time.time()
+            metrics = test_url_stream(ds, domain_patterns, host_index, brands)
+            n = metrics["rows"]
+            print(f"{n} rows,", end=" ")
+        else:
+            n = len(ds["df"])
+            print(f"\n  Testing {name} ({n} rows)...", end=" ", flush=True)
+            t0 = time.time()
+            metrics = test_url_dataset(ds, domain_patterns, host_index, brands)
         elapsed = time.time() - t0
-        print(f"{elapsed:.1f}s — P={metrics['precision']:.3f} R={metrics['recall']:.3f} F1={metrics['f1']:.3f}")
+        print(f"{elapsed:.1f}s — P={metrics['precision']:.3f} R={metrics['recall']:.3f} F1={metrics['f1']:.3f}", end="")
+        if "domain" in metrics:
+            d = metrics["domain"]
+            print(f" — {metrics['new_hosts']:,} new hosts, {d['total']:,} domains: "
+                  f"P={d['precision']:.3f} R={d['recall']:.3f} F1={d['f1']:.3f}", end="")
+        print()
         metrics["name"] = name
         metrics["rows"] = n
         url_results.append(metrics)
@@ -297,8 +1072,21 @@ def main():
     lines = []
     lines.append("# TrustChekr Detection Engine — Batch Test Results")
     lines.append(f"\n**Generated:** {time.strftime('%Y-%m-%d %H:%M:%S')}")
-    lines.append(f"**Engine:** {len(text_patterns)} text patterns + {len(domain_patterns)} domain patterns")
-    lines.append(f"**Max rows per dataset:** {MAX_ROWS}\n")
+    lines.append(f"**Engine:** {len(text_patterns)} text patterns + {len(domain_patterns)} domain patterns (rules {rules_version[:12]})")
+    lines.append(f"**Max rows per dataset:** {max_rows or 'all'}")
+    if stratified is not None:
+        lines.append(f"**Sampling:** stratified reservoir (label × inferred category), seed {stratified}")
+    if dedup is not None:
+        lines.append(f"**Near-duplicate dedup:** one representative per cluster at estimated Jaccard ≥ {dedup:.2f}; "
+                     "rows below are representatives")
+    if hit_writer is not None:
+        lines.append(f"**Hit matrix:** `{args.export_hits}` — {hit_writer.rows:,} rows × {len(text_patterns)} rules, "
+                     f"{hit_writer.nnz:,} hits, {on_disk / 1e6:.2f} MB (dense: {dense / 1e6:.2f} MB)")
+    scanned = any(r.get("rules_cached", 0) < r.get("rules_total", 1) for r in all_results)  # not all from cache
+    if prefilter is not None and overall["total"] and scanned:
+        lines.append(f"**Prefilter:** {global_skipped / overall['total']:.1f} of {len(text_patterns)} regexes skipped per message"
+                     + (" (among the rules not served from the hit cache)" if args.cache else ""))
+    lines.append("")
     
     # Summary
     lines.append("## Overall Text Detection Metrics\n")
@@ -321,6 +1109,45 @@ def main():
     for r in all_results:
         lines.append(f"| {r['name']} | {r['rows']:,} | {r['scam_count']:,} | {r['tp']:,} | {r['fp']:,} | {r['fn']:,} | {r['tn']:,} | {r['precision']:.3f} | {r['recall']:.3f} | {r['f1']:.3f} |")
     
+    if stratified is not None:
+        lines.extend(sampling_section(all_results))
+    if dedup is not None:
+        lines.extend(dedup_section(all_results, compute_metrics))
+    
+    # Weighted scoring
+    scored = [(r["name"], r["score_hist"]) for r in all_results if r.get("score_hist") is not None]
+    if args.weighted and scored:
+        hist = sum(h for _, h in scored)
+        tp, fp, fn, tn = threshold_counts(hist)
+        tier_at = {tier_threshold(name): f"{name}+" for name, _ in TIERS[1:]}
+        lines.append("\n## Weighted Scoring (scoring.ts Parity)\n")
+        lines.append("Each message starts at a trust score of 100 and loses the scoring.ts penalty of its matched text "
+                     "rules (weight → penalty, half penalty from the 4th signal of a category, capped at 100). "
+                     "Flagging scores below 100 reproduces the any-match counts above.\n")
+        lines.append("| Risk Tier | Score | Messages | Scam | Legitimate | Scam Share |")
+        lines.append("|-----------|-------|----------|------|------------|------------|")
+        for name, span, legit, scam in tier_counts(hist):
+            share = f"{scam / (scam + legit):.3f}" if scam + legit else "—"
+            lines.append(f"| {name} | {span} | {scam + legit:,} | {scam:,} | {legit:,} | {share} |")
+        lines.append("\n| Flag Score Below | Tiers Flagged | TP | FP | FN | TN | Precision | Recall | F1 |")
+        lines.append("|------------------|---------------|----|----|----|-----|-----------|--------|-----|")
+        for t in sorted(set(thresholds) | set(tier_at), reverse=True):
+            if not 0 <= t < len(tp):
+                continue
+            m = compute_metrics(int(tp[t]), int(fp[t]), int(fn[t]), int(tn[t]))
+            lines.append(f"| {t} | {tier_at.get(t, '')} | {m['tp']:,} | {m['fp']:,} | {m['fn']:,} | {m['tn']:,} | {m['precision']:.3f} | {m['recall']:.3f} | {m['f1']:.3f} |")
+        cut = tier_threshold(DEFAULT_TIER)
+        lines.append(f"\n| Dataset | ROC AUC | Average Precision | Precision ({DEFAULT_TIER}+) | Recall ({DEFAULT_TIER}+) |")
+        lines.append("|---------|---------|-------------------|-------------|----------|")
+        for name, h in scored + [("**All text datasets**", hist)]:
+            c = curves(h)
+            m = compute_metrics(int(c["tp"][cut]), int(c["fp"][cut]), int(c["fn"][cut]), int(c["tn"][cut]))
+            auc, ap = (f"{c[k]:.3f}" if c[k] is not None else "n/a" for k in ("roc_auc", "average_precision"))
+            lines.append(f"| {name} | {auc} | {ap} | {m['precision']:.3f} | {m['recall']:.3f} |")
+        if args.curves:
+            write_curves(args.curves, scored + [("all", hist)])
+            lines.append(f"\nROC/PR curve points: `{args.curves}`")
+    
     # URL results
     if url_results:
         lines.append("\n## URL Detection Results\n")
@@ -329,6 +1156,44 @@ def main():
         for r in url_results:
             lines.append(f"| {r['name']} | {r['rows']:,} | {r['tp']:,} | {r['fp']:,} | {r['fn']:,} | {r['tn']:,} | {r['precision']:.3f} | {r['recall']:.3f} | {r['f1']:.3f} |")
     
+    if host_index is not None and url_results:
+        lines.append("\n## URL Detection Results (Per Unique Domain)\n")
+        lines.append(f"Rows scored by hostname only; each of {host_index.unique_hosts:,} distinct hosts was matched once "
+                     f"for {host_index.lookups:,} rows. A registrable domain (eTLD+1) counts as scam if any of its URLs is "
+                     "and as detected if any of its hosts is.\n")
+        lines.append("| Dataset | Domains | TP | FP | FN | TN | Precision | Recall | F1 |")
+        lines.append("|---------|---------|----|----|----|-----|-----------|--------|-----|")
+        for r in url_results:
+            d = r["domain"]
+            lines.append(f"| {r['name']} | {d['total']:,} | {d['tp']:,} | {d['fp']:,} | {d['fn']:,} | {d['tn']:,} | {d['precision']:.3f} | {d['recall']:.3f} | {d['f1']:.3f} |")
+    
+    if brands is not None and url_results:
+        index, linear = brands.index, brands.linear
+        lines.append("\n## Brand Impersonation\n")
+        lines.append(f"Hosts checked for look-alikes of the {len(index.legit)} legitimate domains in urlMatcher.ts. "
+                     f"Brand index: {index.us_per_host:.1f} µs per distinct host "
+                     f"({len(index.keys)} brand keys, homoglyph-folded); urlMatcher.ts brand check "
+                     f"(linear over every legitimate domain): {linear.us_per_host:.1f} µs per distinct host. "
+                     f"{index.evaluated:,} distinct hosts.\n")
+        lines.append("| Dataset | Variant | TP | FP | FN | TN | Precision | Recall | F1 |")
+        lines.append("|---------|---------|----|----|----|-----|-----------|--------|-----|")
+        for r in url_results:
+            for v in BRAND_VARIANTS:
+                b = r["brand"].get(v)
+                if b is None:
+                    continue
+                lines.append(f"| {r['name']} | {v} | {b['tp']:,} | {b['fp']:,} | {b['fn']:,} | {b['tn']:,} | {b['precision']:.3f} | {b['recall']:.3f} | {b['f1']:.3f} |")
+    
+    if failed:
+        lines.append("\n## Rules That Failed To Compile\n")
+        lines.append("| Rule | Source | Error |")
+        lines.append("|------|--------|-------|")
+        for r in failed:
+            lines.append(f"| {r['id']} | {r['source']} | {r['error']} |")
+    
+    if profile is not None:
+        lines.extend(performance_section(profile, len(texts)))
+    
     # Category breakdown
     lines.append("\n## Per-Category Detection Rates\n")
     lines.append("| Category | True Positives | False Positives | Notes |")
@@ -340,6 +1205,15 @@ def main():
         note = "⚠️ High FP rate" if fp_rate > 0.3 else "✅"
         lines.append(f"| {cat} | {h['tp']:,} | {h['fp']:,} | {note} |")
     
+    if overlap is not None:
+        lines.extend(overlap_section(overlap, text_patterns, sum(r["total"] for r in all_results), len(timing_texts)))
+    if router is not None:
+        lines.extend(routing_section(all_results, router, text_patterns, routing_timing))
+    if args.normalize:
+        lines.extend(normalization_section(all_results))
+    if matcher is not None:
+        lines.extend(script_section(all_results, matcher, conversations, script_timing))
+    
     # Recommendations
     lines.append("\n## Recommendations\n")
     
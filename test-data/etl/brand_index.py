@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+TrustChekr Detection Engine - Brand Look-alike Index
+Python counterpart of the brand-impersonation check in matchers/urlMatcher.ts.
+The legitimate domains are read from LEGITIMATE_DOMAINS in that file, so the
+two cannot drift.
+
+A host is folded (punycode decoded, NFKC, confusable letters and digit
+swaps mapped to ASCII) and split into tokens. It is matched through:
+  - an exact-token table for short brand keys ("td", "rbc"),
+  - an index of longer keys by their first trigram, probed at each position
+    of the host for keys contained in it ("bankofamerica-alerts"),
+  - a bigram inverted index for typosquats within a small edit distance,
+    transpositions included ("wellsfargp", "coinbsae"): r edits change at
+    most 3r distinct bigrams, so only keys sharing enough bigrams with a
+    token get a bounded edit-distance check.
+Each lookup touches only the brands sharing tokens or n-grams with the
+host, not the whole brand list.
+
+ts_brand_impersonation() reproduces checkBrandImpersonation exactly, for
+comparing the two in the report.
+"""
+
+import re, time, unicodedata
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from url_hosts import decode_host, registrable_domain
+
+ROOT = Path(__file__).resolve().parents[2]  # trustchekr-app/
+URL_MATCHER_TS = ROOT / "src" / "lib" / "ai-detection" / "matchers" / "urlMatcher.ts"
+SHORT_KEY = 3             # keys this short only match a whole host token
+TYPO_MIN_LEN = 5          # keys this long also match within TYPO_DISTANCE edits
+TYPO_DISTANCE = {5: 1, 9: 2}
+
+# Look-alikes of ASCII letters (Cyrillic, Greek, Latin extensions) and, for hosts, digit swaps
+LETTER_HOMOGLYPHS = {
+    "а": "a", "ɑ": "a", "α": "a", "в": "b", "ь": "b", "с": "c", "ϲ": "c", "ԁ": "d", "е": "e", "ė": "e",
+    "ё": "e", "ɡ": "g", "һ": "h", "і": "i", "ı": "i", "ɩ": "i", "ј": "j", "κ": "k", "к": "k", "ⅼ": "l",
+    "ӏ": "l", "м": "m", "п": "n", "ո": "n", "о": "o", "ο": "o", "օ": "o", "р": "p", "ρ": "p", "ԛ": "q",
+    "г": "r", "ѕ": "s", "т": "t", "τ": "t", "υ": "u", "ս": "u", "ν": "v", "ѵ": "v", "ԝ": "w", "ѡ": "w",
+    "х": "x", "χ": "x", "у": "y", "ү": "y", "ᴢ": "z",
+}
+DIGIT_SWAPS = {"0": "o", "1": "l", "3": "e", "4": "a", "5": "s", "7": "t", "8": "b", "@": "a", "$": "s"}
+HOMOGLYPHS = str.maketrans({**LETTER_HOMOGLYPHS, **DIGIT_SWAPS})
+MULTI_GLYPHS = (("rn", "m"), ("vv", "w"), ("cl", "d"))
+
+# ─── Legitimate Domains ──────────────────────────────────────────────────────
+
+_TS_ENTRY = re.compile(r"'([^']+)':\s*\{\s*brand:\s*'([^']+)',\s*category:\s*'([A-Z_]+)'\s*\}")
+
+def load_legitimate_domains(path=URL_MATCHER_TS):
+    """LEGITIMATE_DOMAINS from urlMatcher.ts, in declaration order: {domain: (brand, category)}."""
+    src = Path(path).read_text()
+    start = src.index("LEGITIMATE_DOMAINS")
+    return {d: (brand, cat) for d, brand, cat in _TS_ENTRY.findall(src, start)}
+
+# ─── Folding ─────────────────────────────────────────────────────────────────
+
+def fold(text):
+    """Lowercase ASCII skeleton of a (Unicode) string for look-alike comparison."""
+    if text.isascii():
+        return text.lower().translate(HOMOGLYPHS)
+    text = unicodedata.normalize("NFKC", text).lower().translate(HOMOGLYPHS)
+    return "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+
+def fold_variants(token):
+    """A folded token plus its multi-glyph readings ("rnicrosoft" → "microsoft")."""
+    out = [token]
+    for a, b in MULTI_GLYPHS:
+        if a in token:
+            out.append(token.replace(a, b))
+    return out
+
+def ngrams(s, n):
+    return {s[i:i + n] for i in range(len(s) - n + 1)}
+
+def edit_distance(a, b, limit):
+    """
+    Optimal string alignment distance (insertions, deletions, substitutions
+    and adjacent transpositions), or limit + 1 once it must exceed limit.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    prev2, prev = None, list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i]
+        for j, cb in enumerate(b, 1):
+            d = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb))
+            if prev2 is not None and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                d = min(d, prev2[j - 2] + 1)
+            cur.append(d)
+        if min(cur) > limit:
+            return limit + 1
+        prev2, prev = prev, cur
+    return min(prev[-1], limit + 1)
+
+# ─── Index ───────────────────────────────────────────────────────────────────
+
+def typo_radius(n):
+    radius = 0
+    for min_len, r in sorted(TYPO_DISTANCE.items()):
+        if n >= min_len:
+            radius = r
+    return radius
+
+class BrandIndex:
+    """Look-alike index over the legitimate domains; match(host) returns a dict or None."""
+
+    def __init__(self, legit=None):
+        self.legit = legit if legit is not None else load_legitimate_domains()
+        self.keys = {}          # folded brand key -> legit domain (first declared wins)
+        for domain in self.legit:
+            label = registrable_domain(domain).split(".")[0]
+            for key in {label.replace("-", ""), label.split("-")[0]}:
+                if len(key) >= 2:
+                    self.keys.setdefault(fold(key), domain)
+        self.short = {k: d for k, d in self.keys.items() if len(k) <= SHORT_KEY}
+        long_keys = [k for k in self.keys if len(k) > SHORT_KEY]
+        self.by_anchor = {}     # first trigram -> long keys, longest first
+        for k in sorted(long_keys, key=lambda k: (-len(k), k)):
+            self.by_anchor.setdefault(k[:3], []).append(k)
+        self.by_bigram = {}
+        self.bigram_count = {}
+        for k in long_keys:
+            if len(k) >= TYPO_MIN_LEN:
+                self.bigram_count[k] = len(ngrams(k, 2))
+                for g in ngrams(k, 2):
+                    self.by_bigram.setdefault(g, []).append(k)
+        self._typos = {}        # token -> (distance, key) or None
+        self.legit_hosts = frozenset(self.legit)
+        self._memo = {}
+        self.evaluated = 0
+        self.seconds = 0.0
+
+    def is_legitimate(self, host):
+        """Is host a legit domain or under one? (one set probe per label suffix)"""
+        labels = host.split(".")
+        return any(".".join(labels[i:]) in self.legit_hosts for i in range(len(labels)))
+
+    def _result(self, key, kind, host, distance=0):
+        domain = self.keys[key]
+        brand, category = self.legit[domain]
+        return {"legit": domain, "brand": brand, "category": category, "kind": kind, "key": key,
+                "distance": distance, "host": host}
+
+    def match(self, host):
+        """Look-alike verdict for an ASCII (punycode) host."""
+        if self.is_legitimate(host):
+            return None
+        # The public suffix carries no brand; subdomains do ("rbc.secure-login.xyz")
+        name = registrable_domain(host)
+        stem = host[:-len(name)] + name.split(".")[0] if host.endswith(name) else host
+        raw = decode_host(stem).lower()
+        folded = fold(raw)
+        kind = "homoglyph" if folded != raw else "contains"
+        tokens = [fold_variants(t) for t in re.split(r"[-._]+", folded) if t]
+
+        for variants in tokens:
+            for v in variants:
+                if v in self.short:
+                    return self._result(v, kind if kind == "homoglyph" or v != variants[0] else "token", host)
+        # Keys may straddle separators ("bank-of-america")
+        for v in fold_variants("".join(variants[0] for variants in tokens)):
+            for i in range(len(v) - 2):
+                for key in self.by_anchor.get(v[i:i + 3], ()):
+                    if v.startswith(key, i):
+                        return self._result(key, kind, host)
+        for variants in tokens:
+            for v in variants:
+                found = self.typo(v)
+                if found:
+                    return self._result(found[1], "typo", host, found[0])
+        return None
+
+    def typo(self, token):
+        """Closest (distance, key) within the token's typo radius, or None."""
+        if token in self._typos:
+            return self._typos[token]
+        best = None
+        radius = typo_radius(len(token))
+        if radius:
+            grams = ngrams(token, 2)
+            shared = {}
+            for g in grams:
+                for k in self.by_bigram.get(g, ()):
+                    shared[k] = shared.get(k, 0) + 1
+            for k, n in shared.items():
+                if n < max(len(grams), self.bigram_count[k]) - 3 * radius:
+                    continue
+                d = edit_distance(token, k, radius)
+                if 0 < d <= radius and (best is None or (d, k) < best):
+                    best = (d, k)
+        self._typos[token] = best
+        return best
+
+    def evaluate(self, hosts):
+        """Bool array: does each host (None = no host) look like a brand? Distinct hosts are matched once."""
+        return _memo_verdicts(hosts, self._memo, self.match, self)
+
+    @property
+    def us_per_host(self):
+        return self.seconds / self.evaluated * 1e6 if self.evaluated else 0.0
+
+def _memo_verdicts(hosts, memo, check, timer):
+    codes, uniques = pd.factorize(pd.Series(hosts, dtype=object))
+    verdict = np.zeros(len(uniques) + 1, dtype=bool)  # last row: no host
+    for k, h in enumerate(uniques):
+        if h not in memo:
+            t0 = time.perf_counter()
+            memo[h] = check(h)
+            timer.seconds += time.perf_counter() - t0
+            timer.evaluated += 1
+        verdict[k] = memo[h] is not None
+    return verdict[codes]
+
+# ─── urlMatcher.ts Parity ────────────────────────────────────────────────────
+
+_TS_SUFFIX = re.compile(r"\.(com|ca|gc\.ca|co)$")
+
+def ts_brand_impersonation(host, legit):
+    """checkBrandImpersonation from urlMatcher.ts, line for line: the first legit domain with a part in host."""
+    for domain in legit:
+        if host == domain or host.endswith(f".{domain}"):
+            continue
+        for part in re.split(r"[-._]", _TS_SUFFIX.sub("", domain, count=1)):
+            if len(part) >= 2 and part in host.lower():
+                return domain
+    return None
+
+class LinearBrandCheck:
+    """ts_brand_impersonation over hosts, memoized and timed like BrandIndex."""
+
+    def __init__(self, legit):
+        self.legit = legit
+        self._memo = {}
+        self.evaluated = 0
+        self.seconds = 0.0
+
+    def evaluate(self, hosts):
+        return _memo_verdicts(hosts, self._memo, lambda h: ts_brand_impersonation(h, self.legit), self)
+
+    @property
+    def us_per_host(self):
+        return self.seconds / self.evaluated * 1e6 if self.evaluated else 0.0
+
+# ─── Comparison ──────────────────────────────────────────────────────────────
+
+VARIANTS = ("regex only", "brand index", "regex + brand index", "urlMatcher.ts brand check")
+
+class BrandComparison:
+    """Per-row verdicts of the domain regexes, the brand index, both, and the urlMatcher.ts loop."""
+
+    def __init__(self, legit=None):
+        self.index = BrandIndex(legit)
+        self.linear = LinearBrandCheck(self.index.legit)
+
+    def verdicts(self, hosts, regex_detected):
+        brand = self.index.evaluate(hosts)
+        return {
+            "regex only": regex_detected,
+            "brand index": brand,
+            "regex + brand index": regex_detected | brand,
+            "urlMatcher.ts brand check": self.linear.evaluate(hosts),
+        }
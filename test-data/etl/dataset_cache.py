@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+TrustChekr Detection Engine - Columnar Dataset Cache
+Stores each downloaded text dataset once, normalized to the canonical columns
+(text, is_scam, source, dataset), as an uncompressed Arrow IPC file under
+DATASETS_DIR. Later runs memory-map it instead of re-parsing the CSV and
+re-sniffing its columns, and only materialize the columns (and sampled rows)
+the scorer asks for.
+
+Keyed by the source CSV's content hash, so a re-downloaded file is
+normalized again. Needs pyarrow; batch_test falls back to the CSVs without it.
+
+Usage: python dataset_cache.py [--rebuild]   (normalizes every text dataset in downloads/)
+"""
+
+import os, sys, re, argparse
+from pathlib import Path
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+except ImportError:
+    pa = None
+
+from result_cache import block_key
+
+ROOT = Path(__file__).resolve().parents[2]  # trustchekr-app/
+DATASETS_DIR = ROOT / "test-data" / ".cache" / "datasets"
+FORMAT_VERSION = 1
+COLUMNS = ("text", "is_scam", "source", "dataset")
+SCORING_COLUMNS = ("text", "is_scam")
+
+def available():
+    return pa is not None
+
+def _schema():
+    label = pa.dictionary(pa.int32(), pa.string())
+    return pa.schema([("text", pa.string()), ("is_scam", pa.int8()), ("source", label), ("dataset", label)])
+
+def dataset_path(path, name, cache_dir=DATASETS_DIR):
+    slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", name)
+    return Path(cache_dir) / f"{slug}-{block_key(path, name, f'v{FORMAT_VERSION}')[:16]}.arrow"
+
+# ─── Writing ─────────────────────────────────────────────────────────────────
+
+def write_dataset(df, out):
+    """Write a canonical frame (COLUMNS) as an Arrow IPC file, atomically."""
+    table = pa.Table.from_pandas(df[list(COLUMNS)], schema=_schema(), preserve_index=False)
+    out = Path(out)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out.with_name(f"{out.name}.tmp{os.getpid()}")
+    with pa.OSFile(str(tmp), "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(tmp, out)
+
+# ─── Reading ─────────────────────────────────────────────────────────────────
+
+def open_dataset(path, name, build, cache_dir=DATASETS_DIR, rebuild=False):
+    """
+    Memory-mapped Arrow table for a dataset file, normalizing it with build()
+    (which returns a canonical frame) on a cache miss.
+    """
+    out = dataset_path(path, name, cache_dir)
+    if rebuild or not out.exists():
+        write_dataset(build(), out)
+    return pa.ipc.open_file(pa.memory_map(str(out), "r")).read_all()
+
+def table_frame(table, columns=SCORING_COLUMNS, rows=None):
+    """DataFrame of some columns of a table, optionally only the row positions in rows."""
+    table = table.select(list(columns))
+    if rows is not None:
+        table = table.take(pa.array(rows))
+    return table.to_pandas()
+
+# ─── Main ────────────────────────────────────────────────────────────────────
+
+def main():
+    parser = argparse.ArgumentParser(description="Normalize the downloaded text datasets into the Arrow cache.")
+    parser.add_argument("--rebuild", action="store_true", help="re-normalize even if a cached file exists")
+    args = parser.parse_args()
+    if not available():
+        print("pyarrow is not installed (pip install pyarrow)")
+        return 1
+
+    import batch_test as bt
+    for name, path, read in bt.text_sources():
+        try:
+            table = open_dataset(path, name, read, rebuild=args.rebuild)
+        except Exception as e:
+            print(f"  ⚠️ {name}: {e}")
+            continue
+        size = dataset_path(path, name).stat().st_size
+        print(f"  {name:<48} {table.num_rows:>9,} rows  {size / 1e6:>8.1f} MB")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
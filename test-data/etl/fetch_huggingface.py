@@ -1,28 +1,26 @@
 #!/usr/bin/env python3
 """Fetch HuggingFace phishing dataset and map to Schema 1."""
-import re, csv, os
-from datasets import load_dataset
+import re, os, sys, json, tempfile, threading, argparse
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 import pandas as pd
 
+from keyword_classifier import load_classifier
+from stream_fetch import ResumableDownload, iter_json_array, CHUNK_SIZE, STATE_DIR
+
 OUTPUT = os.path.join(os.path.dirname(__file__), '..', 'schema1_scam_texts.csv')
+DATASET_URL = 'https://huggingface.co/datasets/ealvaradob/phishing-dataset/resolve/main/combined_reduced.json'
+BATCH_ROWS = 5000
+WHOLE_DATASET = 'all'     # what a clean parse gives ResumableDownload.finish: every array item
+SELFTEST_ROWS = 20000
+COLUMNS = ['id', 'text', 'category', 'channel', 'risk_level', 'source']
+TEXT_CATEGORIES = load_classifier('huggingface_text')
 
 def classify_category(text: str, label: int) -> str:
     if label == 0:
         return 'legitimate'
-    t = text.lower()
-    if any(k in t for k in ['cra', 'canada revenue']):
-        return 'cra_impersonation'
-    if any(k in t for k in ['bank', 'rbc', ' td ', 'scotiabank', 'bmo', 'cibc', 'account locked']):
-        return 'bank_impersonation'
-    if any(k in t for k in ['interac', 'e-transfer']):
-        return 'interac_phishing'
-    if any(k in t for k in ['investment', 'trading', 'crypto', 'bitcoin', 'guaranteed returns']):
-        return 'crypto_investment'
-    if any(k in t for k in ['microsoft', 'apple', 'virus', 'infected', 'remote access']):
-        return 'tech_support'
-    if any(k in t for k in ['rent', 'apartment', 'landlord']):
-        return 'rental_scam'
-    return 'generic_phishing'
+    # First matching category of the huggingface_text table in keyword_tables.json
+    return TEXT_CATEGORIES.classify(text)
 
 def infer_channel(text: str) -> str:
     t = text.lower()
@@ -43,32 +41,214 @@ RISK_MAP = {
     'legitimate': 'safe',
 }
 
-def main():
-    print("Loading ealvaradob/phishing-dataset via direct JSON download...")
-    import requests, json as _json
-    url = "https://huggingface.co/datasets/ealvaradob/phishing-dataset/resolve/main/combined_reduced.json"
-    resp = requests.get(url, timeout=120)
-    resp.raise_for_status()
-    ds = _json.loads(resp.text)
-    
-    rows = []
-    for i, item in enumerate(ds):
+def schema1_rows(items):
+    """Schema 1 rows for a stream of dataset items ({'text', 'label'} dicts)."""
+    for i, item in enumerate(items):
         text = item.get('text', '') or ''
         label = item.get('label', 0)
         cat = classify_category(text, label)
-        rows.append({
+        yield {
             'id': f'hf_{i}',
             'text': text,
             'category': cat,
             'channel': infer_channel(text),
             'risk_level': RISK_MAP.get(cat, 'medium'),
             'source': 'huggingface_phishing',
-        })
-    
-    df = pd.DataFrame(rows)
-    df.to_csv(OUTPUT, index=False)
-    print(f"Saved {len(df)} rows to {OUTPUT}")
-    print(df['category'].value_counts())
+        }
+
+def batches(rows, size=BATCH_ROWS):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+class BatchWriter:
+    """
+    Writes row batches to a CSV (and optionally a Parquet file) as they come,
+    through temp files that replace the outputs only when closed cleanly.
+    """
+
+    def __init__(self, csv_path, parquet_path=None):
+        self.parquet = None
+        self.outputs = [(csv_path, f'{csv_path}.tmp{os.getpid()}')]
+        if parquet_path:
+            import pyarrow as pa, pyarrow.parquet as pq
+            self._pa = pa
+            self.outputs.append((parquet_path, f'{parquet_path}.tmp{os.getpid()}'))
+            self.parquet = pq.ParquetWriter(self.outputs[1][1], pa.schema([(c, pa.string()) for c in COLUMNS]))
+        self.csv = open(self.outputs[0][1], 'w', newline='')
+        self.rows = 0
+
+    def write(self, batch):
+        df = pd.DataFrame(batch, columns=COLUMNS)
+        df.to_csv(self.csv, header=self.rows == 0, index=False)
+        if self.parquet is not None:
+            self.parquet.write_table(self._pa.Table.from_pandas(df, schema=self.parquet.schema, preserve_index=False))
+        self.rows += len(df)
+
+    def close(self, ok=True):
+        if self.rows == 0 and ok:
+            pd.DataFrame(columns=COLUMNS).to_csv(self.csv, index=False)
+        self.csv.close()
+        if self.parquet is not None:
+            self.parquet.close()
+        for final, tmp in self.outputs:
+            if ok:
+                os.replace(tmp, final)
+            elif os.path.exists(tmp):
+                os.remove(tmp)
+
+def source_chunks(source, state_dir=STATE_DIR):
+    """
+    Body byte chunks of a URL (resumable, see stream_fetch) or a local file.
+    Returns (chunks, download); download is None for local files.
+    """
+    if re.match(r'https?://', source):
+        download = ResumableDownload(source, state_dir, timeout=120)
+        download.open(need=WHOLE_DATASET)
+        return download.chunks(), download
+    def read_file():
+        with open(source, 'rb') as f:
+            yield from iter(lambda: f.read(CHUNK_SIZE), b'')
+    return read_file(), None
+
+def fetch(source, output, parquet=None, batch_rows=BATCH_ROWS, state_dir=STATE_DIR):
+    """
+    Stream the dataset into output. Returns (status, rows written, category
+    counts); status is the download's ("fresh", "resumed", "unchanged") or
+    "file", and rows / counts are None when the dataset was unchanged and
+    output already exists.
+    """
+    chunks, download = source_chunks(source, state_dir)
+    status = download.status if download is not None else 'file'
+    if status == 'unchanged' and os.path.exists(output):
+        return status, None, None
+
+    writer = BatchWriter(output, parquet)
+    counts = Counter()
+    try:
+        for batch in batches(schema1_rows(iter_json_array(chunks)), batch_rows):
+            writer.write(batch)
+            counts.update(row['category'] for row in batch)
+    except BaseException:
+        writer.close(ok=False)
+        raise
+    finally:
+        chunks.close()   # iter_json_array stops at "]": release the response and save the byte count
+    writer.close()
+    if download is not None:
+        download.finish(satisfied=WHOLE_DATASET)
+    return status, writer.rows, counts
+
+class _FeedHandler(BaseHTTPRequestHandler):
+    """Serves server.body with an ETag, 304 on If-None-Match, and 206 / 416 on Range (honouring If-Range)."""
+
+    ETAG = '"v1"'
+
+    def do_GET(self):
+        body = self.server.body
+        self.server.requests.append({k: self.headers.get(k) for k in ('Range', 'If-Range', 'If-None-Match')})
+        if self.headers.get('If-None-Match') == self.ETAG:
+            self.send_response(304)
+            self.end_headers()
+            return
+        rng = self.headers.get('Range')
+        if rng and self.headers.get('If-Range') in (None, self.ETAG):
+            start = int(rng.split('=')[1].split('-')[0])
+            if start >= len(body):
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{len(body)}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{len(body) - 1}/{len(body)}')
+            body = body[start:]
+        else:
+            self.send_response(200)
+        self.send_header('ETag', self.ETAG)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def selftest(rows=SELFTEST_ROWS):
+    """
+    Fetch a generated dataset from a localhost server with ETag and Range
+    support: a fresh run, an unchanged rerun (304, output kept), a resume
+    from half a part file, and a part that already holds the whole body of
+    an unfinished run (416, counted as complete).
+    """
+    items = [{'text': f'Message {i}: your CRA refund is ready, click here' if i % 3 else f'Lunch at {i}?',
+              'label': int(i % 3 != 0)} for i in range(rows)]
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _FeedHandler)
+    server.body = json.dumps(items).encode() + b'\n'
+    server.requests = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_address[1]}/combined_reduced.json'
+    failures = []
+
+    def expect(what, ok):
+        print(f"  {'ok  ' if ok else 'FAIL'} {what}")
+        if not ok:
+            failures.append(what)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        output, state_dir = os.path.join(tmp, 'out.csv'), os.path.join(tmp, 'state')
+        status, n, _ = fetch(url, output, state_dir=state_dir)
+        expected = pd.read_csv(output)
+        expect(f'first run: {status}, {n} rows', status == 'fresh' and n == rows)
+        status, n, _ = fetch(url, output, state_dir=state_dir)
+        expect(f'second run: {status} (If-None-Match {server.requests[-1]["If-None-Match"]})',
+               status == 'unchanged' and n is None)
+
+        download = ResumableDownload(url, state_dir)
+        state = dict(download.state, complete=False, satisfied=None)
+        with open(download.part, 'r+b') as f:
+            f.truncate(len(server.body) // 2)
+        download.state_path.write_text(json.dumps(state))
+        status, n, _ = fetch(url, output, state_dir=state_dir)
+        expect(f'interrupted run: {status} from {server.requests[-1]["Range"]}, {n} rows',
+               status == 'resumed' and n == rows and pd.read_csv(output).equals(expected))
+
+        download.part.write_bytes(server.body)
+        download.state_path.write_text(json.dumps(dict(state, bytes=len(server.body))))
+        status, n, _ = fetch(url, output, state_dir=state_dir)
+        expect(f'unfinished run with the whole body spooled: {status}, {n} rows',
+               status == 'resumed' and n == rows and pd.read_csv(output).equals(expected))
+        status, _, _ = fetch(url, output, state_dir=state_dir)
+        expect(f'and then: {status}', status == 'unchanged')
+    server.shutdown()
+    return 1 if failures else 0
+
+def main():
+    parser = argparse.ArgumentParser(description='Stream the HuggingFace phishing dataset into Schema 1.')
+    parser.add_argument('--source', default=DATASET_URL, help='dataset URL or local JSON file')
+    parser.add_argument('--output', default=OUTPUT)
+    parser.add_argument('--parquet', help='also write a Parquet copy here (needs pyarrow)')
+    parser.add_argument('--batch-rows', type=int, default=BATCH_ROWS)
+    parser.add_argument('--state-dir', default=STATE_DIR, help='where partial downloads and ETags are kept')
+    parser.add_argument('--selftest', action='store_true',
+                        help='fetch a generated dataset twice (and resumed) from a localhost server and check the runs')
+    args = parser.parse_args()
+    if args.selftest:
+        return selftest()
+
+    print(f"Streaming ealvaradob/phishing-dataset from {args.source}...")
+    status, rows, counts = fetch(args.source, args.output, args.parquet, args.batch_rows, args.state_dir)
+    if rows is None:
+        print(f"Dataset unchanged since the last run; kept {args.output}")
+        return 0
+    print(f"Saved {rows} rows to {args.output}" + (f" and {args.parquet}" if args.parquet else ''))
+    for cat, n in counts.most_common():
+        print(f"  {cat:<20} {n}")
+    return 0
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
@@ -1,106 +1,124 @@
 #!/usr/bin/env python3
 """Download PhishTank verified phishing URLs and map to Schema 2."""
-import csv, os, re
+import csv, os, argparse
+from collections import Counter
 from urllib.parse import urlparse
-import requests
-import pandas as pd
+
+from stream_fetch import ResumableDownload, iter_csv_rows, iter_json_array, STATE_DIR
+from keyword_classifier import load_classifier
 
 OUTPUT = os.path.join(os.path.dirname(__file__), '..', 'schema2_domains.csv')
 PHISHTANK_CSV = 'http://data.phishtank.com/data/online-valid.csv'
 PHISHTANK_JSON = 'http://data.phishtank.com/data/online-valid.json'
 MAX_ENTRIES = 10000
+HEADERS = {'User-Agent': 'phishtank/trustchekr-research'}
+URL_CATEGORIES = load_classifier('phishtank_url')
 
 def infer_category(url: str) -> str:
-    u = url.lower()
-    if any(k in u for k in ['paypal', 'bank', 'chase', 'wells', 'citi', 'hsbc']):
-        return 'banking'
-    if any(k in u for k in ['apple', 'icloud', 'microsoft', 'outlook', 'office365']):
-        return 'tech'
-    if any(k in u for k in ['facebook', 'instagram', 'twitter', 'linkedin', 'tiktok']):
-        return 'social_media'
-    if any(k in u for k in ['amazon', 'ebay', 'shopify', 'walmart']):
-        return 'ecommerce'
-    if any(k in u for k in ['crypto', 'bitcoin', 'binance', 'coinbase', 'metamask']):
-        return 'crypto'
-    if any(k in u for k in ['google', 'gmail', 'drive']):
-        return 'google'
-    if any(k in u for k in ['netflix', 'disney', 'spotify']):
-        return 'streaming'
-    return 'generic'
+    # First matching category of the phishtank_url table in keyword_tables.json
+    return URL_CATEGORIES.classify(url)
 
-def main():
-    print("Downloading PhishTank data...")
-    headers = {'User-Agent': 'phishtank/trustchekr-research'}
-    
-    try:
-        resp = requests.get(PHISHTANK_CSV, headers=headers, timeout=60, stream=True)
-        resp.raise_for_status()
-        lines = resp.text.splitlines()
-        reader = csv.DictReader(lines)
-    except Exception as e:
-        print(f"CSV download failed: {e}")
-        print("Trying JSON...")
-        try:
-            resp = requests.get(PHISHTANK_JSON, headers=headers, timeout=60)
-            resp.raise_for_status()
-            data = resp.json()
-            rows = []
-            for i, entry in enumerate(data[:MAX_ENTRIES]):
-                url = entry.get('url', '')
-                domain = urlparse(url).netloc
-                rows.append({
-                    'id': f'pt_{i}',
-                    'domain': domain,
-                    'full_url': url,
-                    'label': 'phishing',
-                    'domain_age_days': None,
-                    'category': infer_category(url),
-                    'source': 'phishtank',
-                })
-            df = pd.DataFrame(rows)
-            df.to_csv(OUTPUT, index=False)
-            print(f"Saved {len(df)} domains to {OUTPUT}")
-            return
-        except Exception as e2:
-            print(f"JSON also failed: {e2}")
-            print("Generating placeholder domain dataset instead...")
-            # Generate some known phishing domain patterns
-            placeholder_domains = [
-                ('rbc-secure-login.xyz', 'https://rbc-secure-login.xyz/verify', 'banking'),
-                ('td-alert-verify.com', 'https://td-alert-verify.com/auth', 'banking'),
-                ('interac-etransfer-deposit.ca', 'https://interac-etransfer-deposit.ca/claim', 'banking'),
-                ('cra-refund-claim.net', 'https://cra-refund-claim.net/refund', 'government'),
-                ('apple-id-verify.xyz', 'https://apple-id-verify.xyz/login', 'tech'),
-                ('microsoft-alert.support', 'https://microsoft-alert.support/fix', 'tech'),
-            ]
-            rows = []
-            for i, (domain, url, cat) in enumerate(placeholder_domains):
-                rows.append({'id': f'pt_{i}', 'domain': domain, 'full_url': url, 'label': 'phishing', 'domain_age_days': None, 'category': cat, 'source': 'placeholder'})
-            df = pd.DataFrame(rows)
-            df.to_csv(OUTPUT, index=False)
-            print(f"Saved {len(df)} placeholder domains to {OUTPUT}")
-            return
+FIELDS = ['id', 'domain', 'full_url', 'label', 'domain_age_days', 'category', 'source']
+FLUSH_EVERY = 1000
+
+PLACEHOLDER_DOMAINS = [
+    ('rbc-secure-login.xyz', 'https://rbc-secure-login.xyz/verify', 'banking'),
+    ('td-alert-verify.com', 'https://td-alert-verify.com/auth', 'banking'),
+    ('interac-etransfer-deposit.ca', 'https://interac-etransfer-deposit.ca/claim', 'banking'),
+    ('cra-refund-claim.net', 'https://cra-refund-claim.net/refund', 'government'),
+    ('apple-id-verify.xyz', 'https://apple-id-verify.xyz/login', 'tech'),
+    ('microsoft-alert.support', 'https://microsoft-alert.support/fix', 'tech'),
+]
 
-    rows = []
-    for i, row in enumerate(reader):
-        if i >= MAX_ENTRIES:
+def schema2_rows(urls, max_entries=MAX_ENTRIES):
+    """Schema 2 rows for a stream of PhishTank URLs."""
+    for i, url in enumerate(urls):
+        if max_entries and i >= max_entries:
             break
-        url = row.get('url', '')
-        domain = urlparse(url).netloc
-        rows.append({
+        yield {
             'id': f'pt_{i}',
-            'domain': domain,
+            'domain': urlparse(url).netloc,
             'full_url': url,
             'label': 'phishing',
             'domain_age_days': None,
             'category': infer_category(url),
             'source': 'phishtank',
-        })
+        }
+
+def write_rows(rows, output):
+    """
+    Write rows to output as they arrive (flushed every FLUSH_EVERY rows) via a
+    temp file that replaces output only once the feed parsed cleanly.
+    Returns the per-category counts.
+    """
+    tmp = f'{output}.tmp{os.getpid()}'
+    counts = Counter()
+    try:
+        with open(tmp, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=FIELDS, lineterminator='\n')
+            writer.writeheader()
+            for n, row in enumerate(rows, 1):
+                writer.writerow(row)
+                counts[row['category']] += 1
+                if n % FLUSH_EVERY == 0:
+                    f.flush()
+        os.replace(tmp, output)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return counts
+
+def fetch_feed(url, parse, output, max_entries=MAX_ENTRIES, state_dir=STATE_DIR, headers=HEADERS):
+    """
+    Stream one feed into output. parse turns body byte chunks into URLs.
+    Returns (status, category counts); counts is None when the feed was
+    unchanged and output already exists.
+    """
+    download = ResumableDownload(url, state_dir, headers)
+    status = download.open(need=max_entries)
+    if status == 'unchanged' and os.path.exists(output):
+        return status, None
+    counts = write_rows(schema2_rows(parse(download.chunks()), max_entries), output)
+    download.finish(satisfied=max_entries)
+    return status, counts
+
+def csv_urls(chunks):
+    return (row.get('url', '') or '' for row in iter_csv_rows(chunks))
+
+def json_urls(chunks):
+    return (entry.get('url', '') or '' for entry in iter_json_array(chunks))
+
+def main():
+    parser = argparse.ArgumentParser(description='Stream PhishTank verified phishing URLs into Schema 2.')
+    parser.add_argument('--csv-url', default=PHISHTANK_CSV)
+    parser.add_argument('--json-url', default=PHISHTANK_JSON)
+    parser.add_argument('--output', default=OUTPUT)
+    parser.add_argument('--max-entries', type=int, default=MAX_ENTRIES, help='0 for the whole feed')
+    parser.add_argument('--state-dir', default=STATE_DIR, help='where partial downloads and ETags are kept')
+    args = parser.parse_args()
+
+    print("Downloading PhishTank data...")
+    for kind, url, parse in (('CSV', args.csv_url, csv_urls), ('JSON', args.json_url, json_urls)):
+        try:
+            status, counts = fetch_feed(url, parse, args.output, args.max_entries, args.state_dir)
+        except Exception as e:
+            print(f"{kind} download failed: {e}")
+            continue
+        if counts is None:
+            print(f"{kind} feed unchanged since the last run; kept {args.output}")
+            return
+        print(f"Saved {sum(counts.values())} domains to {args.output} ({kind} feed, {status})")
+        for cat, n in counts.most_common():
+            print(f"  {cat:<14} {n}")
+        return
 
-    df = pd.DataFrame(rows)
-    df.to_csv(OUTPUT, index=False)
-    print(f"Saved {len(df)} domains to {OUTPUT}")
-    print(df['category'].value_counts())
+    print("Generating placeholder domain dataset instead...")
+    rows = [{'id': f'pt_{i}', 'domain': domain, 'full_url': url, 'label': 'phishing', 'domain_age_days': None,
+             'category': cat, 'source': 'placeholder'}
+            for i, (domain, url, cat) in enumerate(PLACEHOLDER_DOMAINS)]
+    write_rows(rows, args.output)
+    print(f"Saved {len(rows)} placeholder domains to {args.output}")
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+TrustChekr Detection Engine - Sparse Hit Matrix Export
+Persists which rules matched which messages as a CSR (compressed sparse
+row) matrix, rows × rules, with per-row metadata, so co-occurrence,
+redundancy and per-rule precision can be computed later without rescanning
+the text. batch_test.py --export-hits DIR writes one.
+
+A directory of plain .npy arrays, each loadable with np.load(mmap_mode="r"):
+
+  indptr.npy     int64, rows + 1   row i's hits are indices[indptr[i]:indptr[i + 1]]
+  indices.npy    uint16 / int32    rule column of each hit
+  labels.npy     int8              1 scam, 0 legitimate
+  dataset.npy    int16             index into meta.json "datasets"
+  text_hash.npy  uint64            first 8 bytes of the message's BLAKE2b digest
+  meta.json      rule columns (id, category, region, weight), datasets, rules hash
+
+Usage: python hit_export.py DIR   (summary and per-rule precision of an export)
+"""
+
+import os, sys, json, shutil, hashlib, argparse
+from pathlib import Path
+
+import numpy as np
+
+FORMAT_VERSION = 1
+ARRAYS = ("indptr", "indices", "labels", "dataset", "text_hash")
+REPORT_TOP = 20
+
+# ─── Blocks ──────────────────────────────────────────────────────────────────
+
+def text_hash(text):
+    if not isinstance(text, str):
+        text = ""
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8", "replace"), digest_size=8).digest(), "little")
+
+def csr_block(hits, labels, texts):
+    """Sparse form of one block's dense hit matrix: (row hit counts, hit columns, labels, text hashes)."""
+    rows, cols = np.nonzero(hits)  # row-major, so each row's columns are contiguous and sorted
+    return (np.bincount(rows, minlength=len(hits)).astype(np.int64), cols.astype(np.int32),
+            np.asarray(labels, dtype=np.int8), np.fromiter((text_hash(t) for t in texts), dtype=np.uint64,
+                                                           count=len(hits)))
+
+# ─── Writing ─────────────────────────────────────────────────────────────────
+
+class _Column:
+    """An .npy array written in appends: raw bytes to a spool file, the header prepended on close."""
+
+    def __init__(self, path, dtype):
+        self.path = Path(path)
+        self.dtype = np.dtype(dtype)
+        self.spool = self.path.with_name(f"{self.path.name}.spool{os.getpid()}")
+        self.f = open(self.spool, "wb")
+        self.count = 0
+
+    def append(self, values):
+        values = np.ascontiguousarray(values, dtype=self.dtype)
+        self.f.write(values.tobytes())
+        self.count += len(values)
+
+    def close(self):
+        self.f.close()
+        tmp = self.path.with_name(f"{self.path.name}.tmp{os.getpid()}")
+        with open(tmp, "wb") as out, open(self.spool, "rb") as src:
+            np.lib.format.write_array_header_1_0(out, {"descr": np.lib.format.dtype_to_descr(self.dtype),
+                                                       "fortran_order": False, "shape": (self.count,)})
+            shutil.copyfileobj(src, out, 1 << 20)
+        os.remove(self.spool)
+        os.replace(tmp, self.path)
+
+    def discard(self):
+        self.f.close()
+        if self.spool.exists():
+            os.remove(self.spool)
+
+class HitMatrixWriter:
+    """Appends csr_block()s dataset by dataset (start_dataset, then append); close() finalizes the export."""
+
+    def __init__(self, out_dir, patterns, rules_hash=None):
+        self.dir = Path(out_dir)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.rules = [{"id": p["id"], "category": p["category"], "region": p.get("region"), "weight": p["weight"]}
+                      for p in patterns]
+        index_dtype = np.uint16 if len(patterns) <= np.iinfo(np.uint16).max + 1 else np.int32
+        self.columns = {"indptr": _Column(self.dir / "indptr.npy", np.int64),
+                        "indices": _Column(self.dir / "indices.npy", index_dtype),
+                        "labels": _Column(self.dir / "labels.npy", np.int8),
+                        "dataset": _Column(self.dir / "dataset.npy", np.int16),
+                        "text_hash": _Column(self.dir / "text_hash.npy", np.uint64)}
+        self.columns["indptr"].append([0])
+        self.rules_hash = rules_hash
+        self.datasets = []
+        self.nnz = 0
+
+    def start_dataset(self, name):
+        """Rows appended from now on belong to dataset name."""
+        self.datasets.append(name)
+
+    def append(self, blocks):
+        """Add csr_block()s of the current dataset, in row order."""
+        code = len(self.datasets) - 1
+        for counts, cols, labels, hashes in blocks:
+            self.columns["indptr"].append(self.nnz + np.cumsum(counts))
+            self.columns["indices"].append(cols)
+            self.columns["labels"].append(labels)
+            self.columns["dataset"].append(np.full(len(labels), code, dtype=np.int16))
+            self.columns["text_hash"].append(hashes)
+            self.nnz += len(cols)
+
+    @property
+    def rows(self):
+        return self.columns["labels"].count
+
+    def close(self):
+        for column in self.columns.values():
+            column.close()
+        meta = {"version": FORMAT_VERSION, "rows": self.rows, "nnz": self.nnz, "rules": self.rules,
+                "datasets": self.datasets, "rules_hash": self.rules_hash}
+        tmp = self.dir / f"meta.json.tmp{os.getpid()}"
+        tmp.write_text(json.dumps(meta, indent=1))
+        os.replace(tmp, self.dir / "meta.json")
+
+    def discard(self):
+        for column in self.columns.values():
+            column.discard()
+
+def export_sizes(out_dir):
+    """(bytes on disk, bytes of the dense bool matrix) of an export."""
+    meta = json.loads((Path(out_dir) / "meta.json").read_text())
+    on_disk = sum((Path(out_dir) / f"{name}.npy").stat().st_size for name in ARRAYS)
+    return on_disk, meta["rows"] * len(meta["rules"])
+
+# ─── Reading ─────────────────────────────────────────────────────────────────
+
+class HitMatrix:
+    """A loaded export; arrays are memory-mapped unless mmap=False."""
+
+    def __init__(self, path, mmap=True):
+        self.path = Path(path)
+        self.meta = json.loads((self.path / "meta.json").read_text())
+        if self.meta.get("version") != FORMAT_VERSION:
+            raise ValueError(f"{path}: hit matrix format {self.meta.get('version')}, expected {FORMAT_VERSION}")
+        for name in ARRAYS:
+            setattr(self, name, np.load(self.path / f"{name}.npy", mmap_mode="r" if mmap else None))
+        self.rules = self.meta["rules"]
+        self.datasets = self.meta["datasets"]
+
+    @property
+    def shape(self):
+        return len(self.labels), len(self.rules)
+
+    def row_of_hit(self):
+        """Row index of every stored hit (aligned with indices)."""
+        return np.repeat(np.arange(len(self.labels)), np.diff(self.indptr))
+
+    def dense(self, start=0, stop=None):
+        """Dense bool block of rows start:stop."""
+        stop = len(self.labels) if stop is None else stop
+        lo, hi = int(self.indptr[start]), int(self.indptr[stop])
+        block = np.zeros((stop - start, len(self.rules)), dtype=bool)
+        rows = np.repeat(np.arange(stop - start), np.diff(self.indptr[start:stop + 1]))
+        block[rows, self.indices[lo:hi]] = True
+        return block
+
+    def rule_counts(self):
+        """(hits, scam hits) per rule."""
+        n = len(self.rules)
+        scam = self.labels[self.row_of_hit()].astype(bool)
+        cols = np.asarray(self.indices)
+        return np.bincount(cols, minlength=n), np.bincount(cols[scam], minlength=n)
+
+    def cooccurrence(self, chunk_rows=65536):
+        """rules × rules counts of messages where both rules fired (diagonal: each rule's hits)."""
+        n = len(self.rules)
+        out = np.zeros((n, n), dtype=np.int64)
+        for start in range(0, len(self.labels), chunk_rows):
+            block = self.dense(start, min(start + chunk_rows, len(self.labels))).astype(np.int32)
+            out += block.T @ block
+        return out
+
+# ─── Main ────────────────────────────────────────────────────────────────────
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize a sparse hit matrix exported by batch_test --export-hits.")
+    parser.add_argument("path")
+    parser.add_argument("--top", type=int, default=REPORT_TOP, help="rules to list, most hits first")
+    args = parser.parse_args()
+
+    m = HitMatrix(args.path)
+    rows, n_rules = m.shape
+    on_disk, dense = export_sizes(args.path)
+    print(f"{rows:,} rows × {n_rules} rules, {len(m.indices):,} hits "
+          f"({on_disk / 1e6:.2f} MB on disk, dense bool {dense / 1e6:.2f} MB)")
+    for code, name in enumerate(m.datasets):
+        sel = np.asarray(m.dataset) == code
+        print(f"  {name:<48} {int(sel.sum()):>9,} rows  {int(np.asarray(m.labels)[sel].sum()):>9,} scam")
+    hits, scam = m.rule_counts()
+    print(f"\n{'Rule':<40} {'Hits':>8} {'Scam':>8} {'Precision':>9}")
+    for j in np.argsort(-hits, kind="stable")[:args.top]:
+        if not hits[j]:
+            break
+        print(f"{m.rules[j]['id']:<40} {hits[j]:>8,} {scam[j]:>8,} {scam[j] / hits[j]:>9.3f}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+"""
+TrustChekr Detection Engine - Near-Duplicate Clustering
+The scam corpora repeat the same templates thousands of times with only a
+name, number or link changed, which multiplies scan cost and lets one
+template dominate precision and recall. This clusters messages whose
+normalized text (lowercased, digits, links and addresses masked) is nearly
+the same, in one streaming pass:
+
+  - exact duplicates of a normalized text join its cluster by hash,
+  - the rest get a MinHash signature over byte shingles, and LSH bands over
+    the signature find earlier cluster representatives to compare with;
+    a message joins the most similar one with estimated Jaccard ≥ threshold
+    or starts a new cluster.
+
+Only representatives are kept (with per-label member counts), and at most
+max_clusters are indexed, so the index's memory is bounded by the number of
+templates (up to max_clusters) rather than rows. Past the cap, new messages
+pass through as singleton clusters: they are kept for scoring, but not
+indexed or counted per cluster. batch_test.py --dedup scores one
+representative per cluster and reports raw (per message) and
+cluster-weighted metrics.
+
+Usage: python near_dup.py [--threshold 0.8]   (clusters every text dataset in downloads/)
+       python near_dup.py --selftest
+"""
+
+import re, sys, time, argparse
+
+import numpy as np
+import pandas as pd
+
+JACCARD = 0.8             # estimated similarity to join a cluster
+NUM_PERM = 64
+BANDS = 16                # LSH bands of NUM_PERM // BANDS rows: candidates from ~0.5 similarity up
+SHINGLE = 5               # bytes per shingle
+MAX_CHARS = 2000          # of each message compared
+MAX_CLUSTERS = 1_000_000  # representatives indexed; later new clusters stay singletons
+BATCH_SHINGLES = 1 << 16
+REPORT_TOP = 10
+
+_URL = re.compile(r"(?:https?://|www\.)\S+")
+_EMAIL = re.compile(r"\S+@\S+")
+_DIGITS = re.compile(r"\d+")
+_NON_WORD = re.compile(r"[\W_]+")
+
+_MULT = np.uint64(0x100000001B3)
+_rng = np.random.default_rng(42)
+_PERM_A = _rng.integers(1, 2**63, NUM_PERM, dtype=np.uint64) | np.uint64(1)
+_PERM_B = _rng.integers(0, 2**63, NUM_PERM, dtype=np.uint64)
+
+# ─── Signatures ──────────────────────────────────────────────────────────────
+
+def normalize(text):
+    """Text with the parts templates vary on masked, for comparison."""
+    if not isinstance(text, str):
+        return ""
+    text = _EMAIL.sub(" email ", _URL.sub(" url ", text[:MAX_CHARS].lower()))
+    return _NON_WORD.sub(" ", _DIGITS.sub("0", text)).strip()
+
+def _mix(z):
+    """splitmix64 finalizer (uint64 arrays wrap on overflow)."""
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+def shingle_hashes(texts):
+    """(hashes, counts): every text's SHINGLE-byte shingle hashes, concatenated; texts shorter than SHINGLE get one."""
+    if not texts:
+        return np.empty(0, dtype=np.uint64), np.empty(0, dtype=np.int64)
+    encoded = [t.encode("utf-8") for t in texts]
+    pad = b"\0" * (SHINGLE - 1)
+    lengths = np.fromiter((len(b) for b in encoded), dtype=np.int64, count=len(encoded))
+    buf = np.frombuffer(b"".join(b + pad for b in encoded) + pad, dtype=np.uint8).astype(np.uint64)
+    windows = len(buf) - SHINGLE + 1
+    h = np.zeros(windows, dtype=np.uint64)
+    for k in range(SHINGLE):
+        h = h * _MULT + buf[k:k + windows]
+    offsets = np.concatenate([[0], np.cumsum(lengths + SHINGLE - 1)[:-1]])
+    counts = np.maximum(lengths - SHINGLE + 1, 1)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    pos = np.arange(counts.sum()) + np.repeat(offsets - starts, counts)
+    return _mix(h[pos]), counts
+
+def signatures(texts):
+    """texts × NUM_PERM MinHash signatures of normalized texts."""
+    if not texts:
+        return np.empty((0, NUM_PERM), dtype=np.uint64)
+    hashes, counts = shingle_hashes(texts)
+    bounds = np.concatenate([[0], np.cumsum(counts)])
+    sig = np.empty((len(texts), NUM_PERM), dtype=np.uint64)
+    i = 0
+    while i < len(texts):
+        j = max(i + 1, int(np.searchsorted(bounds, bounds[i] + BATCH_SHINGLES, side="right")) - 1)
+        x = hashes[bounds[i]:bounds[j]]
+        sig[i:j] = np.minimum.reduceat(_PERM_A[:, None] * x + _PERM_B[:, None], bounds[i:j] - bounds[i], axis=1).T
+        i = j
+    return sig
+
+def band_keys(sig):
+    """texts × BANDS bucket keys, one per LSH band of the signatures."""
+    bands = sig.reshape(len(sig), BANDS, NUM_PERM // BANDS)
+    key = np.zeros(bands.shape[:2], dtype=np.uint64)
+    for r in range(bands.shape[2]):
+        key = key * _MULT + bands[:, :, r]
+    return _mix(key)
+
+# ─── Index ───────────────────────────────────────────────────────────────────
+
+class NearDupIndex:
+    """Online near-duplicate clusters; add() assigns each message a cluster id in arrival order."""
+
+    def __init__(self, threshold=JACCARD, max_clusters=MAX_CLUSTERS):
+        self.threshold = threshold
+        self.max_clusters = max_clusters
+        self.buckets = [{} for _ in range(BANDS)]   # band key -> first indexed cluster
+        self.exact = {}                             # normalized text hash -> cluster
+        self.reps = np.empty((min(1024, max_clusters), NUM_PERM), dtype=np.uint64)
+        self.members = np.zeros((min(1024, max_clusters), 2), dtype=np.int64)   # per indexed cluster: legit, scam
+        self.clusters = 0
+        self.rows = self.exact_dups = self.near_dups = 0
+        self.seconds = 0.0
+
+    def add(self, texts, labels):
+        """(cluster id per message, does it start a new cluster) for one block of messages."""
+        t0 = time.perf_counter()
+        norm = [normalize(t) for t in texts]
+        keys = [hash(t) for t in norm]
+        unseen = {}
+        for i, k in enumerate(keys):
+            if k not in self.exact and k not in unseen:
+                unseen[k] = i
+        first = list(unseen.values())
+        sig = signatures([norm[i] for i in first])
+        bands = band_keys(sig).tolist()
+        row_of = {k: r for r, k in enumerate(unseen)}
+
+        ids = np.empty(len(keys), dtype=np.int64)
+        new = np.zeros(len(keys), dtype=bool)
+        for i, k in enumerate(keys):
+            c = self.exact.get(k)
+            if c is not None:
+                self.exact_dups += 1
+            else:
+                r = row_of[k]
+                c = self._nearest(sig[r], bands[r])
+                if c is None:
+                    c = self._new_cluster(sig[r], bands[r])
+                    new[i] = True
+                else:
+                    self.near_dups += 1
+                if len(self.exact) < self.max_clusters:
+                    self.exact[k] = c
+            ids[i] = c
+        indexed = self.indexed()
+        if indexed > len(self.members):
+            grown = np.zeros((min(max(indexed, 2 * len(self.members)), self.max_clusters), 2), dtype=np.int64)
+            grown[:len(self.members)] = self.members
+            self.members = grown
+        counted = ids < self.max_clusters    # clusters past the cap are singletons, not counted here
+        np.add.at(self.members, (ids[counted], np.asarray(labels, dtype=bool).astype(int)[counted]), 1)
+        self.rows += len(keys)
+        self.seconds += time.perf_counter() - t0
+        return ids, new
+
+    def _nearest(self, sig, bands):
+        best, best_sim = None, self.threshold
+        seen = set()
+        for b, key in enumerate(bands):
+            c = self.buckets[b].get(key)
+            if c is None or c in seen:
+                continue
+            seen.add(c)
+            sim = np.count_nonzero(self.reps[c] == sig) / NUM_PERM
+            if sim >= best_sim and (best is None or sim > best_sim):
+                best, best_sim = c, sim
+        return best
+
+    def _new_cluster(self, sig, bands):
+        c = self.clusters
+        self.clusters += 1
+        if c < self.max_clusters:
+            if c >= len(self.reps):
+                self.reps = np.concatenate([self.reps, np.empty_like(self.reps)])
+            self.reps[c] = sig
+            for b, key in enumerate(bands):
+                self.buckets[b].setdefault(key, c)
+        return c
+
+    def indexed(self):
+        """Clusters with a representative in the index and member counts (the first max_clusters)."""
+        return min(self.clusters, self.max_clusters)
+
+    def stats(self):
+        members = self.members[:self.indexed()]
+        return {"rows": self.rows, "clusters": self.clusters, "exact": self.exact_dups, "near": self.near_dups,
+                "mixed": int((members > 0).all(axis=1).sum()), "largest": int(members.sum(axis=1).max(initial=0)),
+                "threshold": self.threshold, "seconds": self.seconds}
+
+def deduplicate(frames, text_col, label_col, threshold=JACCARD, max_clusters=MAX_CLUSTERS):
+    """
+    One pass over an iterable of frames: (representative rows in cluster
+    order with dup_legit / dup_scam member counts, NearDupIndex.stats()).
+    """
+    index = NearDupIndex(threshold, max_clusters)
+    kept = []
+    for df in frames:
+        labels = df[label_col].astype(int).to_numpy() != 0
+        _, new = index.add(df[text_col].tolist(), labels)
+        kept.append(df[new])
+    reps = pd.concat(kept, ignore_index=True) if kept else pd.DataFrame(columns=[text_col, label_col])
+    n = index.indexed()
+    members = index.members[:n]
+    scam = reps[label_col].astype(int).to_numpy()[n:] != 0     # singletons past max_clusters
+    reps["dup_legit"] = np.concatenate([members[:, 0], (~scam).astype(np.int64)])
+    reps["dup_scam"] = np.concatenate([members[:, 1], scam.astype(np.int64)])
+    return reps, index.stats()
+
+# ─── Metrics ─────────────────────────────────────────────────────────────────
+
+def weighted_counts(detected, members):
+    """
+    Confusion counts of scored representatives spread over their clusters:
+    raw counts each member once (with its own label, the representative's
+    verdict); cluster-weighted counts each cluster once, split by label.
+    """
+    members = np.asarray(members, dtype=float)
+    detected = np.asarray(detected, dtype=bool)
+    legit, scam = members[:, 0], members[:, 1]
+    size = np.maximum(legit + scam, 1)
+
+    def counts(l, s):
+        return np.array([s[detected].sum(), l[detected].sum(), s[~detected].sum(), l[~detected].sum()])
+    return {"dedup_raw": counts(legit, scam), "dedup_cluster": counts(legit / size, scam / size)}
+
+def dedup_section(results, compute_metrics):
+    """Markdown lines of the Near-Duplicate Clusters section for batch_test results carrying "dedup" stats."""
+    results = [r for r in results if r.get("dedup") is not None]
+    if not results:
+        return []
+    threshold = results[0]["dedup"]["threshold"]
+    lines = ["\n## Near-Duplicate Clusters\n",
+             f"Messages were clustered by MinHash/LSH ({NUM_PERM} permutations, {BANDS} bands, {SHINGLE}-byte "
+             f"shingles of the text with digits, links and addresses masked) at estimated Jaccard ≥ {threshold:.2f}, "
+             "and one representative per cluster was scored. **Raw** metrics count every message with its "
+             "representative's verdict; **cluster-weighted** metrics count each cluster once.\n",
+             "| Dataset | Messages | Clusters | Exact Dups | Near Dups | Largest | Mixed-Label | Dedup Time |",
+             "|---------|----------|----------|------------|-----------|---------|-------------|------------|"]
+    for r in results:
+        s = r["dedup"]
+        lines.append(f"| {r['name']} | {s['rows']:,} | {s['clusters']:,} | {s['exact']:,} | {s['near']:,} | "
+                     f"{s['largest']:,} | {s['mixed']:,} | {s['seconds']:.1f}s |")
+    lines.append("\n| Dataset | Weighting | Scored | Precision | Recall | F1 |")
+    lines.append("|---------|-----------|--------|-----------|--------|----|")
+    for r in results:
+        raw = compute_metrics(*r["dedup_raw"])
+        cluster = compute_metrics(*r["dedup_cluster"])
+        lines.append(f"| {r['name']} | representatives | {r['total']:,} | {r['precision']:.3f} | {r['recall']:.3f} | {r['f1']:.3f} |")
+        lines.append(f"| {r['name']} | raw | {int(raw['total']):,} | {raw['precision']:.3f} | {raw['recall']:.3f} | {raw['f1']:.3f} |")
+        lines.append(f"| {r['name']} | cluster-weighted | {cluster['total']:,.0f} | {cluster['precision']:.3f} | "
+                     f"{cluster['recall']:.3f} | {cluster['f1']:.3f} |")
+    return lines
+
+# ─── Self-Test ───────────────────────────────────────────────────────────────
+
+def selftest():
+    """
+    The same block fed twice (the second is all exact duplicates: no new
+    signatures), an empty block, and a max_clusters cap, on generated
+    template messages.
+    """
+    rng = np.random.default_rng(7)
+    words = "account verify click refund parcel held fee lunch tomorrow meeting report invoice".split()
+    templates = [" ".join(rng.choice(words, 12)) for _ in range(40)]
+    texts = [f"{templates[i % 40]} ref {i} at https://x{i}.example/p" for i in range(400)]
+    labels = np.arange(400) % 3 == 0
+    failures = []
+
+    def expect(what, ok):
+        print(f"  {'ok  ' if ok else 'FAIL'} {what}")
+        if not ok:
+            failures.append(what)
+
+    index = NearDupIndex()
+    first, new = index.add(texts, labels)
+    again, new_again = index.add(texts, labels)
+    expect(f"block fed twice: {index.clusters} clusters, same ids, nothing new the second time",
+           (first == again).all() and not new_again.any() and index.exact_dups >= len(texts))
+    ids, new = index.add([], [])
+    expect("empty block", len(ids) == 0 and len(new) == 0)
+    expect("member counts cover every row", int(index.members[:index.indexed()].sum()) == 2 * len(texts))
+
+    frame = pd.DataFrame({"text": texts, "is_scam": labels.astype(int)})
+    reps, stats = deduplicate([frame, frame], "text", "is_scam", max_clusters=5)
+    expect(f"max_clusters=5: {len(reps)} representatives, index holds {len(NearDupIndex(max_clusters=5).members)} rows",
+           int((reps["dup_legit"] + reps["dup_scam"]).sum()) == 2 * len(texts) and stats["clusters"] == len(reps))
+    return 1 if failures else 0
+
+# ─── Main ────────────────────────────────────────────────────────────────────
+
+def main():
+    parser = argparse.ArgumentParser(description="Cluster near-duplicate messages in every downloaded text dataset.")
+    parser.add_argument("--threshold", type=float, default=JACCARD, help="estimated Jaccard to join a cluster")
+    parser.add_argument("--top", type=int, default=REPORT_TOP, help="largest clusters to show per dataset")
+    parser.add_argument("--selftest", action="store_true", help="check the index on generated messages instead")
+    args = parser.parse_args()
+    if args.selftest:
+        return selftest()
+
+    import batch_test as bt
+    for name, path, read in bt.text_sources():
+        try:
+            reps, stats = deduplicate([read()], "text", "is_scam", args.threshold)
+        except Exception as e:
+            print(f"  ⚠️ {name}: {e}")
+            continue
+        print(f"\n{name}: {stats['rows']:,} messages → {stats['clusters']:,} clusters "
+              f"({stats['exact']:,} exact, {stats['near']:,} near duplicates, {stats['mixed']:,} mixed-label) "
+              f"in {stats['seconds']:.1f}s")
+        size = reps["dup_legit"] + reps["dup_scam"]
+        for k in np.argsort(-size.to_numpy(), kind="stable")[:args.top]:
+            if size.iloc[k] < 2:
+                break
+            text = str(reps["text"].iloc[k]).replace("\n", " ")[:80]
+            print(f"  {size.iloc[k]:>7,}  scam {reps['dup_scam'].iloc[k]:>7,}  {text}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+TrustChekr Detection Engine - Literal Prefilter
+Pulls the literal anchors every match of a rule must contain (e.g. "warrant for
+your arrest", "interac") and finds all of them with one combined pass per
+message. Only rules whose anchors were seen are verified with their full regex.
+"""
+
+import re
+
+try:
+    from re import _parser as sre_parse
+    from re._casefix import _EXTRA_CASES
+    _CASE_CLASSES = [(lo,) + extra for lo, extra in _EXTRA_CASES.items()]
+except ImportError:  # Python < 3.11
+    import sre_parse
+    from sre_compile import _equivalences as _CASE_CLASSES
+
+MIN_ANCHOR_LEN = 3
+
+# Case folding that agrees with re.IGNORECASE: simple lowercase ("İ" would
+# otherwise expand to two chars) plus the engine's own equivalence classes
+# (i/ı, s/ſ, σ/ς, ...), so a folded anchor is always found in folded text.
+_PRE_FOLD = {0x130: "i"}
+_POST_FOLD = {c: chr(min(cls)) for cls in _CASE_CLASSES for c in cls if c != min(cls)}
+
+def fold(text):
+    """Fold text for case-sensitive anchor search."""
+    if text.isascii():
+        return text.lower()
+    return text.translate(_PRE_FOLD).lower().translate(_POST_FOLD)
+
+# ─── Anchor Extraction ───────────────────────────────────────────────────────
+
+def _literal_char(item):
+    """Return the character an item always matches, or None."""
+    op, av = item
+    if op is sre_parse.LITERAL:
+        return chr(av)
+    if op is sre_parse.IN and len(av) == 1 and av[0][0] is sre_parse.LITERAL:
+        return chr(av[0][1])
+    return None
+
+def _best(candidates):
+    """Pick the anchor set whose shortest anchor is longest (fewest false candidates)."""
+    candidates = [c for c in candidates if c]
+    if not candidates:
+        return None
+    return max(candidates, key=lambda c: (min(len(a) for a in c), -len(c)))
+
+def _requirements(seq):
+    """
+    Requirements for a parsed sequence: a list of anchor sets such that any
+    text the sequence matches contains at least one anchor from every set.
+    """
+    reqs = []
+    run = []
+
+    def flush():
+        if run:
+            reqs.append(frozenset([fold("".join(run))]))
+            run.clear()
+
+    for item in seq:
+        op, av = item
+        ch = _literal_char(item)
+        if ch is not None:
+            run.append(ch)
+            continue
+        if op is sre_parse.SUBPATTERN:
+            sub = list(av[-1])
+            chars = [_literal_char(i) for i in sub]
+            if sub and None not in chars:
+                run.extend(chars)
+                continue
+            flush()
+            reqs.extend(_requirements(sub))
+        elif op is sre_parse.BRANCH:
+            flush()
+            branches = [_best(_requirements(b)) for b in av[1]]
+            if all(branches):
+                reqs.append(frozenset().union(*branches))
+        elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT,
+                    getattr(sre_parse, "POSSESSIVE_REPEAT", None)):
+            flush()
+            if av[0] >= 1:
+                reqs.extend(_requirements(av[2]))
+        elif op is sre_parse.ASSERT:
+            flush()
+            reqs.extend(_requirements(av[1]))
+        elif op is getattr(sre_parse, "ATOMIC_GROUP", None):
+            flush()
+            reqs.extend(_requirements(av))
+        else:
+            # ANY, classes, \b/^/$, negative lookarounds, backrefs: no literal guarantee
+            flush()
+    flush()
+    return reqs
+
+def extract_requirements(pattern):
+    """
+    Return the anchor sets (folded) a regex source needs, strongest first.
+    Sets whose shortest anchor is under MIN_ANCHOR_LEN are dropped as too common
+    to be worth checking; an empty list means the rule must always be verified.
+    """
+    try:
+        parsed = sre_parse.parse(pattern, re.IGNORECASE)
+    except re.error:
+        return []
+    reqs = {r for r in _requirements(list(parsed)) if min(len(a) for a in r) >= MIN_ANCHOR_LEN}
+    return sorted(reqs, key=lambda r: (-min(len(a) for a in r), sorted(r)))
+
+# ─── Prefilter ───────────────────────────────────────────────────────────────
+
+class RulePrefilter:
+    """
+    Prefilter-plus-verify matcher over the pattern dicts from load_text_patterns().
+    A rule is a candidate when every one of its anchor sets has a hit; rules
+    with no extractable anchor are always verified.
+    """
+
+    def __init__(self, patterns):
+        self.patterns = patterns
+        self.always = []
+        self.requirements = []
+        rules_by_anchor = {}
+        for i, p in enumerate(patterns):
+            # The rule index ships precomputed requirements; fall back to parsing
+            reqs = p.get("requirements")
+            if reqs is None:
+                reqs = extract_requirements(p["regex"].pattern)
+            self.requirements.append(reqs)
+            if not reqs:
+                self.always.append(i)
+            for r in reqs:
+                for a in r:
+                    rules_by_anchor.setdefault(a, set()).add(i)
+
+        # Longest first, so the anchor reported at a position is the longest one
+        # starting there; every anchor contained in it is implied present too.
+        self.anchors = sorted(rules_by_anchor, key=lambda a: (-len(a), a))
+        self._implied = {a: frozenset(b for b in self.anchors if b in a) for a in self.anchors}
+        self._rules_for = {a: frozenset().union(*(rules_by_anchor[b] for b in self._implied[a]))
+                           for a in self.anchors}
+
+        # Scanning folded text case-sensitively is several times faster than
+        # an IGNORECASE alternation over the raw message.
+        self._scan = None
+        if self.anchors:
+            self._scan = re.compile("|".join(re.escape(a) for a in self.anchors))
+
+    def _hits(self, text):
+        """Set of anchors present in text."""
+        text = fold(text)
+        hits = set()
+        pos = 0
+        while True:
+            m = self._scan.search(text, pos)
+            if m is None:
+                return hits
+            a = m.group()
+            if a not in hits:
+                hits |= self._implied[a]
+            # Restart one char later so overlapping anchors are not missed
+            pos = m.start() + 1
+
+    def candidates(self, text):
+        """Indices (in pattern order) of rules that need their full regex run."""
+        found = set(self.always)
+        if self._scan is not None:
+            hits = self._hits(text)
+            touched = set()
+            for a in hits:
+                touched |= self._rules_for.get(a, ())
+            for i in touched:
+                if all(not r.isdisjoint(hits) for r in self.requirements[i]):
+                    found.add(i)
+        return sorted(found)
+
+    def match(self, text):
+        """Returns (matched categories, number of regexes not run) for one message."""
+        if not isinstance(text, str) or not text.strip():
+            return [], len(self.patterns)
+        idx = self.candidates(text)
+        matches = [self.patterns[i]["category"] for i in idx if self.patterns[i]["regex"].search(text)]
+        return matches, len(self.patterns) - len(idx)
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+TrustChekr Detection Engine - Incremental Result Cache
+Persists one packed hit bitmap per (rule regex, block of dataset rows), so a
+rerun after editing a rule only rescans the datasets with new or changed
+rules; confusion matrices are recomputed from the cached bitmaps.
+
+A block is a whole sampled dataset, or one chunk of a streamed one. Its key
+covers the dataset file's content hash plus everything that decides which
+rows it holds (text column, row cap, chunking).
+"""
+
+import os, hashlib
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[2]  # trustchekr-app/
+HITS_DIR = ROOT / "test-data" / ".cache" / "hits"
+
+_file_digests = {}
+
+def file_digest(path):
+    """Content hash of a dataset file, read in blocks and memoized per (size, mtime)."""
+    st = os.stat(path)
+    memo = (str(path), st.st_size, st.st_mtime_ns)
+    if memo not in _file_digests:
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        _file_digests[memo] = h.hexdigest()
+    return _file_digests[memo]
+
+def block_key(path, *parts):
+    """Key for a block of rows drawn from a dataset file."""
+    h = hashlib.sha256(file_digest(path).encode())
+    for part in parts:
+        h.update(b"\0" + str(part).encode())
+    return h.hexdigest()[:24]
+
+def rule_key(pattern):
+    """Key for a rule's matching behaviour: its regex source and flags, not its category or weight."""
+    regex = pattern["regex"]
+    return hashlib.sha256(f"{regex.flags}:{regex.pattern}".encode()).hexdigest()[:24]
+
+class HitCache:
+    """Packed (np.packbits) hit bitmaps for one block of rows, one .npy file per rule."""
+
+    def __init__(self, key, cache_dir=HITS_DIR):
+        self.dir = Path(cache_dir) / key
+
+    def _path(self, pattern):
+        return self.dir / f"{rule_key(pattern)}.npy"
+
+    def lookup(self, patterns, n_rows):
+        """Returns (rows × rules hit matrix filled from the cache, indices of rules not cached)."""
+        hits = np.zeros((n_rows, len(patterns)), dtype=bool)
+        missing = []
+        for j, p in enumerate(patterns):
+            try:
+                packed = np.load(self._path(p))
+            except (OSError, ValueError):
+                missing.append(j)
+                continue
+            if packed.size != (n_rows + 7) // 8:
+                missing.append(j)
+                continue
+            hits[:, j] = np.unpackbits(packed, count=n_rows).astype(bool)
+        return hits, missing
+
+    def store(self, patterns, idx, columns):
+        """Save hit columns for patterns[idx] (columns has one column per index)."""
+        self.dir.mkdir(parents=True, exist_ok=True)
+        for k, j in enumerate(idx):
+            path = self._path(patterns[j])
+            tmp = path.with_name(f"{path.stem}.tmp{os.getpid()}")
+            with open(tmp, "wb") as f:
+                np.save(f, np.packbits(columns[:, k]))
+            os.replace(tmp, path)
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+TrustChekr Detection Engine - Rule Pack Index
+Builds a normalized index of every pattern and domain rule under RULES_DIR
+(id, category, weight, source file, region, channels, compile status,
+prefilter anchors) and persists it under CACHE_DIR keyed by a hash of the
+rule files and of prefilter.py (the anchors are its output), so later runs
+and worker processes reuse it instead of re-parsing the rule packs.
+
+Usage: python rule_index.py [--rebuild]
+"""
+
+import json, re, os, glob, sys, hashlib, argparse
+from pathlib import Path
+
+import prefilter
+from prefilter import extract_requirements
+
+ROOT = Path(__file__).resolve().parents[2]  # trustchekr-app/
+RULES_DIR = ROOT / "src" / "lib" / "ai-detection" / "rules"
+CACHE_DIR = ROOT / "test-data" / ".cache"
+INDEX_VERSION = 2
+
+# ─── Hashing ─────────────────────────────────────────────────────────────────
+
+def rule_files(rules_dir=RULES_DIR):
+    return sorted(glob.glob(str(Path(rules_dir) / "**" / "*.json"), recursive=True))
+
+def file_hash(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+PREFILTER_HASH = file_hash(prefilter.__file__)  # a new anchor extractor invalidates every cached index
+
+def combine_hashes(files):
+    """Rules hash of (path relative to RULES_DIR, file hash) pairs in rule_files order."""
+    h = hashlib.sha256(f"v{INDEX_VERSION}:{PREFILTER_HASH}".encode())
+    for rel, digest in files:
+        h.update(rel.encode())
+        h.update(digest.encode())
+    return h.hexdigest()
+
+def rules_hash(rules_dir=RULES_DIR):
+    """Hash of every rule file's path and content (plus the index format version and prefilter.py)."""
+    return combine_hashes((os.path.relpath(jf, rules_dir), file_hash(jf)) for jf in rule_files(rules_dir))
+
+# ─── Building ────────────────────────────────────────────────────────────────
+
+def region_of(path, rules_dir=RULES_DIR):
+    """ca / us / mx / shared — the first directory under RULES_DIR."""
+    return Path(os.path.relpath(path, rules_dir)).parts[0]
+
+def index_rule_file(jf, rules_dir=RULES_DIR):
+    """Normalized entries for the patterns and domains of one rule file."""
+    with open(jf) as f:
+        data = json.load(f)
+    entries = []
+    for kind, key in (("text", "patterns"), ("domain", "domains")):
+        for r in data.get(key, []):
+            entry = {
+                "id": r.get("id", ""),
+                "kind": kind,
+                "pattern": r.get("pattern", ""),
+                "category": r.get("category", "UNKNOWN"),
+                "weight": r.get("weight", 1),
+                "source": os.path.relpath(jf, ROOT),
+                "region": region_of(jf, rules_dir),
+                "channels": r.get("channels"),   # None: every channel
+                "compiled": True,
+                "error": None,
+            }
+            try:
+                re.compile(entry["pattern"], re.IGNORECASE)
+            except re.error as e:
+                entry["compiled"] = False
+                entry["error"] = str(e)
+            if kind == "text" and entry["compiled"]:
+                entry["requirements"] = [sorted(req) for req in extract_requirements(entry["pattern"])]
+            entries.append(entry)
+    return entries
+
+def assemble_index(files):
+    """
+    Index of (relative path, file hash, entries) triples in rule_files order.
+    "files" records each file's hash and entry count, so a reader can
+    recompile file by file.
+    """
+    files = list(files)
+    return {"version": INDEX_VERSION, "hash": combine_hashes((rel, digest) for rel, digest, _ in files),
+            "files": [[rel, digest, len(entries)] for rel, digest, entries in files],
+            "rules": [e for _, _, entries in files for e in entries]}
+
+def build_rule_index(rules_dir=RULES_DIR):
+    return assemble_index((os.path.relpath(jf, rules_dir), file_hash(jf), index_rule_file(jf, rules_dir))
+                          for jf in rule_files(rules_dir))
+
+# ─── Cache ───────────────────────────────────────────────────────────────────
+
+def index_path(digest, cache_dir=CACHE_DIR):
+    return Path(cache_dir) / f"rule_index-{digest[:16]}.json"
+
+def load_rule_index(rules_dir=RULES_DIR, cache_dir=CACHE_DIR, rebuild=False, digest=None):
+    """
+    Return the rule index for the current rule files, building and persisting
+    it on a miss. A digest already computed by this run (e.g. passed to a
+    worker) skips rehashing the rule files.
+    """
+    digest = digest or rules_hash(rules_dir)
+    path = index_path(digest, cache_dir)
+    if not rebuild and path.exists():
+        try:
+            with open(path) as f:
+                index = json.load(f)
+            if index.get("hash") == digest:
+                return index
+        except (OSError, ValueError):
+            pass
+    index = build_rule_index(rules_dir)
+    save_rule_index(index, cache_dir)
+    return index
+
+def save_rule_index(index, cache_dir=CACHE_DIR):
+    path = index_path(index["hash"], cache_dir)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f".tmp{os.getpid()}")
+    tmp.write_text(json.dumps(index))
+    os.replace(tmp, path)  # atomic, so concurrent workers never read a partial file
+    return path
+
+def compiled_patterns(index, kind="text"):
+    """Pattern dicts (as load_text_patterns returns them) for every rule of a kind that compiles."""
+    patterns = []
+    for r in index["rules"]:
+        if r["kind"] != kind or not r["compiled"]:
+            continue
+        p = {
+            "regex": re.compile(r["pattern"], re.IGNORECASE),
+            "category": r["category"],
+            "weight": r["weight"],
+            "id": r["id"],
+            "source": r["source"],
+            "region": r["region"],
+        }
+        if r.get("channels"):
+            p["channels"] = r["channels"]
+        if "requirements" in r:
+            p["requirements"] = [frozenset(a) for a in r["requirements"]]
+        patterns.append(p)
+    return patterns
+
+def failed_rules(index):
+    """Rules whose regex did not compile."""
+    return [r for r in index["rules"] if not r["compiled"]]
+
+# ─── Main ────────────────────────────────────────────────────────────────────
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or inspect the cached rule index.")
+    parser.add_argument("--rebuild", action="store_true", help="ignore any cached index")
+    args = parser.parse_args()
+
+    index = load_rule_index(rebuild=args.rebuild)
+    print(f"Rule index {index['hash'][:16]}: {len(index['rules'])} rules")
+    counts = {}
+    for r in index["rules"]:
+        key = (r["region"], r["kind"])
+        counts[key] = counts.get(key, 0) + 1
+    for (region, kind), n in sorted(counts.items()):
+        print(f"  {region:<8} {kind:<7} {n}")
+    failed = failed_rules(index)
+    for r in failed:
+        print(f"  FAILED {r['id']} ({r['source']}): {r['error']}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
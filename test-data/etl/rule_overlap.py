@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+TrustChekr Detection Engine - Rule Overlap Analyzer
+Pairwise overlap of the text rules' hit sets. Each rule's hits over a block
+of messages are packed into a bitset, and |A ∩ B| comes from popcounts of
+the ANDed words. Intersection counts add across blocks, so batch_test folds
+one rules × rules matrix per shard like its other counts.
+
+From the totals: Jaccard similarity per pair, rules that never fired, and
+rules subsumed by another rule (every message they matched, the other
+matched too), so they add nothing to any-match detection on these corpora.
+Removing both kinds saves their regex time in the extension, which runs
+every rule on every message; the gain is estimated from per-rule timings.
+
+Usage: python rule_overlap.py HITS_DIR   (an export from batch_test.py --export-hits)
+"""
+
+import sys, argparse
+
+import numpy as np
+
+JACCARD_MIN = 0.5        # pairs listed from this similarity up
+REPORT_TOP = 20
+TIMING_ROWS = 2000       # messages each rule is timed on for the throughput estimate
+
+if hasattr(np, "bitwise_count"):
+    _popcount = np.bitwise_count
+else:  # numpy < 2.0
+    _BYTE_BITS = np.array([bin(b).count("1") for b in range(256)], dtype=np.uint8)
+
+    def _popcount(words):
+        return _BYTE_BITS[words.view(np.uint8)].reshape(*words.shape, 8).sum(axis=-1)
+
+# ─── Bitsets ─────────────────────────────────────────────────────────────────
+
+def rule_bitsets(hits):
+    """rules × words uint64 bitsets of a rows × rules hit matrix."""
+    packed = np.packbits(hits, axis=0).T            # rules × ceil(rows / 8) bytes
+    pad = -packed.shape[1] % 8
+    if pad:
+        packed = np.pad(packed, ((0, 0), (0, pad)))
+    return np.ascontiguousarray(packed).view(np.uint64)
+
+def intersections(hits):
+    """rules × rules |A ∩ B| over a block (diagonal: |A|), by popcount of ANDed bitsets."""
+    n = hits.shape[1]
+    out = np.zeros((n, n), dtype=np.int64)
+    active = np.flatnonzero(hits.any(axis=0))
+    if not len(active):
+        return out
+    bits = rule_bitsets(hits[:, active])
+    for k, j in enumerate(active):
+        out[j, active] = _popcount(bits[k] & bits).sum(axis=1)
+    return out
+
+# ─── Analysis ────────────────────────────────────────────────────────────────
+
+def jaccard(inter):
+    sizes = np.diag(inter)
+    union = sizes[:, None] + sizes[None, :] - inter
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(union > 0, inter / union, 0.0)
+
+def overlap_pairs(inter, patterns, min_jaccard=JACCARD_MIN):
+    """Rule pairs with Jaccard ≥ min_jaccard, most similar first."""
+    sim = jaccard(inter)
+    a, b = np.nonzero(np.triu(sim >= min_jaccard, k=1))
+    pairs = [{"a": patterns[i]["id"], "b": patterns[j]["id"], "jaccard": float(sim[i, j]),
+              "both": int(inter[i, j]), "a_hits": int(inter[i, i]), "b_hits": int(inter[j, j]),
+              "same_category": patterns[i]["category"] == patterns[j]["category"]} for i, j in zip(a, b)]
+    return sorted(pairs, key=lambda p: (-p["jaccard"], -p["both"], p["a"], p["b"]))
+
+def removable_rules(inter, patterns):
+    """
+    (never fired, subsumed) rule indices. Subsumed rules are picked greedily,
+    fewest hits first; of two rules with identical hit sets the first
+    declared is kept. A rule's coverer can itself be subsumed later in the
+    pass, so each is then followed to the kept rule that covers it (hit set
+    containment is transitive). Returns subsumed as [(rule, kept covering
+    rule)].
+    """
+    sizes = np.diag(inter)
+    never = [j for j in range(len(patterns)) if sizes[j] == 0]
+    removed = set(never)
+    subsumed = []
+    for j in sorted(np.flatnonzero(sizes), key=lambda j: (sizes[j], -j)):
+        covers = [k for k in np.flatnonzero(inter[j] == sizes[j])
+                  if k != j and k not in removed and (sizes[k] > sizes[j] or k < j)]
+        if covers:
+            k = min(covers, key=lambda k: (patterns[k]["category"] != patterns[j]["category"], -sizes[k], k))
+            subsumed.append((j, int(k)))
+            removed.add(j)
+    cover = dict(subsumed)
+    for n, (j, k) in enumerate(subsumed):
+        while k in cover:
+            k = cover[k]
+        subsumed[n] = (j, k)
+    return never, subsumed
+
+def throughput_gain(rule_ms, removed):
+    """Estimated speedup of scanning every rule once the removed ones are gone (0.25 = 25% more messages/s)."""
+    total = float(np.sum(rule_ms))
+    kept = total - float(np.sum(np.asarray(rule_ms)[list(removed)])) if removed else total
+    return total / kept - 1 if kept > 0 else 0.0
+
+def time_rules(texts, patterns):
+    """Total search() milliseconds per rule over texts (every rule on every message, as the extension runs)."""
+    from rule_profile import time_rule
+    texts = [t for t in texts if isinstance(t, str)]
+    return np.array([time_rule(p["regex"], texts).sum() / 1000 for p in patterns])
+
+def analyze(inter, patterns, rule_ms=None, min_jaccard=JACCARD_MIN):
+    never, subsumed = removable_rules(inter, patterns)
+    result = {"pairs": overlap_pairs(inter, patterns, min_jaccard), "never": never, "subsumed": subsumed,
+              "sizes": np.diag(inter), "rule_ms": rule_ms, "min_jaccard": min_jaccard}
+    if rule_ms is not None:
+        removed = set(never) | {j for j, _ in subsumed}
+        result["gain"] = throughput_gain(rule_ms, removed)
+        result["removed_ms"] = float(np.sum(np.asarray(rule_ms)[list(removed)])) if removed else 0.0
+    return result
+
+# ─── Report ──────────────────────────────────────────────────────────────────
+
+def overlap_section(result, patterns, rows, timed_rows=None, top=REPORT_TOP):
+    """Markdown lines of the Rule Overlap section."""
+    never, subsumed, pairs, sizes = result["never"], result["subsumed"], result["pairs"], result["sizes"]
+    lines = ["\n## Rule Overlap\n",
+             f"Hit sets of {len(patterns)} text rules over {rows:,} messages, compared by bitset popcount. "
+             "A rule is subsumed when another kept rule matched every message it matched; removing subsumed "
+             "and never-firing rules leaves any-match detection on these corpora unchanged (weighted scores "
+             "and per-category counts can move).\n"]
+    lines.append(f"- Never fired: **{len(never)}** rules")
+    lines.append(f"- Subsumed: **{len(subsumed)}** rules")
+    lines.append(f"- Pairs with Jaccard ≥ {result['min_jaccard']:.2f}: **{len(pairs)}**")
+    if "gain" in result:
+        total = float(np.sum(result["rule_ms"]))
+        lines.append(f"- Regex time of removable rules: {result['removed_ms']:.1f} of {total:.1f} ms over "
+                     f"{timed_rows:,} messages (every rule on every message) → est. "
+                     f"**+{result['gain'] * 100:.1f}%** scan throughput")
+    if subsumed:
+        lines.append("\n| Subsumed Rule | Hits | Covered By | Hits | Same Category |")
+        lines.append("|---------------|------|------------|------|---------------|")
+        for j, k in subsumed[:top]:
+            same = "yes" if patterns[j]["category"] == patterns[k]["category"] else "no"
+            lines.append(f"| {patterns[j]['id']} | {sizes[j]:,} | {patterns[k]['id']} | {sizes[k]:,} | {same} |")
+    if pairs:
+        lines.append("\n| Rule A | Rule B | Jaccard | Both | A Hits | B Hits |")
+        lines.append("|--------|--------|---------|------|--------|--------|")
+        for p in pairs[:top]:
+            lines.append(f"| {p['a']} | {p['b']} | {p['jaccard']:.3f} | {p['both']:,} | {p['a_hits']:,} | {p['b_hits']:,} |")
+    if never:
+        shown = ", ".join(patterns[j]["id"] for j in never[:top * 2])
+        more = f" (+{len(never) - top * 2} more)" if len(never) > top * 2 else ""
+        lines.append(f"\nNever fired: {shown}{more}")
+    return lines
+
+# ─── Main ────────────────────────────────────────────────────────────────────
+
+def main():
+    parser = argparse.ArgumentParser(description="Rule overlap, subsumption and never-firing rules of a hit matrix export.")
+    parser.add_argument("hits", help="directory written by batch_test.py --export-hits")
+    parser.add_argument("--min-jaccard", type=float, default=JACCARD_MIN)
+    parser.add_argument("--top", type=int, default=REPORT_TOP)
+    args = parser.parse_args()
+
+    from hit_export import HitMatrix
+    m = HitMatrix(args.hits)
+    patterns = m.rules
+    inter = np.zeros((len(patterns), len(patterns)), dtype=np.int64)
+    for start in range(0, m.shape[0], 1 << 16):
+        inter += intersections(m.dense(start, min(start + (1 << 16), m.shape[0])))
+    result = analyze(inter, patterns, min_jaccard=args.min_jaccard)
+    print("\n".join(overlap_section(result, patterns, m.shape[0], top=args.top)))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
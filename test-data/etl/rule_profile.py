@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+TrustChekr Detection Engine - Rule Latency Profiler
+Times every rule's search() per message (p50/p99/max) and flags rules whose
+cost grows super-linearly with input length, using synthetic long inputs
+built from each rule's own literal anchors (the shape that makes ".*" chains
+backtrack). batch_test.py --profile-rules adds the results to the report.
+
+Usage: python rule_profile.py   (synthetic corpus only; exits 1 if any rule is flagged)
+"""
+
+import sys, time
+from itertools import combinations
+
+import numpy as np
+
+GROWTH_SIZES = (256, 1024, 4096, 16384)
+GROWTH_BUDGET_S = 0.1     # stop growing the input once one search takes this long
+SUPERLINEAR = 1.5         # log-log slope of search time vs input length
+MIN_FLAG_US = 1000        # ignore slopes of rules that stay this fast at the largest size
+REPORT_TOP = 20
+
+# ─── Corpus Timing ───────────────────────────────────────────────────────────
+
+def time_rule(regex, texts):
+    """Per-message search() time in microseconds."""
+    out = np.empty(len(texts))
+    search = regex.search
+    clock = time.perf_counter_ns
+    for i, t in enumerate(texts):
+        t0 = clock()
+        search(t)
+        out[i] = (clock() - t0) / 1000
+    return out
+
+def corpus_stats(times):
+    if not len(times):
+        return {"p50": 0.0, "p99": 0.0, "max": 0.0, "total_ms": 0.0}
+    return {"p50": float(np.percentile(times, 50)), "p99": float(np.percentile(times, 99)),
+            "max": float(times.max()), "total_ms": float(times.sum() / 1000)}
+
+# ─── Growth Test ─────────────────────────────────────────────────────────────
+
+def adversarial_inputs(pattern, size):
+    """
+    Long inputs made of a rule's anchors: each anchor alone, all of them, and
+    all but one requirement (a near-miss that never completes the match).
+    """
+    reqs = [sorted(r) for r in pattern.get("requirements") or []]
+    if not reqs:
+        return []
+    groups = [[a for r in reqs for a in r]]
+    groups += [[a] for r in reqs for a in r]
+    if len(reqs) > 1:
+        for keep in combinations(range(len(reqs)), len(reqs) - 1):
+            groups.append([a for k in keep for a in reqs[k]])
+    inputs = []
+    for g in groups:
+        unit = " ".join(g) + " x "
+        inputs.append((unit * (size // len(unit) + 1))[:size])
+    return inputs
+
+def worst_time(regex, inputs, repeats=3):
+    """Slowest input's best-of-repeats search time in microseconds (stops at the budget)."""
+    worst = 0.0
+    for text in inputs:
+        best = None
+        for _ in range(repeats):
+            t0 = time.perf_counter_ns()
+            regex.search(text)
+            dt = (time.perf_counter_ns() - t0) / 1000
+            best = dt if best is None else min(best, dt)
+            if dt > 10_000:  # slow enough that timer noise no longer matters
+                break
+        worst = max(worst, best)
+        if worst / 1e6 > GROWTH_BUDGET_S:
+            break
+    return worst
+
+def growth_test(pattern, sizes=GROWTH_SIZES):
+    """Returns {"sizes", "times_us", "exponent"}; exponent is None when no anchors are known."""
+    sizes_done, times = [], []
+    for size in sizes:
+        inputs = adversarial_inputs(pattern, size)
+        if not inputs:
+            break
+        t = worst_time(pattern["regex"], inputs)
+        sizes_done.append(size)
+        times.append(t)
+        if t / 1e6 > GROWTH_BUDGET_S:
+            break
+    exponent = None
+    if len(times) >= 2:
+        x = np.log(np.array(sizes_done, dtype=float))
+        y = np.log(np.maximum(np.array(times), 1e-3))
+        exponent = float(np.polyfit(x, y, 1)[0])
+    return {"sizes": sizes_done, "times_us": times, "exponent": exponent}
+
+def is_superlinear(growth):
+    return (growth["exponent"] is not None and growth["exponent"] > SUPERLINEAR
+            and growth["times_us"][-1] > MIN_FLAG_US)
+
+# ─── Profiling ───────────────────────────────────────────────────────────────
+
+def profile_rules(texts, patterns, growth=True):
+    """Per-rule corpus latency and growth results, slowest p99 first."""
+    texts = [t for t in texts if isinstance(t, str) and t.strip()]
+    results = []
+    for p in patterns:
+        r = {"id": p["id"], "source": p["source"]}
+        r.update(corpus_stats(time_rule(p["regex"], texts)))
+        if growth:
+            g = growth_test(p)
+            r["exponent"] = g["exponent"]
+            r["worst_us"] = g["times_us"][-1] if g["times_us"] else None
+            r["worst_size"] = g["sizes"][-1] if g["sizes"] else None
+            r["flagged"] = is_superlinear(g)
+        else:
+            r.update(exponent=None, worst_us=None, worst_size=None, flagged=False)
+        results.append(r)
+    results.sort(key=lambda r: (not r["flagged"], -r["p99"]))
+    return results
+
+def performance_section(results, n_texts, top=REPORT_TOP):
+    """Markdown lines for the "Rule Performance" report section."""
+    flagged = [r for r in results if r["flagged"]]
+    shown = flagged + [r for r in results if not r["flagged"]][:max(0, top - len(flagged))]
+    lines = ["\n## Rule Performance\n"]
+    lines.append(f"Per-message `search()` latency over {n_texts:,} messages; growth exponent is the log-log slope "
+                 f"of worst-case time on synthetic inputs of {', '.join(str(s) for s in GROWTH_SIZES)} chars "
+                 f"(> {SUPERLINEAR} is flagged).\n")
+    lines.append("| Rule | Source | p50 (µs) | p99 (µs) | Max (µs) | Total (ms) | Growth | Worst (µs @ chars) | |")
+    lines.append("|------|--------|----------|----------|----------|------------|--------|--------------------|-|")
+    for r in shown:
+        growth = f"{r['exponent']:.2f}" if r["exponent"] is not None else "n/a"
+        worst = f"{r['worst_us']:,.0f} @ {r['worst_size']:,}" if r["worst_us"] is not None else "n/a"
+        flag = "🔴 super-linear" if r["flagged"] else "✅"
+        lines.append(f"| {r['id']} | {r['source']} | {r['p50']:.1f} | {r['p99']:.1f} | {r['max']:.1f} | "
+                     f"{r['total_ms']:.1f} | {growth} | {worst} | {flag} |")
+    if len(results) > len(shown):
+        lines.append(f"\n{len(results) - len(shown)} faster rules not shown.")
+    if flagged:
+        lines.append(f"\n**{len(flagged)} rule(s) grow super-linearly with input length** — rewrite the `.*` "
+                     "chains (bounded `.{0,N}`, or split into separate rules) before shipping to the extension.")
+    return lines
+
+# ─── Main ────────────────────────────────────────────────────────────────────
+
+def main():
+    from batch_test import load_text_patterns
+    from generate_canadian import SYNTHETIC, LEGITIMATE
+
+    patterns = load_text_patterns()
+    texts = [m for msgs in SYNTHETIC.values() for m in msgs] + [item["text"] for item in LEGITIMATE]
+    print(f"Profiling {len(patterns)} rules on {len(texts)} synthetic messages...")
+    results = profile_rules(texts, patterns)
+    print("\n".join(performance_section(results, len(texts))))
+    return 1 if any(r["flagged"] for r in results) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+TrustChekr Detection Engine - Hot-Reload Rule Registry
+Keeps the compiled rules of RULES_DIR current for long-running consumers
+(score_service.py) while rule authors edit rules/ca/*.json and
+rules/shared/*.json, instead of restarting and recompiling every pack.
+
+A background thread polls the rules tree (stat first, content hash only for
+files whose mtime or size moved). Changed files are re-indexed and
+recompiled; unchanged files keep their compiled patterns. The result is a new
+RuleSnapshot (version number plus rules hash), swapped in with one reference
+assignment: a batch that took the previous snapshot keeps scoring with it.
+A file that fails to parse mid-edit keeps its last good version until it
+parses again, and the snapshots list its parse error only until then.
+
+Every snapshot's index is persisted to CACHE_DIR like load_rule_index does,
+so worker processes resolve a rules hash with SnapshotCache and compile only
+the files that changed since the snapshot they had.
+
+Usage: python rule_registry.py [--watch] [--poll-s 1.0]
+"""
+
+import os, sys, json, time, threading, argparse
+from collections import OrderedDict
+
+from rule_index import (RULES_DIR, CACHE_DIR, rule_files, file_hash, index_rule_file, assemble_index,
+                        index_path, save_rule_index, compiled_patterns, failed_rules)
+
+POLL_INTERVAL = 1.0
+KEEP_SNAPSHOTS = 4        # compiled snapshots a SnapshotCache keeps for batches still in flight
+
+# ─── Snapshots ───────────────────────────────────────────────────────────────
+
+class RuleSnapshot:
+    """One immutable, versioned set of compiled text and domain rules."""
+
+    def __init__(self, version, index, text_patterns, domain_patterns, changed=(), errors=None):
+        self.version = version
+        self.index = index
+        self.hash = index["hash"]
+        self.text_patterns = text_patterns
+        self.domain_patterns = domain_patterns
+        self.changed = tuple(changed)        # files recompiled for this snapshot
+        self.errors = dict(errors or {})     # file -> parse error; the file's last good version is kept
+        self.created = time.time()
+        self._derived = {}
+
+    @property
+    def tag(self):
+        """Rule version stamped on results: v<version>-<rules hash prefix>."""
+        return f"v{self.version}-{self.hash[:12]}" if self.version is not None else self.hash[:12]
+
+    def derived(self, key, build):
+        """State built once per snapshot from its patterns (prefilter, penalty groups)."""
+        if key not in self._derived:
+            self._derived[key] = build(self.text_patterns)
+        return self._derived[key]
+
+    def prefilter(self):
+        from prefilter import RulePrefilter
+        return self.derived("prefilter", RulePrefilter)
+
+def _compile_file(entries):
+    index = {"rules": entries}
+    return compiled_patterns(index, "text"), compiled_patterns(index, "domain")
+
+def _snapshot(version, files, compiled, changed=(), errors=None):
+    """RuleSnapshot of (relative path, file hash, entries) triples; compiled maps path -> (hash, text, domain)."""
+    index = assemble_index(files)
+    text = [p for rel, _, _ in files for p in compiled[rel][1]]
+    domain = [p for rel, _, _ in files for p in compiled[rel][2]]
+    return RuleSnapshot(version, index, text, domain, changed, errors)
+
+# ─── Registry ────────────────────────────────────────────────────────────────
+
+class RuleRegistry:
+    """
+    Watches a rules tree and publishes a new RuleSnapshot when its content
+    changes. Read .snapshot once per unit of work and use that object
+    throughout; refresh() rescans on demand, start() polls in a thread.
+    """
+
+    def __init__(self, rules_dir=RULES_DIR, cache_dir=CACHE_DIR, poll_interval=POLL_INTERVAL):
+        self.rules_dir = rules_dir
+        self.cache_dir = cache_dir
+        self.poll_interval = poll_interval
+        self.reloads = 0
+        self._stat = {}        # path -> (mtime_ns, size) last scanned
+        self._files = {}       # path -> (file hash, entries) of the last good version
+        self._compiled = {}    # path -> (file hash, text patterns, domain patterns)
+        self._errors = {}
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.snapshot = None
+        self.refresh()
+
+    def subscribe(self, callback):
+        """Call callback(snapshot) after every swap (from the polling thread)."""
+        self._listeners.append(callback)
+
+    def refresh(self):
+        """Rescan the rules tree; returns the new snapshot, or None when the rules did not change."""
+        with self._lock:
+            seen, changed = set(), []
+            errors = dict(self._errors)
+            for jf in rule_files(self.rules_dir):
+                rel = os.path.relpath(jf, self.rules_dir)
+                try:
+                    st = os.stat(jf)
+                except FileNotFoundError:   # removed between the glob and the stat
+                    continue
+                seen.add(rel)
+                stat = (st.st_mtime_ns, st.st_size)
+                if self._stat.get(rel) == stat:
+                    continue
+                self._stat[rel] = stat
+                digest = file_hash(jf)
+                if rel in self._files and self._files[rel][0] == digest:
+                    self._errors.pop(rel, None)   # broken, then restored to its last good version
+                    continue
+                try:
+                    entries = index_rule_file(jf, self.rules_dir)
+                except (OSError, ValueError) as e:
+                    if self._errors.get(rel) != str(e):
+                        print(f"  ⚠️ rule registry: {rel}: {e}", file=sys.stderr)
+                    self._errors[rel] = str(e)
+                    continue
+                self._errors.pop(rel, None)
+                self._files[rel] = (digest, entries)
+                self._compiled[rel] = (digest, *_compile_file(entries))
+                changed.append(rel)
+            for rel in set(self._files) - seen:
+                del self._files[rel], self._compiled[rel]
+                changed.append(rel)
+            for rel in set(self._stat) - seen:
+                del self._stat[rel]
+                self._errors.pop(rel, None)
+            if not changed and self._errors == errors and self.snapshot is not None:
+                return None
+
+            files = [(rel, *self._files[rel]) for rel in sorted(self._files)]
+            version = self.snapshot.version + 1 if self.snapshot is not None else 1
+            snapshot = _snapshot(version, files, self._compiled, changed, self._errors)
+            if self.snapshot is not None and snapshot.hash == self.snapshot.hash and snapshot.errors == self.snapshot.errors:
+                return None
+            save_rule_index(snapshot.index, self.cache_dir)
+            self.snapshot = snapshot          # the swap: readers see the old or the new snapshot, never a mix
+            if version > 1:
+                self.reloads += 1
+        for callback in self._listeners:
+            callback(snapshot)
+        return snapshot
+
+    def start(self):
+        """Poll the rules tree every poll_interval seconds in a daemon thread."""
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._poll, name="rule-registry", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def _poll(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.refresh()
+            except Exception as e:   # keep watching; the current snapshot stays in place
+                print(f"  ⚠️ rule registry: {e}", file=sys.stderr)
+
+# ─── Worker Side ─────────────────────────────────────────────────────────────
+
+class SnapshotCache:
+    """
+    Compiled snapshots by rules hash, for processes that get the hash from a
+    RuleRegistry elsewhere (pool workers). The index comes from CACHE_DIR;
+    files whose hash matches a snapshot compiled earlier reuse its patterns.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, keep=KEEP_SNAPSHOTS):
+        self.cache_dir = cache_dir
+        self.keep = keep
+        self.snapshots = OrderedDict()
+        self._compiled = {}    # path -> (file hash, text patterns, domain patterns)
+
+    def get(self, digest):
+        if digest in self.snapshots:
+            self.snapshots.move_to_end(digest)
+            return self.snapshots[digest]
+        with open(index_path(digest, self.cache_dir)) as f:
+            index = json.load(f)
+        if index.get("hash") != digest or "files" not in index:
+            raise ValueError(f"rule index {digest[:16]} missing or stale in {self.cache_dir}")
+        files, start, changed = [], 0, []
+        for rel, file_digest, n in index["files"]:
+            entries = index["rules"][start:start + n]
+            start += n
+            files.append((rel, file_digest, entries))
+            if self._compiled.get(rel, (None,))[0] != file_digest:
+                self._compiled[rel] = (file_digest, *_compile_file(entries))
+                changed.append(rel)
+        snapshot = _snapshot(None, files, self._compiled, changed)
+        self.snapshots[digest] = snapshot
+        while len(self.snapshots) > self.keep:
+            self.snapshots.popitem(last=False)
+        return snapshot
+
+# ─── Main ────────────────────────────────────────────────────────────────────
+
+def describe(snapshot):
+    failed = len(failed_rules(snapshot.index))
+    line = (f"{snapshot.tag}: {len(snapshot.text_patterns)} text / {len(snapshot.domain_patterns)} domain rules "
+            f"from {len(snapshot.index['files'])} files")
+    if failed:
+        line += f", {failed} failed to compile"
+    if snapshot.version and snapshot.version > 1:
+        line += f"; recompiled {', '.join(snapshot.changed)}"
+    for rel, error in snapshot.errors.items():
+        line += f"\n  ⚠️ {rel}: {error} (last good version, if any, kept)"
+    return line
+
+def main():
+    parser = argparse.ArgumentParser(description="Show the current rule snapshot, or watch the rules tree for changes.")
+    parser.add_argument("--watch", action="store_true", help="print every new snapshot until interrupted")
+    parser.add_argument("--poll-s", type=float, default=POLL_INTERVAL)
+    parser.add_argument("--rules-dir", default=str(RULES_DIR))
+    args = parser.parse_args()
+
+    registry = RuleRegistry(args.rules_dir, poll_interval=args.poll_s)
+    print(describe(registry.snapshot))
+    if not args.watch:
+        return 0
+    registry.subscribe(lambda snapshot: print(describe(snapshot), flush=True))
+    registry.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        registry.stop()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+TrustChekr Detection Engine - Stratified Sampling
+One pass over a dataset's chunks keeps a seeded bottom-k reservoir per
+stratum (label × category inferred by the huggingface_text keyword table):
+every row draws a uniform priority, and each stratum keeps its lowest
+priorities. Memory is bounded by max_rows rows per stratum, never the file:
+up to max_rows × len(strata_names()) (14 strata, so 14× the sample size)
+plus the chunk being added. The budget is not split across strata because
+the allocation below depends on stratum sizes only known once the pass
+ends, and any one stratum can end up owning the whole sample.
+
+The sample is then allocated over the strata: every stratum keeps up to
+MIN_STRATUM rows so rare scam types survive, the rest is proportional to
+stratum size. A stratum's rows are its lowest priorities, so a 5k sample is
+a subset of the 50k sample drawn with the same seed.
+
+Rows carry their stratum, and scoring folds detections per stratum. That
+gives design-weighted precision and recall for the whole dataset with
+normal-approximation confidence intervals (stratified ratio estimator with
+finite population correction; stratum proportions are smoothed in the
+variance so small all-or-nothing strata still count).
+
+Usage: python sampling.py [--rows 5000]   (strata and allocation of every text dataset in downloads/)
+"""
+
+import sys, argparse
+from functools import lru_cache
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+from keyword_classifier import load_classifier
+
+SEED = 42
+SMOKE_ROWS = 5000
+MIN_STRATUM = 30          # rows kept from every stratum before proportional allocation
+CONFIDENCE = 0.95
+CLASSIFIER = "huggingface_text"
+
+# ─── Strata ──────────────────────────────────────────────────────────────────
+
+@lru_cache(maxsize=None)
+def strata_names():
+    """Stratum names by code: legit/<category> for every category, then scam/<category>."""
+    classifier = load_classifier(CLASSIFIER)
+    categories = list(dict.fromkeys([name for _, name in classifier.keywords] + [classifier.default]))
+    return tuple(f"{label}/{c}" for label in ("legit", "scam") for c in categories)
+
+def stratum_codes(texts, labels):
+    """Stratum code of each row: label × inferred category."""
+    names = strata_names()
+    categories = len(names) // 2
+    code_of = {name.split("/", 1)[1]: k for k, name in enumerate(names[:categories])}
+    inferred = np.array([code_of[c] for c in load_classifier(CLASSIFIER).classify_many(texts)], dtype=np.int64)
+    return inferred + categories * (np.asarray(labels, dtype=bool))
+
+def scam_strata():
+    names = strata_names()
+    return np.arange(len(names)) >= len(names) // 2
+
+def allocate(population, max_rows, min_stratum=MIN_STRATUM):
+    """
+    Rows to sample per stratum: up to min_stratum from each, the rest in
+    proportion to the remaining population (largest remainder).
+    """
+    population = np.asarray(population, dtype=np.int64)
+    if not max_rows or population.sum() <= max_rows:
+        return population.copy()
+    base = np.minimum(population, min_stratum)
+    if base.sum() >= max_rows:
+        base = np.zeros_like(population)
+    rest = population - base
+    share = rest * (max_rows - base.sum()) / rest.sum()
+    n = np.floor(share).astype(np.int64)
+    n[np.argsort(-(share - n), kind="stable")[:max_rows - base.sum() - n.sum()]] += 1
+    return base + np.minimum(n, rest)
+
+# ─── Reservoir ───────────────────────────────────────────────────────────────
+
+class StratifiedReservoir:
+    """
+    Seeded bottom-k reservoir of at most max_rows rows per stratum (so up to
+    max_rows × len(strata_names()) rows in all), filled by add(frame).
+    """
+
+    def __init__(self, text_col, label_col, max_rows, seed=SEED):
+        self.text_col, self.label_col = text_col, label_col
+        self.max_rows = max_rows
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+        self.population = np.zeros(len(strata_names()), dtype=np.int64)
+        self.cutoff = np.full(len(strata_names()), np.inf)   # priority a row must beat once a stratum is full
+        self.kept = None
+        self.rows = 0
+
+    def add(self, df):
+        labels = df[self.label_col].astype(int).to_numpy() != 0
+        codes = stratum_codes(df[self.text_col].tolist(), labels)
+        self.population += np.bincount(codes, minlength=len(self.population))
+        priority = self.rng.random(len(df))
+        df = df.assign(stratum=codes, _priority=priority, _row=np.arange(self.rows, self.rows + len(df)))
+        self.rows += len(df)
+        df = df[priority < self.cutoff[codes]]
+        if not len(df):
+            return
+        pool = pd.concat([self.kept, df], ignore_index=True) if self.kept is not None else df
+        pool = pool.sort_values(["stratum", "_priority"], kind="stable")
+        if self.max_rows:
+            pool = pool[pool.groupby("stratum").cumcount().to_numpy() < self.max_rows]
+            full = pool["stratum"].value_counts()
+            full = full[full >= self.max_rows].index.to_numpy()
+            self.cutoff[full] = pool.groupby("stratum")["_priority"].max().loc[full].to_numpy()
+        self.kept = pool.reset_index(drop=True)
+
+    def sample(self, min_stratum=MIN_STRATUM):
+        """(rows in arrival order with a stratum column, sampling info)."""
+        n = allocate(self.population, self.max_rows, min_stratum)
+        info = {"population": self.population.copy(), "sample": n, "seed": self.seed}
+        if self.kept is None:
+            return pd.DataFrame(columns=[self.text_col, self.label_col, "stratum"]), info
+        rank = self.kept.groupby("stratum").cumcount().to_numpy()
+        df = self.kept[rank < n[self.kept["stratum"].to_numpy()]].sort_values("_row")
+        return df.drop(columns=["_priority", "_row"]).reset_index(drop=True), info
+
+def stratified_sample(frames, text_col, label_col, max_rows, seed=SEED, min_stratum=MIN_STRATUM):
+    """StratifiedReservoir over an iterable of frames: (sample, info with per-stratum population and sample sizes)."""
+    reservoir = StratifiedReservoir(text_col, label_col, max_rows, seed)
+    for df in frames:
+        reservoir.add(df)
+    return reservoir.sample(min_stratum)
+
+# ─── Estimates ───────────────────────────────────────────────────────────────
+
+def stratum_counts(detected, codes):
+    """2 × strata: sampled rows and detected rows per stratum (adds across shards)."""
+    codes = np.asarray(codes, dtype=np.int64)
+    n = len(strata_names())
+    return np.stack([np.bincount(codes, minlength=n), np.bincount(codes[np.asarray(detected, dtype=bool)], minlength=n)])
+
+def estimate(population, counts, is_scam, confidence=CONFIDENCE):
+    """
+    Design-weighted precision and recall with confidence intervals. population,
+    sampled and detected counts and is_scam are per stratum (strata of several
+    datasets may be concatenated). Each estimate's variance is the stratified
+    variance of its linearized ratio.
+    """
+    N = np.asarray(population, dtype=float)
+    n, k = np.asarray(counts, dtype=float)
+    is_scam = np.asarray(is_scam, dtype=bool)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        p = np.where(n > 0, k / n, 0.0)
+        q = (k + 1) / (n + 2)   # smoothed so all-or-nothing strata still carry variance
+        s2 = np.where(n > 1, q * (1 - q) * n / (n - 1), 0.0)
+        v = np.where(n > 0, N ** 2 * (1 - n / np.maximum(N, 1)) * s2 / n, 0.0)   # variance of N_h p_h
+    detected = N * p
+    tp, fp = detected[is_scam].sum(), detected[~is_scam].sum()
+    scam = N[is_scam].sum()
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+
+    def interval(value, var):
+        half = z * np.sqrt(max(var, 0.0))
+        return value, (max(0.0, value - half), min(1.0, value + half))
+
+    precision = tp / (tp + fp) if tp + fp else 0.0
+    recall = tp / scam if scam else 0.0
+    c = np.where(is_scam, 1 - precision, -precision)
+    out = {"tp": tp, "fp": fp, "fn": scam - tp, "tn": N[~is_scam].sum() - fp, "sample": int(n.sum()),
+           "population": int(N.sum()), "confidence": confidence}
+    out["precision"], out["precision_ci"] = interval(precision, (c ** 2 * v).sum() / (tp + fp) ** 2 if tp + fp else 0.0)
+    out["recall"], out["recall_ci"] = interval(recall, v[is_scam].sum() / scam ** 2 if scam else 0.0)
+    return out
+
+def sampling_section(results, confidence=CONFIDENCE):
+    """Markdown lines of the Sampling Error section for batch_test results carrying "sampling" info and "strata" counts."""
+    results = [r for r in results if r.get("sampling") is not None and r.get("strata") is not None]
+    if not results:
+        return []
+    is_scam = scam_strata()
+    lines = ["\n## Sampling Error\n",
+             f"Rows were drawn by seeded reservoir sampling (seed {results[0]['sampling']['seed']}), stratified by label "
+             f"and keyword-inferred category (at least {MIN_STRATUM} rows per stratum, the rest proportional). "
+             f"Estimates below are weighted back to the full datasets, with {confidence:.0%} confidence intervals; "
+             "the tables above count the sampled rows as they are.\n",
+             "| Dataset | Sampled | Population | Strata | Precision | CI | Recall | CI |",
+             "|---------|---------|------------|--------|-----------|----|--------|----|"]
+
+    def row(name, population, counts, scam):
+        e = estimate(population, counts, scam, confidence)
+        strata = int((np.asarray(population) > 0).sum())
+        lines.append(f"| {name} | {e['sample']:,} | {e['population']:,} | {strata} | {e['precision']:.3f} | "
+                     f"{e['precision_ci'][0]:.3f}–{e['precision_ci'][1]:.3f} | {e['recall']:.3f} | "
+                     f"{e['recall_ci'][0]:.3f}–{e['recall_ci'][1]:.3f} |")
+
+    for r in results:
+        row(r["name"], r["sampling"]["population"], r["strata"], is_scam)
+    if len(results) > 1:
+        row("**Overall**", np.concatenate([r["sampling"]["population"] for r in results]),
+            np.concatenate([r["strata"] for r in results], axis=1), np.tile(is_scam, len(results)))
+    return lines
+
+# ─── Main ────────────────────────────────────────────────────────────────────
+
+def main():
+    parser = argparse.ArgumentParser(description="Stratify every downloaded text dataset and show the sample allocation.")
+    parser.add_argument("--rows", type=int, default=SMOKE_ROWS, help="sample size per dataset")
+    parser.add_argument("--seed", type=int, default=SEED)
+    args = parser.parse_args()
+
+    import batch_test as bt
+    names = strata_names()
+    for name, path, read in bt.text_sources():
+        try:
+            sample, info = stratified_sample(read(bt.CHUNK_ROWS), "text", "is_scam", args.rows, args.seed)
+        except Exception as e:
+            print(f"  ⚠️ {name}: {e}")
+            continue
+        print(f"\n{name}: {int(info['population'].sum()):,} rows → {len(sample):,} sampled")
+        for k in np.flatnonzero(info["population"]):
+            print(f"  {names[k]:<36} {info['population'][k]:>9,} → {info['sample'][k]:>7,}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
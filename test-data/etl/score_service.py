@@ -0,0 +1,443 @@
+#!/usr/bin/env python3
+"""
+TrustChekr Detection Engine - Local Scoring Service
+A long-running asyncio service that scores live message streams (SMS
+gateway exports, bot inbox dumps) against the same rules/** batch_test.py
+uses, without reloading them per run.
+
+Clients send newline-delimited JSON over TCP, {"id": ..., "text": ...} per
+message, and get {"id", "detected", "rules", "categories", "score", "tier"}
+back as each finishes (pipelining is fine; replies carry the id).
+{"op": "metrics"} returns the service metrics instead.
+
+Messages wait in a bounded queue and leave it in micro-batches: a batch is
+dispatched when it is full or its oldest message has waited max_wait_ms,
+whichever comes first, so batching never adds more than that to a
+message's latency. Batches are scored with text_hit_matrix and the
+scoring.ts trust score in a process pool whose workers compiled the rules
+once at startup; at most one batch per worker is in flight, and the queue
+fills (and then pushes back on readers) while they are busy. Metrics: p50 /
+p99 end-to-end latency, queue wait and batch time, batch sizes, and the
+current, mean and peak queue depth.
+
+Rules hot-reload: a RuleRegistry (rule_registry.py) watches rules/** and
+swaps in a new snapshot when a file changes. Each batch takes the snapshot
+current at dispatch and is scored with it to the end, workers compiling
+only the changed files the first time they see its hash; every reply
+carries that snapshot's "rules_version".
+
+Usage: python score_service.py serve [--port 8765] [--workers 2] [--no-watch]
+       python score_service.py load [--port 8765] [--messages 5000] [--rate 2000]
+       python score_service.py selftest   (service + load on localhost, checked against detect_text)
+"""
+
+import os, sys, json, time, asyncio, argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+
+import numpy as np
+
+from scoring import penalty_groups, trust_scores, risk_tiers, TIERS
+from rule_registry import RuleRegistry, SnapshotCache, POLL_INTERVAL
+
+HOST = "127.0.0.1"
+PORT = 8765
+WORKERS = max(1, (os.cpu_count() or 2) - 1)
+MAX_BATCH = 64
+MAX_WAIT_MS = 5.0         # latency budget of batching: the oldest queued message waits at most this long
+MAX_QUEUE = 10000
+LATENCY_WINDOW = 10000    # most recent messages the latency percentiles cover
+LINE_LIMIT = 1 << 24
+IN_FLIGHT = 256           # requests a load client keeps outstanding
+LOAD_MESSAGES = 5000
+
+# ─── Workers ─────────────────────────────────────────────────────────────────
+
+_worker = {}
+
+def _init_worker(use_prefilter):
+    """Per worker process: compiled rule snapshots by rules hash."""
+    _worker["snapshots"] = SnapshotCache()
+    _worker["prefilter"] = use_prefilter
+
+def _warm(snapshot, use_prefilter):
+    """Build a snapshot's prefilter and penalty groups before it scores; returns its rule count."""
+    if use_prefilter:
+        snapshot.prefilter()
+    snapshot.derived("groups", penalty_groups)
+    return len(snapshot.text_patterns)
+
+def _warm_worker(digest):
+    return _warm(_worker["snapshots"].get(digest), _worker["prefilter"])
+
+def score_batch(texts, digest):
+    """Verdict dicts for a batch of messages, scored in a worker with the snapshot of rules hash digest."""
+    return score_snapshot(texts, _worker["snapshots"].get(digest), _worker["prefilter"])
+
+def score_snapshot(texts, snapshot, use_prefilter=True):
+    """Verdict dicts for a batch of messages, scored with one rule snapshot."""
+    from batch_test import text_hit_matrix
+    patterns = snapshot.text_patterns
+    hits, _ = text_hit_matrix(texts, patterns, snapshot.prefilter() if use_prefilter else None)
+    scores = trust_scores(hits, patterns, groups=snapshot.derived("groups", penalty_groups))
+    tiers = risk_tiers(scores)
+    out = []
+    for row, score, tier in zip(hits, scores, tiers):
+        matched = np.flatnonzero(row)
+        out.append({"detected": bool(len(matched)), "rules": [patterns[j]["id"] for j in matched],
+                    "categories": list(dict.fromkeys(patterns[j]["category"] for j in matched)),
+                    "score": int(score), "tier": TIERS[tier][0]})
+    return out
+
+# ─── Service ─────────────────────────────────────────────────────────────────
+
+def _percentiles(values):
+    if not values:
+        return {"p50": 0.0, "p99": 0.0, "max": 0.0}
+    ms = np.asarray(values) * 1000
+    return {"p50": float(np.percentile(ms, 50)), "p99": float(np.percentile(ms, 99)), "max": float(ms.max())}
+
+class ScoringService:
+    """Micro-batching scorer over a pool of warm rule workers; await start() before score()."""
+
+    def __init__(self, workers=WORKERS, max_batch=MAX_BATCH, max_wait_ms=MAX_WAIT_MS, max_queue=MAX_QUEUE,
+                 use_prefilter=True, watch=True, poll_interval=POLL_INTERVAL):
+        self.workers = workers
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.max_queue = max_queue
+        self.use_prefilter = use_prefilter
+        self.watch = watch
+        self.poll_interval = poll_interval
+        self.pool = self.registry = None
+        self.requests = self.completed = self.batches = 0
+        self.depth_sum = self.depth_max = 0
+        self.in_flight = 0
+        self.running = set()    # batch tasks, referenced until done so none is garbage-collected mid-run
+        self.latency = deque(maxlen=LATENCY_WINDOW)     # enqueue -> result, seconds
+        self.queue_wait = deque(maxlen=LATENCY_WINDOW)  # enqueue -> dispatch
+        self.batch_time = deque(maxlen=LATENCY_WINDOW)
+        self.batch_sizes = deque(maxlen=LATENCY_WINDOW)
+        self.started = self.warmup = 0.0
+
+    async def start(self):
+        t0 = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        self.registry = await loop.run_in_executor(None, partial(RuleRegistry, poll_interval=self.poll_interval))
+        snapshot = self.registry.snapshot
+        if self.workers > 0:
+            self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                            initargs=(self.use_prefilter,))
+            # Start (and so compile the rules in) every worker before taking traffic
+            await asyncio.gather(*(loop.run_in_executor(self.pool, _warm_worker, snapshot.hash)
+                                   for _ in range(self.workers)))
+        else:
+            self.pool = ThreadPoolExecutor(max_workers=1)
+            await loop.run_in_executor(self.pool, _warm, snapshot, self.use_prefilter)
+        if self.watch:
+            self.registry.start()
+        self.queue = asyncio.Queue(self.max_queue)
+        self.slots = asyncio.Semaphore(max(1, self.workers))
+        self.batcher = asyncio.create_task(self._batch_loop())
+        self.started = time.perf_counter()
+        self.warmup = self.started - t0
+        return self
+
+    async def close(self):
+        self.registry.stop()
+        self.batcher.cancel()
+        try:
+            await self.batcher
+        except asyncio.CancelledError:
+            pass
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+    async def score(self, text):
+        """Verdict dict for one message (see score_batch)."""
+        future = asyncio.get_running_loop().create_future()
+        self.requests += 1
+        depth = self.queue.qsize()
+        self.depth_sum += depth
+        self.depth_max = max(self.depth_max, depth + 1)
+        await self.queue.put((text, time.perf_counter(), future))
+        return await future
+
+    async def _batch_loop(self):
+        while True:
+            await self.slots.acquire()
+            batch = [await self.queue.get()]
+            deadline = batch[0][1] + self.max_wait
+            while len(batch) < self.max_batch:
+                if not self.queue.empty():
+                    batch.append(self.queue.get_nowait())
+                    continue
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            task = asyncio.create_task(self._run(batch))
+            self.running.add(task)
+            task.add_done_callback(self.running.discard)
+
+    async def _run(self, batch):
+        self.in_flight += 1
+        t0 = time.perf_counter()
+        snapshot = self.registry.snapshot   # this batch scores with these rules, whatever is swapped in meanwhile
+        texts = [text for text, _, _ in batch]
+        if self.workers > 0:
+            job = partial(score_batch, texts, snapshot.hash)
+        else:
+            job = partial(score_snapshot, texts, snapshot, self.use_prefilter)
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(self.pool, job)
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self.in_flight -= 1
+            self.slots.release()
+        done = time.perf_counter()
+        self.batches += 1
+        self.batch_sizes.append(len(batch))
+        self.batch_time.append(done - t0)
+        for (_, enqueued, future), result in zip(batch, results):
+            result["rules_version"] = snapshot.tag
+            self.latency.append(done - enqueued)
+            self.queue_wait.append(t0 - enqueued)
+            if not future.done():
+                future.set_result(result)
+        self.completed += len(batch)
+
+    def metrics(self):
+        uptime = time.perf_counter() - self.started if self.started else 0.0
+        snapshot = self.registry.snapshot
+        return {"rules": len(snapshot.text_patterns), "rules_version": snapshot.tag,
+                "rule_reloads": self.registry.reloads, "workers": self.workers, "max_batch": self.max_batch,
+                "max_wait_ms": self.max_wait * 1000, "requests": self.requests, "completed": self.completed,
+                "batches": self.batches,
+                "mean_batch": float(np.mean(self.batch_sizes)) if self.batch_sizes else 0.0,
+                "latency_ms": _percentiles(self.latency), "queue_wait_ms": _percentiles(self.queue_wait),
+                "batch_ms": _percentiles(self.batch_time),
+                "queue_depth": self.queue.qsize(), "queue_depth_mean": self.depth_sum / self.requests if self.requests else 0.0,
+                "queue_depth_max": self.depth_max, "in_flight": self.in_flight,
+                "uptime_s": uptime, "messages_per_s": self.completed / uptime if uptime else 0.0,
+                "warmup_s": self.warmup}
+
+# ─── Protocol ────────────────────────────────────────────────────────────────
+
+def _line(obj):
+    return (json.dumps(obj) + "\n").encode()
+
+async def handle_connection(service, reader, writer):
+    """Serve one client: a reply line per request line, in completion order."""
+    tasks = set()
+    lock = asyncio.Lock()
+
+    async def reply(req):
+        try:
+            result = await service.score(req.get("text"))
+            out = {"id": req.get("id"), **result}
+        except Exception as e:
+            out = {"id": req.get("id"), "error": str(e)}
+        writer.write(_line(out))
+        async with lock:
+            await writer.drain()
+
+    try:
+        while line := await reader.readline():
+            try:
+                req = json.loads(line)
+            except ValueError as e:
+                writer.write(_line({"error": f"bad request: {e}"}))
+                continue
+            if not isinstance(req, dict):
+                writer.write(_line({"error": "bad request: expected a JSON object"}))
+                continue
+            if req.get("op") == "metrics":
+                writer.write(_line(service.metrics()))
+                continue
+            task = asyncio.create_task(reply(req))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+async def start_server(service, host=HOST, port=PORT):
+    return await asyncio.start_server(partial(handle_connection, service), host, port, limit=LINE_LIMIT)
+
+# ─── Load Client ─────────────────────────────────────────────────────────────
+
+async def run_load(host, port, texts, rate=None, in_flight=IN_FLIGHT):
+    """
+    Send texts over one pipelined connection, at most in_flight outstanding
+    (and at rate messages/s, if given). Returns (replies by index, client
+    latencies in seconds, elapsed seconds, server metrics). Error replies
+    without an id are printed and count as answered.
+    """
+    reader, writer = await asyncio.open_connection(host, port, limit=LINE_LIMIT)
+    window = asyncio.Semaphore(in_flight)
+    sent, replies, latency = {}, {}, {}
+    unmatched = 0
+
+    async def receive():
+        nonlocal unmatched
+        while len(replies) + unmatched < len(texts):
+            line = await reader.readline()
+            if not line:
+                break
+            r = json.loads(line)
+            if r.get("id") not in sent:
+                print(f"  ⚠️ reply without a request id: {r.get('error', r)}")
+                unmatched += 1
+                window.release()
+                continue
+            latency[r["id"]] = time.perf_counter() - sent[r["id"]]
+            replies[r["id"]] = r
+            window.release()
+
+    receiver = asyncio.create_task(receive())
+    start = time.perf_counter()
+    for i, text in enumerate(texts):
+        if rate:
+            await asyncio.sleep(max(0.0, start + i / rate - time.perf_counter()))
+        await window.acquire()
+        sent[i] = time.perf_counter()
+        writer.write(_line({"id": i, "text": text}))
+        await writer.drain()
+    await receiver
+    elapsed = time.perf_counter() - start
+    writer.write(_line({"op": "metrics"}))
+    await writer.drain()
+    server = json.loads(await reader.readline())
+    writer.close()
+    await writer.wait_closed()
+    return replies, [latency[i] for i in sorted(latency)], elapsed, server
+
+def load_texts(args):
+    if args.csv:
+        import pandas as pd
+        return pd.read_csv(args.csv, usecols=[args.text_col])[args.text_col].head(args.messages).tolist()
+    from bench import build_corpus, message_pool
+    return build_corpus(args.messages, message_pool())["text"].tolist()
+
+def print_load(n, latency, elapsed, server):
+    client = _percentiles(latency)
+    print(f"  {n:,} messages in {elapsed:.2f}s ({n / elapsed if elapsed else 0:,.0f}/s)")
+    print(f"  client latency   p50 {client['p50']:7.2f} ms   p99 {client['p99']:7.2f} ms   max {client['max']:7.2f} ms")
+    for key, label in (("latency_ms", "service latency"), ("queue_wait_ms", "queue wait"), ("batch_ms", "batch time")):
+        m = server[key]
+        print(f"  {label:<16} p50 {m['p50']:7.2f} ms   p99 {m['p99']:7.2f} ms   max {m['max']:7.2f} ms")
+    print(f"  {server['batches']:,} batches, mean size {server['mean_batch']:.1f} (max {server['max_batch']}, "
+          f"wait ≤ {server['max_wait_ms']:.1f} ms); queue depth mean {server['queue_depth_mean']:.1f}, "
+          f"peak {server['queue_depth_max']:,}; {server['workers']} worker(s), {server['rules']} rules "
+          f"({server['rules_version']}, {server['rule_reloads']} reload(s)), "
+          f"warm-up {server['warmup_s']:.2f}s")
+
+# ─── Main ────────────────────────────────────────────────────────────────────
+
+def make_service(args):
+    return ScoringService(args.workers, args.max_batch, args.max_wait_ms, use_prefilter=not args.no_prefilter,
+                          watch=not args.no_watch, poll_interval=args.poll_s)
+
+async def serve_forever(args):
+    service = await make_service(args).start()
+    server = await start_server(service, args.host, args.port)
+    snapshot = service.registry.snapshot
+    watching = f", watching rules every {args.poll_s:g}s" if not args.no_watch else ""
+    print(f"Scoring {len(snapshot.text_patterns)} rules ({snapshot.tag}) on {args.host}:{args.port} with "
+          f"{args.workers} worker(s) (warm-up {service.warmup:.2f}s{watching})")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.close()
+
+async def load(args):
+    texts = load_texts(args)
+    replies, latency, elapsed, server = await run_load(args.host, args.port, texts, args.rate, args.in_flight)
+    print_load(len(replies), latency, elapsed, server)
+    return 0
+
+async def bad_request_replies(host, port, lines=(b"[1]", b'"hi"', b"42")):
+    """Replies to JSON lines that are not request objects, then to a valid request on the same connection."""
+    reader, writer = await asyncio.open_connection(host, port, limit=LINE_LIMIT)
+    for line in lines:
+        writer.write(line + b"\n")
+    writer.write(_line({"id": "after", "text": "hello"}))
+    await writer.drain()
+    replies = [json.loads(await reader.readline()) for _ in range(len(lines) + 1)]
+    writer.close()
+    await writer.wait_closed()
+    return replies
+
+async def selftest(args):
+    """
+    Service and load client on localhost; every reply is checked against
+    detect_text, and non-object requests must get an error reply without
+    closing the connection.
+    """
+    service = await make_service(args).start()
+    server = await start_server(service, HOST, 0)
+    port = server.sockets[0].getsockname()[1]
+    texts = load_texts(args)
+    try:
+        replies, latency, elapsed, metrics = await run_load(HOST, port, texts, args.rate, args.in_flight)
+        bad = await bad_request_replies(HOST, port)
+    finally:
+        server.close()
+        await server.wait_closed()
+        await service.close()
+
+    import batch_test as bt
+    patterns = bt.load_text_patterns()
+    expected = {}
+    mismatches = 0
+    for i, text in enumerate(texts):
+        if text not in expected:
+            expected[text] = list(dict.fromkeys(bt.detect_text(text, patterns)))
+        r = replies.get(i)
+        if r is None or r.get("categories") != expected[text] or r.get("rules_version") != metrics["rules_version"]:
+            mismatches += 1
+    print(f"Self-test on {HOST}:{port}")
+    print_load(len(replies), latency, elapsed, metrics)
+    print(f"  {len(texts) - mismatches:,}/{len(texts):,} replies match detect_text (rules {metrics['rules_version']})")
+    rejected = all("error" in r for r in bad[:-1]) and bad[-1].get("id") == "after" and "error" not in bad[-1]
+    print(f"  {'ok  ' if rejected else 'FAIL'} {len(bad) - 1} non-object requests rejected, connection kept")
+    return 1 if mismatches or not rejected else 0
+
+def main():
+    parser = argparse.ArgumentParser(description="Local scoring service with warm rules and micro-batching.")
+    parser.add_argument("mode", choices=("serve", "load", "selftest"))
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--workers", type=int, default=WORKERS, help="scoring processes (0: one thread in-process)")
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH)
+    parser.add_argument("--max-wait-ms", type=float, default=MAX_WAIT_MS,
+                        help="longest a queued message waits for its batch to fill")
+    parser.add_argument("--no-prefilter", action="store_true")
+    parser.add_argument("--no-watch", action="store_true", help="score with the rules loaded at startup only")
+    parser.add_argument("--poll-s", type=float, default=POLL_INTERVAL, help="how often the rules tree is checked for changes")
+    parser.add_argument("--messages", type=int, default=LOAD_MESSAGES, help="messages the load client sends")
+    parser.add_argument("--rate", type=float, default=None, help="messages/s the load client sends (default: as fast as allowed)")
+    parser.add_argument("--in-flight", type=int, default=IN_FLIGHT, help="outstanding requests of the load client")
+    parser.add_argument("--csv", default=None, help="load client: send this CSV's text column instead of synthetic messages")
+    parser.add_argument("--text-col", default="text")
+    args = parser.parse_args()
+    run = {"serve": serve_forever, "load": load, "selftest": selftest}[args.mode]
+    try:
+        return asyncio.run(run(args)) or 0
+    except KeyboardInterrupt:
+        return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
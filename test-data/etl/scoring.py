@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+TrustChekr Detection Engine - Weighted Scoring
+Vectorized port of src/lib/ai-detection/scoring.ts over a rows × rules hit
+matrix: weightToPenalty, computeTotalPenalty (strongest signals first, half
+penalty from the fourth signal of a category on, capped at 100) and
+mapScoreToAIRiskTier, starting from a trust score of 100 as analyzeForAIScam
+does by default. Only the text rules are scored; script-flow and channel
+signals are not part of the harness.
+
+Trust scores are whole numbers from 0 to 100, so a dataset reduces to one
+histogram per label. Histograms add across shards and chunks, and every
+threshold's confusion counts (and so the ROC and PR curves) come from one
+cumulative sum over them.
+"""
+
+import csv
+
+import numpy as np
+
+PENALTY_MAP = {10: 30, 9: 25, 8: 20, 7: 15, 6: 12, 5: 10, 4: 8, 3: 5, 2: 3, 1: 1}
+DIMINISH_AFTER = 3      # signals per category at full penalty
+DIMINISH = 0.5
+MAX_PENALTY = 100
+BASE_SCORE = 100
+SCORES = 101            # trust scores 0..100
+TIERS = (("LIKELY_SAFE", 80), ("SUSPICIOUS", 50), ("HIGH_RISK", 25), ("VERY_LIKELY_SCAM", 0))
+DEFAULT_TIER = "SUSPICIOUS"   # least severe tier reported as a detection
+SWEEP = (100, 95, 90, 80, 70, 60, 50, 40, 25, 10)
+
+def js_round(x):
+    """Math.round: halves go up."""
+    return np.floor(np.asarray(x, dtype=float) + 0.5)
+
+# ─── Penalties ───────────────────────────────────────────────────────────────
+
+def weight_to_penalty(weights):
+    """weightToPenalty for an array of rule weights."""
+    w = np.clip(js_round(weights), 1, 10).astype(int)
+    table = np.array([0] + [PENALTY_MAP[k] for k in range(1, 11)])
+    return table[w]
+
+def penalty_groups(patterns):
+    """Per category: (columns, penalties), strongest penalty first (as computeTotalPenalty sorts)."""
+    penalties = weight_to_penalty([p["weight"] for p in patterns])
+    columns = {}
+    for j, p in enumerate(patterns):
+        columns.setdefault(p["category"], []).append(j)
+    groups = []
+    for cols in columns.values():
+        cols = np.array(sorted(cols, key=lambda j: -penalties[j]))
+        groups.append((cols, penalties[cols]))
+    return groups
+
+def total_penalty(hits, patterns, groups=None):
+    """computeTotalPenalty for every row of a hit matrix."""
+    total = np.zeros(len(hits))
+    for cols, penalties in groups if groups is not None else penalty_groups(patterns):
+        sub = hits[:, cols]
+        if not sub.any():
+            continue
+        rank = np.cumsum(sub, axis=1)   # 1-based rank of each hit within its category
+        total += (sub * np.where(rank > DIMINISH_AFTER, DIMINISH, 1.0) * penalties).sum(axis=1)
+    return np.minimum(MAX_PENALTY, js_round(total)).astype(int)
+
+def trust_scores(hits, patterns, base=BASE_SCORE, groups=None):
+    """Post-penalty trust score (0..base) per row."""
+    return np.maximum(0, base - total_penalty(hits, patterns, groups))
+
+def risk_tiers(scores):
+    """mapScoreToAIRiskTier: index into TIERS per score."""
+    floors = np.array([floor for _, floor in TIERS])
+    return np.argmax(np.asarray(scores)[:, None] >= floors, axis=1)
+
+# ─── Histograms ──────────────────────────────────────────────────────────────
+
+def score_histogram(scores, labels):
+    """2 × SCORES counts: row 0 legitimate, row 1 scam."""
+    labels = np.asarray(labels, dtype=bool)
+    return np.stack([np.bincount(scores[~labels], minlength=SCORES),
+                     np.bincount(scores[labels], minlength=SCORES)]).astype(np.int64)
+
+def threshold_counts(hist):
+    """
+    TP/FP/FN/TN arrays indexed by threshold t = 0..SCORES, flagging rows with
+    score < t. t = 100 flags any row with a matched rule (the any-match count).
+    """
+    legit, scam = hist
+    tp = np.concatenate([[0], np.cumsum(scam)])
+    fp = np.concatenate([[0], np.cumsum(legit)])
+    return tp, fp, scam.sum() - tp, legit.sum() - fp
+
+def tier_threshold(tier):
+    """Threshold that flags every row at this tier or a riskier one (scores below the next safer tier's floor)."""
+    names = [name for name, _ in TIERS]
+    k = names.index(tier)
+    return TIERS[k - 1][1] if k else SCORES
+
+def tier_counts(hist):
+    """[(tier, score range, legit, scam)] from most to least safe."""
+    out, upper = [], SCORES
+    for name, floor in TIERS:
+        out.append((name, f"{floor}–{upper - 1}", int(hist[0, floor:upper].sum()), int(hist[1, floor:upper].sum())))
+        upper = floor
+    return out
+
+def curves(hist):
+    """
+    ROC and PR points over every threshold, plus ROC AUC and average
+    precision. Points run from flagging nothing to flagging everything.
+    ROC AUC is None without both scam and legitimate messages, average
+    precision None without scam messages.
+    """
+    tp, fp, fn, tn = threshold_counts(hist)
+    pos, neg = tp[-1] + fn[-1], fp[-1] + tn[-1]
+    tpr = tp / pos if pos else np.zeros(len(tp))
+    fpr = fp / neg if neg else np.zeros(len(fp))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        precision = np.where(tp + fp > 0, tp / (tp + fp), 1.0)
+    roc_auc = float(np.sum(np.diff(fpr) * (tpr[1:] + tpr[:-1]) / 2)) if pos and neg else None
+    average_precision = float(np.sum(np.diff(tpr) * precision[1:])) if pos else None
+    return {"threshold": np.arange(SCORES + 1), "tp": tp, "fp": fp, "fn": fn, "tn": tn,
+            "tpr": tpr, "fpr": fpr, "precision": precision, "recall": tpr,
+            "roc_auc": roc_auc, "average_precision": average_precision}
+
+def write_curves(path, named_hists):
+    """One CSV row per (dataset, threshold) with the confusion counts and curve coordinates."""
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["dataset", "threshold", "tp", "fp", "fn", "tn", "fpr", "tpr", "precision"])
+        for name, hist in named_hists:
+            c = curves(hist)
+            for t in c["threshold"]:
+                writer.writerow([name, int(t), int(c["tp"][t]), int(c["fp"][t]), int(c["fn"][t]), int(c["tn"][t]),
+                                 f"{c['fpr'][t]:.6f}", f"{c['tpr'][t]:.6f}", f"{c['precision'][t]:.6f}"])
@@ -0,0 +1,438 @@
+#!/usr/bin/env python3
+"""
+TrustChekr Detection Engine - Script Matching
+The "scripts" of rules/*/scripts.json describe multi-step scam flows
+(script_cra_arrest_pay, script_pig_butchering_full, ...) that
+load_text_patterns() never reads. scriptMatcher.ts matches them on a text
+by keyword: a step's keywords are its words longer than 3 letters (lowercase,
+a-z0-9 only, stop words dropped), a step matches when half its keywords
+occur in the text, and a script when 40% of its steps match. Matching is
+substring search and step order does not matter; both are kept here, so the
+counts agree with the app.
+
+A conversation is matched as the app would match its whole thread, but
+incrementally. Keywords are a-z0-9 only, so a keyword occurs in a text
+exactly when it occurs inside one of the text's a-z0-9 runs: the new message
+is split into its runs (none spans two messages), each distinct run is
+looked up in a memo of the keywords it contains, and the conversation's
+state (keywords seen, hits per step, steps matched per script) advances
+with the keywords it had not seen before. Each message
+costs O(its own text), not a rescan of the thread, and a script fires on
+the message that completes it.
+
+Messages from the "user" role (the person being scammed, in the
+romance_conversations shape) are not matched: their replies would feed
+keywords to scripts that describe the scammer's side.
+
+Usage: python script_match.py [CONVERSATIONS.json]   (scripts fired on every conversation, message by message)
+"""
+
+import re, sys, json, glob, time, argparse
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[2]  # trustchekr-app/
+RULES_DIR = ROOT / "src" / "lib" / "ai-detection" / "rules"
+# built by scripts/romance-build-dataset.ts; the template ships with the repo
+CONVERSATION_FILES = (ROOT / "data" / "romance_conversations_dataset.json",
+                      ROOT / "data" / "romance_conversations_template.json")
+
+STEP_RATIO = 0.5          # share of a step's keywords that must occur (scriptMatcher.ts)
+SCRIPT_RATIO = 0.4        # share of a script's steps that must match (scriptMatcher.ts)
+MIN_KEYWORD_LEN = 4
+SKIP_ROLES = frozenset(("user",))
+MAX_SCRIPTS = 63          # script codes are int64 bitmasks
+MAX_MEMO = 200000         # a-z0-9 runs remembered with the keywords they contain
+THREAD_MESSAGES = 20      # messages per thread in the replay timing
+
+STOP_WORDS = frozenset((
+    "that", "this", "with", "from", "they", "them", "their", "have",
+    "been", "were", "will", "would", "could", "should", "about",
+    "which", "when", "where", "what", "does", "some", "other",
+    "into", "also", "than", "then", "very", "just", "more",
+    "being", "after", "before", "over", "under", "between",
+))
+_NON_KEYWORD = re.compile(r"[^a-z0-9\s]")
+_RUN = re.compile(f"[a-z0-9]{{{MIN_KEYWORD_LEN},}}")
+
+# ─── Scripts ─────────────────────────────────────────────────────────────────
+
+def step_keywords(step):
+    """Keywords of one step as scriptMatcher.ts extracts them (repeats kept: each one counts)."""
+    return [w for w in _NON_KEYWORD.sub("", step.lower()).split()
+            if len(w) >= MIN_KEYWORD_LEN and w not in STOP_WORDS]
+
+def load_scripts(rules_dir=RULES_DIR):
+    """Scripts of every rules/<region>/*.json with a "scripts" section, in file order, with their step keywords."""
+    scripts = []
+    for jf in sorted(glob.glob(str(Path(rules_dir) / "**" / "*.json"), recursive=True)):
+        with open(jf) as f:
+            data = json.load(f)
+        for s in data.get("scripts", []):
+            scripts.append({"id": s["id"], "category": s.get("category", "UNKNOWN"), "weight": s.get("weight", 1),
+                            "description": s.get("description", ""), "steps": s.get("steps", []),
+                            "keywords": [step_keywords(step) for step in s.get("steps", [])],
+                            "region": Path(jf).relative_to(rules_dir).parts[0]})
+    return scripts
+
+def _need(n, ratio):
+    """Smallest k with k / n >= ratio (the ratio test of scriptMatcher.ts), or None when n is 0."""
+    return next((k for k in range(n + 1) if k / n >= ratio), None) if n else None
+
+def match_scripts(text, scripts):
+    """(script id, steps matched) of every script a text matches — matchScriptPatterns, line for line."""
+    if not isinstance(text, str) or not text.strip():
+        return []
+    normalised = text.lower()
+    matched = []
+    for s in scripts:
+        steps = 0
+        for keywords in s["keywords"]:
+            if keywords and sum(kw in normalised for kw in keywords) / len(keywords) >= STEP_RATIO:
+                steps += 1
+        if s["steps"] and steps / len(s["steps"]) >= SCRIPT_RATIO:
+            matched.append((s["id"], steps))
+    return matched
+
+# ─── Matcher ─────────────────────────────────────────────────────────────────
+
+class ScriptMatcher:
+    """
+    The step keywords of a script list, found through the a-z0-9 runs of a
+    text. codes() gives a bitmask of matched scripts per message;
+    conversation() an incremental matcher for one thread.
+    """
+
+    def __init__(self, scripts):
+        if len(scripts) > MAX_SCRIPTS:
+            raise ValueError(f"{len(scripts)} scripts; script codes hold at most {MAX_SCRIPTS}")
+        self.scripts = scripts
+        self.ids = [s["id"] for s in scripts]
+        self.step_script = []     # flat step -> script index
+        self.step_need = []       # flat step -> keyword hits that match it (None: the step never matches)
+        self.script_need = []     # script -> matched steps that fire it
+        steps_of = {}             # keyword -> {flat step: times listed}
+        for i, s in enumerate(scripts):
+            self.script_need.append(_need(len(s["steps"]), SCRIPT_RATIO))
+            for keywords in s["keywords"]:
+                step = len(self.step_script)
+                self.step_script.append(i)
+                self.step_need.append(_need(len(keywords), STEP_RATIO))
+                for kw in keywords:
+                    listed = steps_of.setdefault(kw, {})
+                    listed[step] = listed.get(step, 0) + 1
+        self.steps_of = {kw: tuple(listed.items()) for kw, listed in steps_of.items()}
+        self.keywords = sorted(self.steps_of)
+        self._in_run = {}
+
+    def _contained(self, run):
+        found = self._in_run.get(run)
+        if found is None:
+            if len(self._in_run) >= MAX_MEMO:
+                self._in_run.clear()
+            found = self._in_run[run] = frozenset(kw for kw in self.keywords if kw in run)
+        return found
+
+    def found(self, text):
+        """Set of step keywords occurring in a text (substring search on its lowercase form)."""
+        hits = set()
+        if isinstance(text, str):
+            for run in set(_RUN.findall(text.lower())):
+                hits |= self._contained(run)
+        return hits
+
+    def conversation(self):
+        return Conversation(self)
+
+    def code(self, text):
+        """Bitmask of the scripts a single text matches (bit i: scripts[i])."""
+        conv = Conversation(self)
+        conv.add(text)
+        return conv.code
+
+    def codes(self, texts):
+        """int64 script code per message, matching each distinct text once."""
+        memo = {}
+        out = np.empty(len(texts), dtype=np.int64)
+        for i, t in enumerate(texts):
+            key = t if isinstance(t, str) else None
+            if key not in memo:
+                memo[key] = self.code(t)
+            out[i] = memo[key]
+        return out
+
+class Conversation:
+    """
+    Match state of one thread: keywords seen, keyword hits per step, matched
+    steps per script and the message each fired script fired on. add() costs
+    the new message's scan plus the steps of keywords not seen before.
+    """
+
+    __slots__ = ("matcher", "seen", "step_hits", "steps_matched", "fired", "messages", "code")
+
+    def __init__(self, matcher):
+        self.matcher = matcher
+        self.seen = set()
+        self.step_hits = [0] * len(matcher.step_script)
+        self.steps_matched = [0] * len(matcher.scripts)
+        self.fired = {}           # script index -> index of the message that fired it
+        self.messages = 0
+        self.code = 0
+
+    def add(self, text, role=None):
+        """Feed the next message; returns the indices of the scripts it fired."""
+        index = self.messages
+        self.messages += 1
+        if role in SKIP_ROLES:
+            return []
+        m = self.matcher
+        fired = []
+        for kw in m.found(text) - self.seen:
+            self.seen.add(kw)
+            for step, times in m.steps_of[kw]:
+                before = self.step_hits[step]
+                self.step_hits[step] = before + times
+                need = m.step_need[step]
+                if before < need <= before + times:
+                    script = m.step_script[step]
+                    self.steps_matched[script] += 1
+                    if self.steps_matched[script] == m.script_need[script]:
+                        self.fired[script] = index
+                        self.code |= 1 << script
+                        fired.append(script)
+        return fired
+
+    def matched(self):
+        """(script id, steps matched) of every fired script, as match_scripts reports the thread."""
+        return [(self.matcher.ids[i], self.steps_matched[i]) for i in sorted(self.fired)]
+
+# ─── Conversations ───────────────────────────────────────────────────────────
+
+def conversation_files():
+    """The built conversation dataset when present, else the repo's template."""
+    return [p for p in CONVERSATION_FILES if p.exists()][:1]
+
+def load_conversations(path):
+    """LabeledConversation list (romance_conversations shape): id, label, messages of {role, text}."""
+    with open(path) as f:
+        data = json.load(f)
+    return data["conversations"] if isinstance(data, dict) else data
+
+def is_scam(conversation):
+    return conversation.get("label", "legit") != "legit"
+
+def script_counts(detected, labels, codes):
+    """
+    For batch_test's counts: "script" = [tp, fp, fn, tn, scams flagged by
+    scripts only, legitimate flagged by scripts only] (detected is the rules'
+    mask) and "script_hits" = per script bit [scam, legitimate] rows fired.
+    """
+    codes = np.asarray(codes, dtype=np.int64)
+    flagged = codes != 0
+    tp, fp, fn, tn = (int((flagged & labels).sum()), int((flagged & ~labels).sum()),
+                      int((~flagged & labels).sum()), int((~flagged & ~labels).sum()))
+    bits = ((codes[:, None] >> np.arange(MAX_SCRIPTS)[None, :]) & 1).astype(bool)
+    per_script = np.stack([bits[labels].sum(axis=0), bits[~labels].sum(axis=0)], axis=1)
+    return {"script": np.array([tp, fp, fn, tn, int((flagged & ~detected & labels).sum()),
+                                int((flagged & ~detected & ~labels).sum())], dtype=np.int64),
+            "script_hits": per_script.astype(np.int64)}
+
+def evaluate_conversations(conversations, matcher, patterns, prefilter=None):
+    """
+    Replay every conversation message by message: the message the rules
+    (any text rule on a single message) and the scripts (incremental thread
+    match) first flag it on, its label and its fired scripts.
+    """
+    from batch_test import text_hit_matrix
+    texts = [m.get("text", "") for c in conversations for m in c["messages"]]
+    hits, _ = text_hit_matrix(texts, patterns, prefilter)
+    flagged = hits.any(axis=1)
+    out, start = [], 0
+    for c in conversations:
+        n = len(c["messages"])
+        rows = flagged[start:start + n]
+        start += n
+        conv = matcher.conversation()
+        for m in c["messages"]:
+            conv.add(m.get("text", ""), m.get("role"))
+        out.append({"id": c.get("id"), "scam": is_scam(c), "messages": n,
+                    "rules_at": int(np.argmax(rows)) if rows.any() else None,
+                    "script_at": min(conv.fired.values()) if conv.fired else None,
+                    "scripts": [matcher.ids[i] for i in sorted(conv.fired)]})
+    return out
+
+def conversation_counts(results, key):
+    """TP/FP/FN/TN over conversations flagged by "rules", "scripts" or "combined", and the mean 1-based message of detection of flagged scams."""
+    def at(r):
+        if key == "combined":
+            marks = [x for x in (r["rules_at"], r["script_at"]) if x is not None]
+            return min(marks) if marks else None
+        return r["rules_at" if key == "rules" else "script_at"]
+    labels = np.array([r["scam"] for r in results], dtype=bool)
+    marks = [at(r) for r in results]
+    detected = np.array([m is not None for m in marks], dtype=bool)
+    found = [m + 1 for m, s in zip(marks, labels) if m is not None and s]
+    return ((int((detected & labels).sum()), int((detected & ~labels).sum()),
+             int((~detected & labels).sum()), int((~detected & ~labels).sum())),
+            sum(found) / len(found) if found else None)
+
+# ─── Throughput ──────────────────────────────────────────────────────────────
+
+def threads_of(texts, size=THREAD_MESSAGES):
+    """Messages cut into threads of size messages, for the replay timing."""
+    texts = [t for t in texts if isinstance(t, str)]
+    return [texts[i:i + size] for i in range(0, len(texts), size)]
+
+def time_scripts(texts, patterns, matcher, prefilter=None, threads=()):
+    """
+    Seconds over texts for the text rules and the scripts on single
+    messages, and over threads (lists of messages) for three ways to keep a
+    thread's match current after every message: match_scripts on the whole
+    thread so far (scriptMatcher.ts), the run lookup on the whole thread,
+    and the incremental Conversation. Threads whose incremental result
+    differs from the scriptMatcher.ts one at any message are counted.
+    """
+    from batch_test import text_hit_matrix
+    texts = [t for t in texts if isinstance(t, str)]
+    t0 = time.perf_counter()
+    text_hit_matrix(texts, patterns, prefilter)
+    rules = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    for t in texts:
+        matcher.code(t)
+    single = time.perf_counter() - t0
+
+    reference, rescan, incremental, mismatched = [], [], [], 0
+    t0 = time.perf_counter()
+    for thread in threads:
+        for k in range(1, len(thread) + 1):
+            reference.append(match_scripts("\n".join(thread[:k]), matcher.scripts))
+    reference_s = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    for thread in threads:
+        for k in range(1, len(thread) + 1):
+            rescan.append(matcher.code("\n".join(thread[:k])))
+    rescan_s = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    for thread in threads:
+        conv = matcher.conversation()
+        for t in thread:
+            conv.add(t)
+            incremental.append(conv.matched())
+    incremental_s = time.perf_counter() - t0
+    start = 0
+    for thread in threads:
+        n = len(thread)
+        mismatched += reference[start:start + n] != incremental[start:start + n]
+        start += n
+    return {"rows": len(texts), "rules": rules, "single": single, "threads": len(threads),
+            "thread_messages": sum(len(t) for t in threads), "reference": reference_s, "rescan": rescan_s,
+            "incremental": incremental_s, "mismatched": mismatched}
+
+# ─── Report ──────────────────────────────────────────────────────────────────
+
+def _pr(tp, fp, fn):
+    return (tp / (tp + fp) if tp + fp else 0.0), (tp / (tp + fn) if tp + fn else 0.0)
+
+def script_section(results, matcher, conversations=None, timing=None):
+    """
+    Markdown lines of the Script Matching section for batch_test results
+    carrying "script" counts, evaluate_conversations() results per source
+    ({name: results}) and time_scripts() timing.
+    """
+    results = [r for r in results if r.get("script") is not None]
+    scripts = matcher.scripts
+    lines = ["\n## Script Matching\n",
+             f"{len(scripts)} scripts from rules/*/scripts.json ({len(matcher.keywords)} distinct step keywords), "
+             f"matched as scriptMatcher.ts does: a step matches when {STEP_RATIO:.0%} of its keywords occur, a "
+             f"script when {SCRIPT_RATIO:.0%} of its steps do, in any order.\n"]
+
+    if results:
+        lines.append("Single messages, next to the text rules:\n")
+        lines.append("| Dataset | Rows | Rules P | Rules R | Scripts TP | Scripts FP | Scripts P | Scripts R | "
+                     "Scams Only Scripts Caught | Legit Only Scripts Flagged | Combined P | Combined R |")
+        lines.append("|---------|------|---------|---------|------------|------------|-----------|-----------|"
+                     "---------------------------|----------------------------|------------|------------|")
+        for r in results:
+            tp, fp, fn, tn, only_tp, only_fp = (int(v) for v in r["script"])
+            p, rc = _pr(tp, fp, fn)
+            cp, crc = _pr(r["tp"] + only_tp, r["fp"] + only_fp, r["fn"] - only_tp)
+            lines.append(f"| {r['name']} | {r['total']:,} | {r['precision']:.3f} | {r['recall']:.3f} | {tp:,} | "
+                         f"{fp:,} | {p:.3f} | {rc:.3f} | {only_tp:,} | {only_fp:,} | {cp:.3f} | {crc:.3f} |")
+        fired = sum(r["script_hits"] for r in results)
+        rows = [(s, int(fired[i, 0]), int(fired[i, 1])) for i, s in enumerate(scripts) if fired[i].any()]
+        if rows:
+            lines.append("\n| Script | Region | Category | Scam Messages | Legit Messages |")
+            lines.append("|--------|--------|----------|---------------|----------------|")
+            for s, scam, legit in sorted(rows, key=lambda x: -(x[1] + x[2])):
+                lines.append(f"| {s['id']} | {s['region']} | {s['category']} | {scam:,} | {legit:,} |")
+        silent = [s["id"] for i, s in enumerate(scripts) if not fired[i].any()]
+        if silent:
+            lines.append(f"\nScripts that fired on no message: {', '.join(silent)}")
+
+    for name, convs in (conversations or {}).items():
+        lines.append(f"\nConversations of {name} ({len(convs):,}, {sum(c['scam'] for c in convs):,} scam), replayed "
+                     "message by message; a conversation is flagged by the first message that completes a script "
+                     "or fires a text rule:\n")
+        lines.append("| Matcher | TP | FP | FN | TN | Precision | Recall | Scams Flagged At Message |")
+        lines.append("|---------|----|----|----|----|-----------|--------|--------------------------|")
+        for key, label in (("rules", "Text rules"), ("scripts", "Scripts"), ("combined", "Combined")):
+            (tp, fp, fn, tn), lag = conversation_counts(convs, key)
+            p, rc = _pr(tp, fp, fn)
+            lines.append(f"| {label} | {tp} | {fp} | {fn} | {tn} | {p:.3f} | {rc:.3f} | "
+                         f"{f'{lag:.1f}' if lag is not None else '—'} |")
+        for c in convs:
+            if c["scripts"]:
+                lines.append(f"- {c['id']} ({'scam' if c['scam'] else 'legit'}): {', '.join(c['scripts'])} "
+                             f"at message {c['script_at'] + 1}")
+
+    if timing is not None and timing["rows"]:
+        t = timing
+        lines.append(f"\nThroughput on {t['rows']:,} messages: text rules {t['rules'] * 1000:,.0f} ms "
+                     f"({t['rows'] / t['rules'] if t['rules'] else 0:,.0f} messages/s), scripts "
+                     f"{t['single'] * 1000:,.0f} ms ({t['rows'] / t['single'] if t['single'] else 0:,.0f} messages/s).")
+        if t["threads"]:
+            lines.append(f"\nKeeping the match current after every message of {t['threads']:,} threads of "
+                         f"{THREAD_MESSAGES} messages ({t['thread_messages']:,} messages):\n")
+            lines.append("| Method | ms | Messages/s | vs scriptMatcher.ts |")
+            lines.append("|--------|----|------------|---------------------|")
+            for key, label in (("reference", "scriptMatcher.ts on the whole thread"),
+                               ("rescan", "Run lookup on the whole thread"),
+                               ("incremental", "Incremental (new message only)")):
+                s = t[key]
+                lines.append(f"| {label} | {s * 1000:,.0f} | {t['thread_messages'] / s if s else 0:,.0f} | "
+                             f"{t['reference'] / s if s else 0:.1f}× |")
+            lines.append(f"\nIncremental results differed from scriptMatcher.ts on {t['mismatched']} of "
+                         f"{t['threads']:,} threads.")
+    return lines
+
+# ─── Main ────────────────────────────────────────────────────────────────────
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay conversations through the script matcher, message by message.")
+    parser.add_argument("conversations", nargs="?", help="LabeledConversation JSON (default: the built dataset "
+                                                         "or data/romance_conversations_template.json)")
+    args = parser.parse_args()
+
+    scripts = load_scripts()
+    matcher = ScriptMatcher(scripts)
+    print(f"{len(scripts)} scripts, {len(matcher.keywords)} step keywords")
+    paths = [Path(args.conversations)] if args.conversations else conversation_files()
+    if not paths:
+        print("  ⚠️ no conversation file found")
+        return 1
+    for c in load_conversations(paths[0]):
+        conv = matcher.conversation()
+        print(f"\n{c.get('id')} ({c.get('label')})")
+        for m in c["messages"]:
+            fired = conv.add(m.get("text", ""), m.get("role"))
+            mark = f"  → {', '.join(matcher.ids[i] for i in fired)}" if fired else ""
+            print(f"  [{m.get('role', '?'):<5}] {m.get('text', '')[:70]}{mark}")
+        for i, steps in enumerate(conv.steps_matched):
+            if steps:
+                print(f"  {matcher.ids[i]}: {steps}/{len(scripts[i]['steps'])} steps")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
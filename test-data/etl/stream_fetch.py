@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+TrustChekr ETL - Streaming, Resumable Downloads
+A feed's body is spooled to a .part file under the state directory while it
+is parsed, with the validators (ETag / Last-Modified) and byte count in a
+JSON state file next to it. The next run for the same URL either:
+
+  - resumes an interrupted download with Range + If-Range, re-reading the
+    bytes already on disk first so parsing starts from the top (a 416 for a
+    part that already holds the whole body counts as complete), or
+  - sends If-None-Match / If-Modified-Since when everything the caller needed
+    was received, and skips the feed on 304 Not Modified.
+
+iter_csv_rows() and iter_json_array() parse CSV rows and top-level JSON array
+elements incrementally from any iterable of byte chunks.
+"""
+
+import os, csv, json, codecs, hashlib
+from pathlib import Path
+
+import requests
+
+CHUNK_SIZE = 64 * 1024
+STATE_DIR = Path(__file__).resolve().parents[1] / ".cache" / "downloads"
+
+# ─── Resumable Download ──────────────────────────────────────────────────────
+
+class ResumableDownload:
+    """
+    One URL's spooled body and validators. Call open() to issue the request,
+    then iterate chunks(); call finish(satisfied=...) once parsing is done.
+    """
+
+    def __init__(self, url, state_dir=STATE_DIR, headers=None, session=None, timeout=60):
+        self.url = url
+        self.headers = dict(headers or {})
+        self.session = session or requests.Session()
+        self.timeout = timeout
+        key = hashlib.sha256(url.encode()).hexdigest()[:16]
+        self.dir = Path(state_dir)
+        self.part = self.dir / f"{key}.part"
+        self.state_path = self.dir / f"{key}.json"
+        self.state = self._load_state()
+        self.resp = None
+        self.status = None
+
+    def _load_state(self):
+        try:
+            with open(self.state_path) as f:
+                state = json.load(f)
+            if state.get("url") == self.url and self.part.exists():
+                state["bytes"] = self.part.stat().st_size  # trust the file over a stale count
+                return state
+        except (OSError, ValueError):
+            pass
+        return {"url": self.url, "etag": None, "last_modified": None, "bytes": 0, "complete": False,
+                "satisfied": None}
+
+    def _save_state(self):
+        self.dir.mkdir(parents=True, exist_ok=True)
+        tmp = self.state_path.with_suffix(f".tmp{os.getpid()}")
+        tmp.write_text(json.dumps(self.state))
+        os.replace(tmp, self.state_path)
+
+    def open(self, need=None):
+        """
+        Issue the request. need describes what the caller wants from the feed
+        (e.g. a row cap); a previous run that was finished with the same need
+        makes this a conditional request. Returns the status: "unchanged"
+        (304, nothing to read from the network), "resumed" or "fresh".
+        """
+        headers = {"Accept-Encoding": "identity", **self.headers}  # byte offsets must be raw body offsets
+        validator = self.state.get("etag") or self.state.get("last_modified")
+        done = self.state["complete"] or (need is not None and self.state.get("satisfied") == need)
+        if validator and done:
+            if self.state.get("etag"):
+                headers["If-None-Match"] = self.state["etag"]
+            if self.state.get("last_modified"):
+                headers["If-Modified-Since"] = self.state["last_modified"]
+        elif validator and self.state["bytes"]:
+            headers["Range"] = f"bytes={self.state['bytes']}-"
+            headers["If-Range"] = validator
+
+        self.resp = self.session.get(self.url, headers=headers, stream=True, timeout=self.timeout)
+        if self.resp.status_code == 416 and "Range" in headers:
+            total = _content_range_total(self.resp.headers.get("Content-Range"))
+            self.resp.close()
+            self.resp = None
+            if total is not None and total == self.state["bytes"]:  # the part already holds the whole body
+                self.state["complete"] = True
+                self.status = "resumed"
+                self._save_state()
+                return self.status
+            self.state.update(etag=None, last_modified=None, bytes=0)
+            return self.open(need)
+        if self.resp.status_code == 304:
+            self.resp.close()
+            self.resp = None
+            self.status = "unchanged"
+            return self.status
+        self.resp.raise_for_status()
+
+        start = _content_range_start(self.resp.headers.get("Content-Range"))
+        if self.resp.status_code == 206 and start == self.state["bytes"]:
+            self.status = "resumed"
+        else:
+            if self.resp.status_code == 206:  # a range we did not ask for: start over
+                self.resp.close()
+                self.state.update(etag=None, last_modified=None, bytes=0)
+                return self.open(need)
+            self.status = "fresh"
+            self.state.update(etag=self.resp.headers.get("ETag"), last_modified=self.resp.headers.get("Last-Modified"),
+                              bytes=0, complete=False, satisfied=None)
+            self.dir.mkdir(parents=True, exist_ok=True)
+            self.part.write_bytes(b"")
+        self._save_state()
+        return self.status
+
+    def chunks(self):
+        """Body bytes from the top: the spooled part first, then the network (appended to the part)."""
+        if self.status in ("resumed", "unchanged") and self.part.exists():
+            with open(self.part, "rb") as f:
+                for block in iter(lambda: f.read(CHUNK_SIZE), b""):
+                    yield block
+        if self.resp is None:
+            return
+        try:
+            with open(self.part, "ab") as out:
+                for block in self.resp.iter_content(CHUNK_SIZE):
+                    out.write(block)
+                    self.state["bytes"] += len(block)
+                    yield block
+                self.state["complete"] = True
+        finally:
+            self.resp.close()
+            self._save_state()
+
+    def finish(self, satisfied=None):
+        """Record that the caller got what it needed (see open), so the next run is conditional."""
+        self.state["satisfied"] = satisfied
+        self._save_state()
+
+def _content_range_start(value):
+    # "bytes 100-199/200"
+    try:
+        return int(value.split()[1].split("-")[0])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+def _content_range_total(value):
+    # "bytes */200" (416) or "bytes 100-199/200"
+    try:
+        return int(value.rsplit("/", 1)[1])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+# ─── Incremental Parsing ─────────────────────────────────────────────────────
+
+def iter_text(chunks, encoding="utf-8"):
+    """Decode byte chunks without splitting multi-byte characters."""
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    for chunk in chunks:
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+def iter_lines(chunks, encoding="utf-8"):
+    """Complete "\n"-terminated lines (endings kept) as they arrive."""
+    pending = ""
+    for text in iter_text(chunks, encoding):
+        lines = (pending + text).split("\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line + "\n"
+    if pending:
+        yield pending
+
+def iter_csv_rows(chunks, encoding="utf-8"):
+    """DictReader rows from byte chunks (quoted fields may span chunks and lines)."""
+    yield from csv.DictReader(iter_lines(chunks, encoding))
+
+def iter_json_array(chunks, encoding="utf-8"):
+    """Elements of a top-level JSON array, decoded one at a time as their bytes arrive."""
+    decoder = json.JSONDecoder()
+    buf = ""
+    pos = 0
+    started = False
+    for text in iter_text(chunks, encoding):
+        buf = buf[pos:] + text
+        pos = 0
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+            if pos >= len(buf):
+                break
+            if not started:
+                if buf[pos] != "[":
+                    raise ValueError("JSON feed is not an array")
+                started = True
+                pos += 1
+                continue
+            if buf[pos] == "]":
+                return
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                break  # element not complete yet
+            if end >= len(buf):
+                break  # a bare number could still continue in the next chunk
+            yield item
+            pos = end
+    raise ValueError("JSON feed ended mid-array")
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+TrustChekr Detection Engine - Weight & Threshold Sweep
+Matches the text datasets against every rule once, keeps the hit matrix
+(cached under SWEEP_DIR, keyed by the datasets and the rule files), then
+scores thousands of candidate rule weightings with matrix operations
+instead of rescanning. Every weighting is evaluated at every trust score
+threshold at once (see scoring.py), and the non-dominated precision/recall
+points form one Pareto front per region pack.
+
+A region pack mirrors getTextPatterns in index.ts: the shared rules plus one
+country's rules, the shared rules alone, or every rule ("all", the default
+country). Only that region's own weights are varied (every weight for
+"all"); the other rules in the pack keep their current weights, so each
+front's suggestions touch one region's rule files.
+
+Usage: python weight_sweep.py [--configs N] [--spread S] [--regions ca,us] [--json FRONT.json]
+"""
+
+import os, sys, json, time, hashlib, argparse
+from pathlib import Path
+
+import numpy as np
+
+from scoring import PENALTY_MAP, DIMINISH_AFTER, DIMINISH, MAX_PENALTY, BASE_SCORE, SCORES, tier_threshold, DEFAULT_TIER
+
+ROOT = Path(__file__).resolve().parents[2]  # trustchekr-app/
+SWEEP_DIR = ROOT / "test-data" / ".cache" / "sweep"
+OUTPUT = ROOT / "test-data" / "WEIGHT-SWEEP-RESULTS.md"
+REGION_PACKS = {"ca": ("shared", "ca"), "us": ("shared", "us"), "mx": ("shared", "mx"), "shared": ("shared",),
+                "all": ("shared", "ca", "us", "mx")}
+CONFIGS = 2000
+SPREAD = 2               # weights vary by up to ± this much (clamped to 1..10)
+BATCH = 256              # weightings scored per matrix product
+SEED = 7
+FRONT_ROWS = 15          # front points listed per region in the report
+PENALTY_TABLE = np.array([0] + [PENALTY_MAP[w] for w in range(1, 11)], dtype=np.float32)
+
+# ─── Hit Matrix ──────────────────────────────────────────────────────────────
+
+class SweepMatrix:
+    """
+    Rows with at least one hit (dense bool, rows × rules) and their labels,
+    plus how many scam / legitimate rows matched nothing. Rows without hits
+    score 100 under any weighting, so only their counts are kept.
+    """
+
+    def __init__(self, hits, labels, idle_scam, idle_legit):
+        self.hits = hits
+        self.labels = labels
+        self.idle_scam = int(idle_scam)
+        self.idle_legit = int(idle_legit)
+
+    @classmethod
+    def from_hits(cls, hits, labels):
+        labels = np.asarray(labels, dtype=bool)
+        active = hits.any(axis=1)
+        return cls(hits[active], labels[active], (labels & ~active).sum(), (~labels & ~active).sum())
+
+    @classmethod
+    def concat(cls, parts):
+        return cls(np.vstack([p.hits for p in parts]), np.concatenate([p.labels for p in parts]),
+                   sum(p.idle_scam for p in parts), sum(p.idle_legit for p in parts))
+
+    def columns(self, cols):
+        """The same rows restricted to some rules (rows left without a hit become idle)."""
+        sub = SweepMatrix.from_hits(self.hits[:, cols], self.labels)
+        sub.idle_scam += self.idle_scam
+        sub.idle_legit += self.idle_legit
+        return sub
+
+    def save(self, path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.stem}.tmp{os.getpid()}.npz")
+        np.savez(tmp, hits=np.packbits(self.hits, axis=1), n_rules=self.hits.shape[1], labels=self.labels,
+                 idle=np.array([self.idle_scam, self.idle_legit]))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as z:
+            hits = np.unpackbits(z["hits"], axis=1, count=int(z["n_rules"])).astype(bool)
+            return cls(hits, z["labels"], *z["idle"])
+
+def matrix_key(datasets, max_rows):
+    from rule_index import rules_hash
+    from result_cache import block_key
+    h = hashlib.sha256(rules_hash().encode())
+    for ds in datasets:
+        h.update(block_key(ds["path"], ds["name"], ds["text_col"], "sample", max_rows).encode())
+    return h.hexdigest()[:24]
+
+def build_matrix(datasets, patterns, prefilter=None):
+    """Match every dataset once (through batch_test's scan) and keep the rows that hit."""
+    import batch_test as bt
+    parts = []
+    for ds in datasets:
+        df = ds["df"]
+        hits, _ = bt.text_hit_matrix(df[ds["text_col"]], patterns, prefilter)
+        parts.append(SweepMatrix.from_hits(hits, df[ds["label_col"]].astype(int).to_numpy() != 0))
+    return SweepMatrix.concat(parts)
+
+# ─── Scoring ─────────────────────────────────────────────────────────────────
+
+def score_batch(matrix, categories, weights, dense=None):
+    """
+    Trust scores (rows × configs) for a batch of weightings (rules × configs
+    of integer weights 1..10), as scoring.ts computes them: the strongest
+    DIMINISH_AFTER signals of a category at full penalty, the rest halved.
+    """
+    hits = matrix.hits
+    penalties = PENALTY_TABLE[weights]
+    total = (dense if dense is not None else hits.astype(np.float32)) @ penalties
+    # Only rows with more than DIMINISH_AFTER hits in a category need the top-k correction
+    for cols in categories:
+        sub = hits[:, cols]
+        crowded = np.flatnonzero(sub.sum(axis=1) > DIMINISH_AFTER)
+        if not len(crowded):
+            continue
+        vals = sub[crowded][:, :, None] * penalties[cols][None]       # rows × rules × configs
+        top = -np.partition(-vals, DIMINISH_AFTER - 1, axis=1)[:, :DIMINISH_AFTER].sum(axis=1)
+        total[crowded] -= (1 - DIMINISH) * (vals.sum(axis=1) - top)
+    penalty = np.minimum(MAX_PENALTY, np.floor(total + 0.5))
+    return np.maximum(0, BASE_SCORE - penalty).astype(np.int64)
+
+def batch_counts(matrix, scores):
+    """TP and FP (configs × thresholds 0..SCORES) flagging scores below each threshold."""
+    k = scores.shape[1]
+    offsets = scores + SCORES * np.arange(k)
+    scam = np.bincount(offsets[matrix.labels].ravel(), minlength=SCORES * k).reshape(k, SCORES)
+    legit = np.bincount(offsets[~matrix.labels].ravel(), minlength=SCORES * k).reshape(k, SCORES)
+    scam[:, BASE_SCORE] += matrix.idle_scam
+    legit[:, BASE_SCORE] += matrix.idle_legit
+    zeros = np.zeros((k, 1), dtype=np.int64)
+    return np.hstack([zeros, np.cumsum(scam, axis=1)]), np.hstack([zeros, np.cumsum(legit, axis=1)])
+
+def sweep(matrix, categories, weights, batch=BATCH):
+    """TP and FP for every weighting (columns of weights) at every threshold."""
+    tp, fp = [], []
+    dense = matrix.hits.astype(np.float32)
+    for i in range(0, weights.shape[1], batch):
+        t, f = batch_counts(matrix, score_batch(matrix, categories, weights[:, i:i + batch], dense))
+        tp.append(t)
+        fp.append(f)
+    return np.vstack(tp), np.vstack(fp)
+
+def random_weights(base, vary, n, spread=SPREAD, seed=SEED):
+    """
+    rules × n integer weightings: column 0 is the current weights, the rest
+    move the rules in vary by up to ±spread.
+    """
+    rng = np.random.default_rng(seed)
+    base = np.clip(np.floor(np.asarray(base, dtype=float) + 0.5), 1, 10).astype(np.int64)
+    weights = np.repeat(base[:, None], n, axis=1)
+    delta = rng.integers(-spread, spread + 1, size=(len(vary), n - 1))
+    weights[vary, 1:] = np.clip(base[vary, None] + delta, 1, 10)
+    return weights
+
+# ─── Pareto Front ────────────────────────────────────────────────────────────
+
+def pareto_front(precision, recall):
+    """Indices of the points no other point beats on both precision and recall, by recall descending."""
+    order = np.lexsort((-precision, -recall))
+    front, best = [], -1.0
+    for i in order:
+        if precision[i] > best:
+            front.append(i)
+            best = precision[i]
+    return np.array(front, dtype=np.int64)
+
+def front_points(tp, fp, pos):
+    """(config, threshold, precision, recall, f1) for every Pareto-optimal point of a sweep."""
+    tp, fp = tp[:, :SCORES].ravel(), fp[:, :SCORES].ravel()   # t = SCORES would flag every message
+    with np.errstate(invalid="ignore", divide="ignore"):
+        precision = np.where(tp + fp > 0, tp / (tp + fp), 0.0)
+    recall = tp / pos if pos else np.zeros(len(tp))
+    points = []
+    for i in pareto_front(precision, recall):
+        if tp[i] == 0:
+            continue
+        p, r = precision[i], recall[i]
+        points.append({"config": int(i // SCORES), "threshold": int(i % SCORES), "precision": float(p),
+                       "recall": float(r), "f1": float(2 * p * r / (p + r)) if p + r else 0.0,
+                       "tp": int(tp[i]), "fp": int(fp[i])})
+    return points
+
+def spread_rows(points, n=FRONT_ROWS):
+    """At most n points, evenly spaced along the front (ends kept)."""
+    if len(points) <= n:
+        return points
+    return [points[int(round(i))] for i in np.linspace(0, len(points) - 1, n)]
+
+# ─── Regions ─────────────────────────────────────────────────────────────────
+
+def sweep_region(matrix, patterns, region, n_configs=CONFIGS, spread=SPREAD, seed=SEED):
+    """Pareto front of one region pack, with the weight changes behind each point."""
+    cols = [j for j, p in enumerate(patterns) if p["region"] in REGION_PACKS[region]]
+    pack = [patterns[j] for j in cols]
+    sub = matrix.columns(cols)
+    by_category = {}
+    for k, p in enumerate(pack):
+        by_category.setdefault(p["category"], []).append(k)
+    categories = [np.array(c) for c in by_category.values()]
+    vary = np.array([k for k, p in enumerate(pack) if region == "all" or p["region"] == region], dtype=np.int64)
+    weights = random_weights([p["weight"] for p in pack], vary, n_configs if len(vary) else 1, spread, seed)
+
+    t0 = time.perf_counter()
+    tp, fp = sweep(sub, categories, weights)
+    elapsed = time.perf_counter() - t0
+    pos = int(sub.labels.sum()) + sub.idle_scam
+    front = front_points(tp, fp, pos)
+    for point in front:
+        w = weights[:, point["config"]]
+        point["weights"] = {pack[k]["id"]: int(w[k]) for k in vary if w[k] != weights[k, 0]}
+    current = {}
+    for label, t in (("any match", BASE_SCORE), (f"{DEFAULT_TIER}+", tier_threshold(DEFAULT_TIER))):
+        p = tp[0, t] / (tp[0, t] + fp[0, t]) if tp[0, t] + fp[0, t] else 0.0
+        current[label] = {"threshold": t, "precision": float(p), "recall": float(tp[0, t] / pos) if pos else 0.0}
+    return {"region": region, "rules": len(pack), "varied": len(vary), "configs": weights.shape[1],
+            "points": weights.shape[1] * SCORES, "seconds": elapsed, "front": front, "current": current}
+
+# ─── Report ──────────────────────────────────────────────────────────────────
+
+def sweep_section(results, rows):
+    lines = ["## Weight & Threshold Sweep\n",
+             f"Hit matrix of {rows:,} messages matched once; each weighting is scored at every trust score "
+             "threshold (flag scores below it) with scoring.ts penalties. Only the region's own rule weights "
+             "vary; \"changes\" counts rules moved from their current weight.\n"]
+    for r in results:
+        lines.append(f"\n### {r['region']} ({r['varied']} of {r['rules']} rules varied)\n")
+        lines.append(f"{r['configs']:,} weightings × {SCORES} thresholds = {r['points']:,} points in "
+                     f"{r['seconds']:.2f}s; {len(r['front'])} on the Pareto front.")
+        for label, c in r["current"].items():
+            lines.append(f"Current weights, {label} (score < {c['threshold']}): "
+                         f"P={c['precision']:.3f} R={c['recall']:.3f}")
+        lines.append("\n| Recall | Precision | F1 | Flag Score Below | Weighting | Changes |")
+        lines.append("|--------|-----------|-----|------------------|-----------|---------|")
+        for p in spread_rows(r["front"]):
+            name = "current" if p["config"] == 0 else f"#{p['config']}"
+            lines.append(f"| {p['recall']:.3f} | {p['precision']:.3f} | {p['f1']:.3f} | {p['threshold']} | "
+                         f"{name} | {len(p['weights'])} |")
+    return lines
+
+# ─── Main ────────────────────────────────────────────────────────────────────
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep rule weights and score thresholds over a cached hit matrix.")
+    parser.add_argument("--configs", type=int, default=CONFIGS, help=f"weightings per region (default: {CONFIGS})")
+    parser.add_argument("--spread", type=int, default=SPREAD, help=f"max weight change per rule (default: {SPREAD})")
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--regions", default=",".join(REGION_PACKS), help="comma-separated region packs")
+    parser.add_argument("--max-rows", type=int, default=None, help="cap rows per dataset (default: batch_test's)")
+    parser.add_argument("--rebuild", action="store_true", help="rematch the datasets even if a cached matrix exists")
+    parser.add_argument("--output", default=str(OUTPUT))
+    parser.add_argument("--json", default=None, metavar="PATH",
+                        help="write every front point with its weight overrides (rule id -> weight)")
+    args = parser.parse_args()
+    regions = [r for r in args.regions.split(",") if r]
+    unknown = [r for r in regions if r not in REGION_PACKS]
+    if unknown:
+        parser.error(f"unknown region(s): {', '.join(unknown)}")
+
+    import batch_test as bt
+    from prefilter import RulePrefilter
+    max_rows = args.max_rows if args.max_rows is not None else bt.MAX_ROWS
+    patterns = bt.load_text_patterns()
+    datasets = bt.load_smishing(max_rows) + bt.load_kaggle_email(max_rows) + bt.load_zenodo(max_rows)
+    if not datasets:
+        print("No text datasets found in downloads/")
+        return 1
+
+    path = SWEEP_DIR / f"{matrix_key(datasets, max_rows)}.npz"
+    rows = sum(len(ds["df"]) for ds in datasets)
+    if path.exists() and not args.rebuild:
+        matrix = SweepMatrix.load(path)
+        print(f"Loaded hit matrix for {rows:,} messages from {path.name}")
+    else:
+        t0 = time.perf_counter()
+        matrix = build_matrix(datasets, patterns, RulePrefilter(patterns))
+        matrix.save(path)
+        print(f"Matched {rows:,} messages against {len(patterns)} rules in {time.perf_counter() - t0:.1f}s")
+    print(f"  {len(matrix.hits):,} messages with at least one hit")
+
+    results = []
+    for region in regions:
+        r = sweep_region(matrix, patterns, region, args.configs, args.spread, args.seed)
+        print(f"  {region:<7} {r['configs']:,} weightings × {SCORES} thresholds in {r['seconds']:.2f}s "
+              f"— {len(r['front'])} front points")
+        results.append(r)
+
+    lines = ["# TrustChekr Detection Engine — Weight Sweep Results",
+             f"\n**Generated:** {time.strftime('%Y-%m-%d %H:%M:%S')}",
+             f"**Engine:** {len(patterns)} text patterns; seed {args.seed}, spread ±{args.spread}\n"]
+    lines += sweep_section(results, rows)
+    Path(args.output).write_text("\n".join(lines) + "\n")
+    print(f"\nReport saved to {args.output}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Front points saved to {args.json}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())